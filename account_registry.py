@@ -0,0 +1,163 @@
+import threading
+from collections import OrderedDict
+
+# No bound by default: accounts are checked round-robin, so any bound below their number misses every time
+DEFAULT_MAX_SESSIONS = None
+
+
+class Account:
+    """A configured Bybit account with its API session, role and per-account settings"""
+
+    # Rules that a sub-account entry in config.json may override
+    SETTING_KEYS = ('profit_percentage', 'min_profit_threshold', 'min_remaining_balance', 'check_interval')
+
+    def __init__(self, account_config, role, registry=None):
+        self.uid = account_config['uid']
+        self.role = role
+        self._registry = registry
+        # Held while the account is being processed so runs never overlap
+        self.lock = threading.Lock()
+        self.config = None
+        self.configure(account_config)
+
+    def configure(self, account_config):
+        """Take credentials and settings from a config entry; returns True if the credentials changed"""
+        changed = self.config is not None and (
+            (account_config['api_key'], account_config['api_secret']) != (self.api_key, self.api_secret))
+        self.config = account_config
+        self.api_key = account_config['api_key']
+        self.api_secret = account_config['api_secret']
+        self.settings = {key: account_config[key] for key in self.SETTING_KEYS if key in account_config}
+        return changed
+
+    @property
+    def session(self):
+        """API session for this account, created on first use"""
+        return self._registry.session(self) if self._registry is not None else None
+
+    @property
+    def is_main(self):
+        return self.role == 'main'
+
+    def setting(self, key, default):
+        """Return a per-account override, falling back to the global value"""
+        return self.settings.get(key, default)
+
+    def __repr__(self):
+        return f"Account(uid={self.uid!r}, role={self.role!r})"
+
+
+class AccountRegistry:
+    """Index of all configured accounts with O(1) lookup by uid and by api_key.
+
+    Built from the 'accounts' section of config.json and brought in line with an edited
+    section by update(). Sessions are not created up front: session_factory is called
+    with an account's config entry the first time its session is needed. If max_sessions
+    is set, at most that many are kept, evicting the least recently used; an evicted
+    session is simply recreated on its next use.
+    """
+
+    def __init__(self, accounts_config, session_factory, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.session_factory = session_factory
+        self.max_sessions = max_sessions
+        self.sessions_created = 0
+        self._sessions = OrderedDict()
+        self._session_lock = threading.Lock()
+        self._by_uid = {}
+        self._by_api_key = {}
+
+        self.main = self._add(Account(accounts_config['main_account'], 'main', self))
+        self.sub_accounts = [
+            self._add(Account(sub_config, 'sub', self))
+            for sub_config in accounts_config['sub_accounts']
+        ]
+
+    def _add(self, account):
+        if account.uid in self._by_uid:
+            raise ValueError(f"Duplicate account uid in config: {account.uid}")
+        if account.api_key in self._by_api_key:
+            raise ValueError(f"Duplicate api_key in config for account {account.uid}")
+        self._by_uid[account.uid] = account
+        self._by_api_key[account.api_key] = account
+        return account
+
+    def update(self, accounts_config):
+        """Apply an edited 'accounts' section and return the (added, removed, changed) sub-accounts.
+
+        The whole section is checked before anything changes, so a bad one leaves the
+        registry as it was. Accounts that stay keep their object, lock and session and
+        just take the new settings; changed ones have new credentials, so their session
+        is dropped and recreated on next use.
+        """
+        entries = [(accounts_config['main_account'], 'main')]
+        entries += [(sub_config, 'sub') for sub_config in accounts_config['sub_accounts']]
+        uids, api_keys = set(), set()
+        for entry, _ in entries:
+            if entry['uid'] in uids:
+                raise ValueError(f"Duplicate account uid in config: {entry['uid']}")
+            if entry['api_key'] in api_keys:
+                raise ValueError(f"Duplicate api_key in config for account {entry['uid']}")
+            uids.add(entry['uid'])
+            api_keys.add(entry['api_key'])
+
+        by_uid, by_api_key = {}, {}
+        added, changed = [], []
+        for entry, role in entries:
+            account = self._by_uid.get(entry['uid'])
+            if account is None or account.role != role:
+                account = Account(entry, role, self)
+                if role == 'sub':
+                    added.append(account)
+            elif account.configure(entry):
+                self._drop_session(account.uid)
+                changed.append(account)
+            by_uid[account.uid] = account
+            by_api_key[account.api_key] = account
+        removed = [account for account in self.sub_accounts if by_uid.get(account.uid) is not account]
+        for account in removed + [self.main]:
+            if by_uid.get(account.uid) is not account:
+                self._drop_session(account.uid)
+
+        # Readers look accounts up without a lock, so every index is swapped in whole
+        self._by_uid = by_uid
+        self._by_api_key = by_api_key
+        self.main = by_uid[accounts_config['main_account']['uid']]
+        self.sub_accounts = [by_uid[sub_config['uid']] for sub_config in accounts_config['sub_accounts']]
+        return added, removed, changed
+
+    def _drop_session(self, uid):
+        with self._session_lock:
+            self._sessions.pop(uid, None)
+
+    def session(self, account):
+        """Return the session for an account, creating it (and evicting the oldest) if needed"""
+        with self._session_lock:
+            session = self._sessions.get(account.uid)
+            if session is not None:
+                self._sessions.move_to_end(account.uid)
+                return session
+
+            session = self.session_factory(account.config)
+            self.sessions_created += 1
+            self._sessions[account.uid] = session
+            if self.max_sessions and len(self._sessions) > self.max_sessions:
+                # In-flight requests keep their own reference, so dropping it here is safe
+                self._sessions.popitem(last=False)
+            return session
+
+    def get(self, uid):
+        """Return the account with this uid, or None if it is not configured"""
+        return self._by_uid.get(uid)
+
+    def by_api_key(self, api_key):
+        """Return the account owning this api_key, or None if it is not configured"""
+        return self._by_api_key.get(api_key)
+
+    def __contains__(self, uid):
+        return uid in self._by_uid
+
+    def __iter__(self):
+        return iter(self._by_uid.values())
+
+    def __len__(self):
+        return len(self._by_uid)
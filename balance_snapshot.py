@@ -0,0 +1,36 @@
+import threading
+
+
+class BalanceSnapshot:
+    """Cycle-scoped cache of wallet balances, keyed by account uid.
+
+    One snapshot lives for a single cycle. The first lookup for an account goes to the
+    exchange, every later lookup in the same cycle is served from memory until the
+    account is invalidated (e.g. after a transfer). api_calls counts the fetches and
+    saved_calls the lookups served from memory.
+    """
+
+    def __init__(self):
+        self._balances = {}
+        self._lock = threading.Lock()
+        self.api_calls = 0
+        self.saved_calls = 0
+
+    def get_balance(self, account_id, fetch):
+        """Return the cached balance for an account, calling fetch() on a miss"""
+        with self._lock:
+            if account_id in self._balances:
+                self.saved_calls += 1
+                return self._balances[account_id]
+
+        value = fetch()
+
+        with self._lock:
+            self.api_calls += 1
+            self._balances[account_id] = value
+        return value
+
+    def invalidate(self, account_id):
+        """Drop everything cached for an account so the next lookup refetches it"""
+        with self._lock:
+            self._balances.pop(account_id, None)
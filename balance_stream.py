@@ -0,0 +1,216 @@
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+
+import websocket
+
+PRIVATE_STREAM_URL = 'wss://stream.bybit.com/v5/private'
+PING_INTERVAL = 20  # Bybit drops private connections without a ping for a while
+RECONNECT_DELAY = 5
+TOPICS = ['wallet', 'position']
+
+logger = logging.getLogger('BybitMover')
+
+
+class AccountStream:
+    """Private WebSocket connection for one account, subscribed to wallet and position topics"""
+
+    def __init__(self, uid, api_key, api_secret, url, on_message, on_disconnect):
+        self.uid = uid
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.url = url
+        self.on_message = on_message
+        self.on_disconnect = on_disconnect
+        self.connected = False
+        self.ws = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"stream-{self.uid}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self.ws is not None:
+            self.ws.close()
+
+    def ping(self):
+        if self.connected:
+            try:
+                self.ws.send(json.dumps({'op': 'ping'}))
+            except Exception as e:
+                logger.warning(f"Stream ping failed for {self.uid}: {str(e)}")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.ws = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error
+            )
+            self.ws.run_forever()
+            self.connected = False
+            self.on_disconnect(self.uid)
+            self._stopped.wait(RECONNECT_DELAY)
+
+    def _on_open(self, ws):
+        expires = int((time.time() + 10) * 1000)
+        signature = hmac.new(
+            self.api_secret.encode('utf-8'),
+            f"GET/realtime{expires}".encode('utf-8'),
+            hashlib.sha256
+        ).hexdigest()
+        ws.send(json.dumps({'op': 'auth', 'args': [self.api_key, expires, signature]}))
+
+    def _on_message(self, ws, raw_message):
+        message = json.loads(raw_message)
+        op = message.get('op')
+        if op == 'auth':
+            if message.get('success'):
+                ws.send(json.dumps({'op': 'subscribe', 'args': TOPICS}))
+            else:
+                logger.error(f"Stream authentication failed for {self.uid}: {message.get('ret_msg')}")
+                ws.close()
+        elif op == 'subscribe':
+            self.connected = bool(message.get('success'))
+            if not self.connected:
+                logger.error(f"Stream subscription failed for {self.uid}: {message.get('ret_msg')}")
+        elif 'topic' in message:
+            self.on_message(self.uid, message['topic'], message.get('data', []))
+
+    def _on_error(self, ws, error):
+        logger.warning(f"Stream error for {self.uid}: {str(error)}")
+
+
+class BalanceStream:
+    """In-memory balance view kept current by Bybit private streams.
+
+    Every wallet or position event for an account (re)starts a debounce timer; once the
+    account has been quiet for debounce_seconds, on_change(uid) is called. Balances are
+    only served while the account's connection is up, so callers fall back to REST
+    before the first wallet event and after a disconnect. If a PositionCache is given,
+    position events are folded into it and a disconnect invalidates the account there.
+    Accounts can be added and removed while the streams run.
+    """
+
+    def __init__(self, accounts, on_change, url=PRIVATE_STREAM_URL, debounce_seconds=2.0, positions=None):
+        self.on_change = on_change
+        self.url = url
+        self.positions = positions
+        self.debounce_seconds = debounce_seconds
+        # {uid: {'total': total wallet balance, 'coins': {coin: wallet balance}}}
+        self.wallets = {}
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._stopped = threading.Event()
+        self.streams = {account.uid: self._account_stream(account) for account in accounts}
+
+    def _account_stream(self, account):
+        return AccountStream(account.uid, account.api_key, account.api_secret, self.url,
+                             self._handle_message, self._handle_disconnect)
+
+    def start(self):
+        for stream in list(self.streams.values()):
+            stream.start()
+        threading.Thread(target=self._heartbeat, name='stream-heartbeat', daemon=True).start()
+
+    def add_accounts(self, accounts):
+        """Open streams for accounts added while running; accounts that already have one keep it"""
+        for account in accounts:
+            with self._lock:
+                if account.uid in self.streams:
+                    continue
+                stream = self._account_stream(account)
+                self.streams[account.uid] = stream
+            stream.start()
+
+    def remove_accounts(self, uids):
+        """Close the streams of accounts that were removed or handed over and forget their balances"""
+        for uid in uids:
+            with self._lock:
+                stream = self.streams.pop(uid, None)
+                self.wallets.pop(uid, None)
+                timer = self._timers.pop(uid, None)
+            if timer is not None:
+                timer.cancel()
+            if stream is not None:
+                stream.stop()
+
+    def stop(self):
+        self._stopped.set()
+        for stream in list(self.streams.values()):
+            stream.stop()
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+
+    def get_balance(self, uid):
+        """Return the streamed wallet balance for an account, or None if it is not known"""
+        wallet = self.get_wallet(uid)
+        return wallet['total'] if wallet is not None else None
+
+    def get_wallet(self, uid):
+        """Return the streamed total and per-coin balances for an account, or None if not known"""
+        with self._lock:
+            return self.wallets.get(uid)
+
+    def _heartbeat(self):
+        while not self._stopped.wait(PING_INTERVAL):
+            for stream in list(self.streams.values()):
+                stream.ping()
+
+    def _handle_message(self, uid, topic, data):
+        changed = False
+        if topic == 'wallet':
+            for wallet in data:
+                if wallet.get('accountType') != 'UNIFIED':
+                    continue
+                balances = {
+                    'total': float(wallet['totalWalletBalance']),
+                    'coins': {coin['coin']: float(coin['walletBalance'] or 0) for coin in wallet.get('coin', [])}
+                }
+                with self._lock:
+                    changed = self.wallets.get(uid) != balances
+                    self.wallets[uid] = balances
+        elif topic == 'position':
+            changed = bool(data)
+            if changed and self.positions is not None:
+                self.positions.apply_update(uid, data)
+
+        if changed:
+            self._schedule(uid)
+
+    def _handle_disconnect(self, uid):
+        # The view can no longer be trusted for this account
+        with self._lock:
+            self.wallets.pop(uid, None)
+        if self.positions is not None:
+            self.positions.invalidate(uid)
+
+    def _schedule(self, uid):
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            timer = self._timers.get(uid)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(self.debounce_seconds, self._fire, args=(uid,))
+            timer.daemon = True
+            self._timers[uid] = timer
+            timer.start()
+
+    def _fire(self, uid):
+        with self._lock:
+            if self._timers.get(uid) is threading.current_thread():
+                del self._timers[uid]
+        try:
+            self.on_change(uid)
+        except Exception:
+            logger.exception(f"Error handling stream update for {uid}")
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Bybit v5 REST endpoints used by BybitMover.
+
+Serves wallet balance, position list, universal transfer, transfer records and spot
+tickers with configurable latency and error rates. Each api_key gets its own balance,
+which drifts upwards by DEFAULT_DRIFT USDT per wallet request, twice the benchmark's
+min_profit_threshold, so an account is swept on every check. Signatures
+are not checked. GET /__stats returns request counts per endpoint and POST /__reset clears them.
+
+Run standalone with:
+    python benchmarks/fake_bybit.py --port 8999 --latency-ms 50 --error-rate 0.01
+and set "api_endpoint": "http://127.0.0.1:8999" in config.json.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WALLET_BALANCE = '/v5/account/wallet-balance'
+POSITION_LIST = '/v5/position/list'
+UNIVERSAL_TRANSFER = '/v5/asset/transfer/universal-transfer'
+TRANSFER_RECORDS = '/v5/asset/transfer/query-universal-transfer-list'
+TICKERS = '/v5/market/tickers'
+# Mean balance change per wallet request; a lower drift makes sweeps rarer
+DEFAULT_DRIFT = 10.0
+# Spot prices served by the tickers endpoint
+SPOT_PRICES = {'BTC': 60000.0, 'ETH': 3000.0, 'USDC': 1.0}
+
+ENDPOINT_NAMES = {
+    WALLET_BALANCE: 'wallet',
+    POSITION_LIST: 'position',
+    UNIVERSAL_TRANSFER: 'transfer',
+    TRANSFER_RECORDS: 'transfer_records',
+    TICKERS: 'tickers',
+}
+
+
+class FakeBybitState:
+    """Balances, transfers and request counters shared by all handler threads"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, server_error_rate=0.0,
+                 initial_balance=1000.0, drift=DEFAULT_DRIFT, volatility=2.0, position_ratio=0.3, positions=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.server_error_rate = server_error_rate
+        self.initial_balance = initial_balance
+        self.drift = drift
+        self.volatility = volatility
+        self.position_ratio = position_ratio
+        self.position_count = positions
+        self.random = random.Random(seed)
+        self.balances = {}
+        self.transfers = {}
+        self.requests = Counter()
+        self.errors = Counter()
+        self.lock = threading.Lock()
+
+    def delay(self):
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def injected_error(self):
+        """Return 'server', 'rate_limit' or None for the current request"""
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.server_error_rate:
+            return 'server'
+        if roll < self.server_error_rate + self.error_rate:
+            return 'rate_limit'
+        return None
+
+    def wallet_balance(self, api_key):
+        with self.lock:
+            balance = self.balances.get(api_key, self.initial_balance)
+            balance += self.random.gauss(self.drift, self.volatility)
+            self.balances[api_key] = balance
+        return {'list': [{
+            'accountType': 'UNIFIED',
+            'totalWalletBalance': f"{balance:.8f}",
+            'coin': [{'coin': 'USDT', 'walletBalance': f"{balance:.8f}"}]
+        }]}
+
+    def positions(self, api_key, query):
+        # position_ratio of the balance, spread over position_count positions and paged like the real API
+        with self.lock:
+            balance = self.balances.get(api_key, self.initial_balance)
+        limit = int(query.get('limit') or 20)
+        start = int(query.get('cursor') or 0)
+        end = min(start + limit, self.position_count)
+        value = balance * self.position_ratio / self.position_count
+        return {'category': 'linear', 'list': [{
+            'symbol': 'BTCUSDT' if index == 0 else f"COIN{index}USDT",
+            'side': 'Buy',
+            'size': '1',
+            'positionIdx': 0,
+            'positionValue': f"{value:.8f}"
+        } for index in range(start, end)], 'nextPageCursor': str(end) if end < self.position_count else ''}
+
+    def transfer(self, api_key, body):
+        transfer_id = body.get('transferId') or str(uuid.uuid4())
+        amount = float(body['amount'])
+        with self.lock:
+            if transfer_id not in self.transfers:
+                self.balances[api_key] = self.balances.get(api_key, self.initial_balance) - amount
+                self.transfers[transfer_id] = {
+                    'transferId': transfer_id, 'coin': body.get('coin', 'USDT'), 'amount': body['amount'],
+                    'fromMemberId': body.get('fromMemberId'), 'toMemberId': body.get('toMemberId'),
+                    'status': 'SUCCESS', 'timestamp': str(int(time.time() * 1000))
+                }
+        return {'transferId': transfer_id, 'status': 'SUCCESS'}
+
+    def transfer_records(self, query):
+        transfer_id = query.get('transferId')
+        with self.lock:
+            if transfer_id:
+                records = [self.transfers[transfer_id]] if transfer_id in self.transfers else []
+            else:
+                records = list(self.transfers.values())
+        return {'list': records, 'nextPageCursor': ''}
+
+    def tickers(self):
+        return {'category': 'spot', 'list': [
+            {'symbol': f"{coin}USDT", 'lastPrice': f"{price:.8f}"} for coin, price in SPOT_PRICES.items()
+        ]}
+
+    def stats(self):
+        with self.lock:
+            return {'requests': dict(self.requests), 'errors': dict(self.errors),
+                    'transfers': len(self.transfers)}
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests.clear()
+            self.errors.clear()
+
+
+class FakeBybitHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method):
+        state = self.server.state
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+        if url.path == '/__stats':
+            return self.send_json(state.stats())
+        if url.path == '/__reset':
+            state.reset_stats()
+            return self.send_json({'ok': True})
+
+        endpoint = ENDPOINT_NAMES.get(url.path)
+        if endpoint is None:
+            return self.send_json({'retCode': 10001, 'retMsg': f"Unknown path {url.path}", 'result': {}})
+
+        api_key = self.headers.get('X-BAPI-API-KEY', '')
+        with state.lock:
+            state.requests[endpoint] += 1
+        state.delay()
+
+        error = state.injected_error()
+        if error is not None:
+            with state.lock:
+                state.errors[endpoint] += 1
+            if error == 'server':
+                return self.send_json({'retCode': -1, 'retMsg': 'Service unavailable'}, status=503)
+            return self.send_json({'retCode': 10006, 'retMsg': 'Too many visits!', 'result': {}},
+                                  headers={'X-Bapi-Limit-Reset-Timestamp': str(int(time.time() * 1000))})
+
+        if url.path == WALLET_BALANCE:
+            result = state.wallet_balance(api_key)
+        elif url.path == POSITION_LIST:
+            result = state.positions(api_key, query)
+        elif url.path == UNIVERSAL_TRANSFER and method == 'POST':
+            result = state.transfer(api_key, body)
+        elif url.path == TICKERS:
+            result = state.tickers()
+        else:
+            result = state.transfer_records(query)
+        self.send_json({'retCode': 0, 'retMsg': 'OK', 'result': result, 'retExtInfo': {},
+                        'time': int(time.time() * 1000)})
+
+    def send_json(self, payload, status=200, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBybitServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host='127.0.0.1', port=0, **state_options):
+        super().__init__((host, port), FakeBybitHandler)
+        self.state = FakeBybitState(**state_options)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve(host, port, ready=None, **state_options):
+    """Run a server until the process is stopped; ready (a multiprocessing queue) receives its URL"""
+    server = FakeBybitServer(host, port, **state_options)
+    if ready is not None:
+        ready.put(server.url)
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Bybit v5 REST API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8999)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Fixed delay added to every request')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Extra random delay up to this much')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction answered with retCode 10006')
+    parser.add_argument('--server-error-rate', type=float, default=0.0, help='Fraction answered with HTTP 503')
+    parser.add_argument('--positions', type=int, default=1, help='Open positions per account')
+    parser.add_argument('--drift', type=float, default=DEFAULT_DRIFT, help='Mean balance change per wallet request')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    server = FakeBybitServer(
+        args.host, args.port,
+        latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate, server_error_rate=args.server_error_rate,
+        positions=args.positions, drift=args.drift, seed=args.seed
+    )
+    print(f"Fake Bybit API listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
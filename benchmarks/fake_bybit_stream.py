@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Bybit v5 private WebSocket stream used by BybitMover.
+
+Speaks just enough of the WebSocket protocol for websocket-client: the upgrade
+handshake, text, ping and close frames. Clients authenticate with the same
+{"op": "auth"} request as on Bybit, signed with the api_secret known for their
+api_key, then subscribe to topics. push_wallet() and push_positions() send topic
+messages to the subscribed connections of an api_key and disconnect() drops them,
+so tests can drive auth, debounced updates and reconnects.
+
+Run standalone with:
+    python benchmarks/fake_bybit_stream.py --port 8998 --config config.json --interval 5
+and set "streaming": {"enabled": true, "url": "ws://127.0.0.1:8998/v5/private"} in config.json.
+Every interval it pushes a drifting wallet balance to each subscribed account.
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import Counter
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class StreamConnection:
+    """One client connection; frames can be sent to it from any thread"""
+
+    def __init__(self, request, rfile):
+        self.request = request
+        self.rfile = rfile
+        self.api_key = None
+        self.topics = set()
+        self._send_lock = threading.Lock()
+
+    def read_frame(self):
+        """Return (opcode, payload) of the next frame, or (None, None) once the connection is closed"""
+        header = self.rfile.read(2)
+        if len(header) < 2:
+            return None, None
+        opcode = header[0] & 0x0F
+        masked = header[1] & 0x80
+        length = header[1] & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self.rfile.read(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self.rfile.read(8))[0]
+        mask = self.rfile.read(4) if masked else None
+        payload = self.rfile.read(length)
+        if mask:
+            payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+        return opcode, payload
+
+    def send_frame(self, opcode, payload=b''):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        with self._send_lock:
+            self.request.sendall(header + payload)
+
+    def send_json(self, message):
+        self.send_frame(OP_TEXT, json.dumps(message).encode('utf-8'))
+
+    def close(self):
+        try:
+            self.send_frame(OP_CLOSE)
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class FakeStreamState:
+    """Known api secrets, live connections and counters shared by all handler threads"""
+
+    def __init__(self, secrets):
+        self.secrets = dict(secrets)
+        self.connections = set()
+        self.connects = Counter()
+        self.auth_failures = Counter()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def authenticate(self, connection, args):
+        """Check an auth request like Bybit does: HMAC-SHA256 of 'GET/realtime' + expires"""
+        api_key, expires, signature = args
+        secret = self.secrets.get(api_key)
+        expected = None
+        if secret is not None:
+            expected = hmac.new(secret.encode('utf-8'), f"GET/realtime{expires}".encode('utf-8'),
+                                hashlib.sha256).hexdigest()
+        if expected is None or not hmac.compare_digest(expected, signature) or int(expires) < time.time() * 1000:
+            with self.lock:
+                self.auth_failures[api_key] += 1
+            return False
+        with self.changed:
+            connection.api_key = api_key
+            self.connects[api_key] += 1
+            self.changed.notify_all()
+        return True
+
+    def subscribe(self, connection, topics):
+        with self.changed:
+            connection.topics.update(topics)
+            self.changed.notify_all()
+
+    def subscribed(self, api_key, topic='wallet'):
+        """Return the connections of an api_key subscribed to a topic"""
+        with self.lock:
+            return [connection for connection in self.connections
+                    if connection.api_key == api_key and topic in connection.topics]
+
+    def wait_subscribed(self, api_key, connects=1, timeout=5.0):
+        """Wait until an api_key has connected this many times and is subscribed; returns True if it did"""
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while True:
+                if self.connects[api_key] >= connects and any(
+                        connection.api_key == api_key and connection.topics for connection in self.connections):
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.changed.wait(remaining)
+
+    def push(self, api_key, topic, data):
+        """Send a topic message to the subscribed connections of an api_key; returns how many got it"""
+        connections = self.subscribed(api_key, topic)
+        message = {'id': f"{topic}-{time.time_ns()}", 'topic': topic, 'creationTime': int(time.time() * 1000),
+                   'data': data}
+        for connection in connections:
+            connection.send_json(message)
+        return len(connections)
+
+    def push_wallet(self, api_key, total, coins=None):
+        """Push a UNIFIED wallet update; coins is {coin: balance}, by default all of it in USDT"""
+        coins = coins if coins is not None else {'USDT': total}
+        return self.push(api_key, 'wallet', [{
+            'accountType': 'UNIFIED',
+            'totalWalletBalance': str(total),
+            'coin': [{'coin': coin, 'walletBalance': str(balance)} for coin, balance in coins.items()]
+        }])
+
+    def push_positions(self, api_key, positions):
+        return self.push(api_key, 'position', positions)
+
+    def disconnect(self, api_key):
+        """Drop every connection of an api_key, as the exchange does on a network failure"""
+        with self.lock:
+            connections = [connection for connection in self.connections if connection.api_key == api_key]
+        for connection in connections:
+            connection.close()
+        return len(connections)
+
+
+class FakeStreamHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        if not self.handshake():
+            return
+        state = self.server.state
+        connection = StreamConnection(self.request, self.rfile)
+        with state.changed:
+            state.connections.add(connection)
+            state.changed.notify_all()
+        try:
+            while True:
+                opcode, payload = connection.read_frame()
+                if opcode is None or opcode == OP_CLOSE:
+                    break
+                if opcode == OP_PING:
+                    connection.send_frame(OP_PONG, payload)
+                elif opcode == OP_TEXT:
+                    self.handle_message(connection, json.loads(payload))
+        except OSError:
+            pass
+        finally:
+            with state.changed:
+                state.connections.discard(connection)
+                state.changed.notify_all()
+
+    def handshake(self):
+        self.rfile.readline()  # Request line; every path is the private stream
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        if key is None:
+            self.wfile.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+        self.wfile.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                          f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode('ascii'))
+        return True
+
+    def handle_message(self, connection, message):
+        state = self.server.state
+        op = message.get('op')
+        if op == 'auth':
+            success = state.authenticate(connection, message.get('args', []))
+            connection.send_json({'op': 'auth', 'success': success, 'ret_msg': '' if success else 'Invalid sign'})
+        elif op == 'subscribe':
+            if connection.api_key is None:
+                connection.send_json({'op': 'subscribe', 'success': False, 'ret_msg': 'Request not authorized'})
+                return
+            state.subscribe(connection, message.get('args', []))
+            connection.send_json({'op': 'subscribe', 'success': True, 'ret_msg': ''})
+        elif op == 'ping':
+            connection.send_json({'op': 'pong', 'success': True})
+
+
+class FakeBybitStreamServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, secrets, host='127.0.0.1', port=0):
+        super().__init__((host, port), FakeStreamHandler)
+        self.state = FakeStreamState(secrets)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"ws://{host}:{port}/v5/private"
+
+    def start(self):
+        """Serve on a background thread"""
+        threading.Thread(target=self.serve_forever, name='fake-bybit-stream', daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        with self.state.lock:
+            connections = list(self.state.connections)
+        for connection in connections:
+            connection.close()
+
+
+def load_secrets(config_path):
+    """Return {api_key: api_secret} of every account in a mover config"""
+    with open(config_path, 'r') as f:
+        accounts = json.load(f)['accounts']
+    return {account['api_key']: account['api_secret']
+            for account in [accounts['main_account']] + accounts['sub_accounts']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Bybit v5 private WebSocket stream')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8998)
+    parser.add_argument('--config', default='config.json', help='Mover config whose api keys and secrets are accepted')
+    parser.add_argument('--interval', type=float, default=5.0, help='Seconds between pushed wallet updates')
+    parser.add_argument('--initial-balance', type=float, default=1000.0)
+    args = parser.parse_args()
+
+    server = FakeBybitStreamServer(load_secrets(args.config), args.host, args.port)
+    server.start()
+    print(f"Fake Bybit private stream listening on {server.url}")
+    balances = {}
+    try:
+        while True:
+            time.sleep(args.interval)
+            for api_key in server.state.secrets:
+                balance = balances.get(api_key, args.initial_balance) + random.uniform(-1, 3)
+                balances[api_key] = balance
+                server.state.push_wallet(api_key, round(balance, 2))
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
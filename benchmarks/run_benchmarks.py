@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Benchmark BybitMover.process_profits against a local fake Bybit API.
+
+For each account count a fresh mover is started in a scratch directory with its own
+config, state store and journal. Startup is measured until every initial balance has
+been fetched, then a number of check cycles are timed. API calls are counted by the
+fake server, memory is measured with tracemalloc over startup and one extra cycle.
+
+Results are written as JSON so runs from different versions can be compared:
+    python benchmarks/run_benchmarks.py --accounts 1 10 100 --output before.json
+    python benchmarks/run_benchmarks.py --accounts 1 10 100 --output after.json --compare before.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from fake_bybit import DEFAULT_DRIFT, serve
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ACCOUNT_COUNTS = [1, 10, 100, 1000]
+# Metrics checked by --compare; higher is worse for all of them
+COMPARED_METRICS = ('startup_seconds', 'cycle_p50_seconds', 'cycle_p95_seconds', 'api_calls_per_cycle',
+                    'memory_peak_bytes')
+
+
+def build_config(accounts, api_endpoint, workers, rate_limits):
+    """Return a mover config with a main account and the given number of sub-accounts"""
+    return {
+        'check_interval': '5m',
+        'profit_percentage': 50,
+        'min_profit_threshold': 5,
+        'min_remaining_balance': 50,
+        'margin_check': {'enabled': True, 'max_margin_used_percent': 80},
+        'concurrency': {'enabled': workers > 1, 'max_workers': workers},
+        'rate_limits': rate_limits,
+        'api_endpoint': api_endpoint,
+        # Cases run one after another in this process, so no case may hold the ingest port or watch its config
+        'ingest': {'enabled': False},
+        'config_reload': {'enabled': False},
+        'accounts': {
+            'main_account': {'uid': 'main', 'api_key': 'main_key', 'api_secret': 'main_secret'},
+            'sub_accounts': [
+                {'uid': f"sub_{i}", 'api_key': f"sub_key_{i}", 'api_secret': f"sub_secret_{i}"}
+                for i in range(accounts)
+            ]
+        }
+    }
+
+
+def server_stats(url, reset=False):
+    request = urllib.request.Request(url + ('/__reset' if reset else '/__stats'), method='POST' if reset else 'GET')
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_case(accounts, args, api_url, workdir):
+    """Benchmark one account count and return its result dict"""
+    from bybit_mover import BybitMover
+
+    casedir = os.path.join(workdir, f"accounts_{accounts}")
+    os.makedirs(casedir)
+    os.chdir(casedir)
+    rate_limits = {'ip_requests_per_second': args.ip_limit, 'max_retries': 4}
+    with open('config.json', 'w') as f:
+        json.dump(build_config(accounts, api_url, args.workers, rate_limits), f)
+
+    server_stats(api_url, reset=True)
+    tracemalloc.start()
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        mover = BybitMover('config.json')
+        mover.balances_ready.wait()
+        startup_seconds = time.perf_counter() - started
+        startup_calls = sum(server_stats(api_url)['requests'].values())
+
+        # Memory: startup plus one full cycle, while every session is still alive
+        mover.process_profits()
+        memory_current, memory_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        server_stats(api_url, reset=True)
+        cycle_seconds = []
+        for _ in range(args.cycles):
+            cycle_started = time.perf_counter()
+            mover.process_profits()
+            cycle_seconds.append(time.perf_counter() - cycle_started)
+        stats = server_stats(api_url)
+
+    if mover.config_watcher is not None:
+        mover.config_watcher.stop()
+    if mover.ingest_server is not None:
+        mover.ingest_server.stop()
+    if mover.executor is not None:
+        mover.executor.shutdown(wait=True)
+    mover.history_writer.stop()
+    mover.journal.close()
+    mover.state.close()
+
+    calls_per_endpoint = {endpoint: count / args.cycles for endpoint, count in stats['requests'].items()}
+    return {
+        'accounts': accounts,
+        'startup_seconds': startup_seconds,
+        'startup_api_calls': startup_calls,
+        'cycle_seconds': cycle_seconds,
+        'cycle_mean_seconds': statistics.mean(cycle_seconds),
+        'cycle_p50_seconds': percentile(cycle_seconds, 0.5),
+        'cycle_p95_seconds': percentile(cycle_seconds, 0.95),
+        'cycle_max_seconds': max(cycle_seconds),
+        'api_calls_per_cycle': sum(calls_per_endpoint.values()),
+        'api_calls_per_endpoint': calls_per_endpoint,
+        'injected_errors': stats['errors'],
+        'transfers': stats['transfers'],
+        'sessions_created': mover.accounts.sessions_created,
+        'memory_peak_bytes': memory_peak,
+        'memory_retained_bytes': memory_current,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current, threshold):
+    """Print metric changes against a previous run; returns True if any metric regressed past threshold"""
+    previous_cases = {case['accounts']: case for case in previous['results']}
+    regressed = False
+    print(f"\nComparison with {previous.get('revision') or 'previous run'} ({previous.get('timestamp')}):")
+    print(f"{'accounts':>8} {'metric':<22} {'before':>14} {'after':>14} {'change':>9}")
+    for case in current['results']:
+        before = previous_cases.get(case['accounts'])
+        if before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = before.get(metric), case.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressed = True
+            print(f"{case['accounts']:>8} {metric:<22} {old:>14.4f} {new:>14.4f} {change:>+8.1f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark BybitMover against a local fake Bybit API')
+    parser.add_argument('--accounts', type=int, nargs='+', default=DEFAULT_ACCOUNT_COUNTS,
+                        help='Sub-account counts to benchmark')
+    parser.add_argument('--cycles', type=int, default=3, help='Timed check cycles per account count')
+    parser.add_argument('--workers', type=int, default=1, help='concurrency.max_workers (1 = sequential)')
+    parser.add_argument('--ip-limit', type=float, default=100, help='rate_limits.ip_requests_per_second')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Fake server latency per request')
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help='Extra random latency up to this much')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests rate-limited')
+    parser.add_argument('--server-error-rate', type=float, default=0.0, help='Fraction of requests failing with 503')
+    parser.add_argument('--drift', type=float, default=DEFAULT_DRIFT,
+                        help='Mean balance change per wallet request; the default sweeps every account on every cycle')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help='Exit with status 1 if a compared metric grows by more than this percentage')
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    # The server runs in its own process so its threads do not skew timing or memory
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=('127.0.0.1', 0, ready), kwargs={
+        'latency': args.latency_ms / 1000, 'jitter': args.jitter_ms / 1000, 'error_rate': args.error_rate,
+        'server_error_rate': args.server_error_rate, 'drift': args.drift, 'seed': args.seed
+    }, daemon=True)
+    server.start()
+    api_url = ready.get(timeout=10)
+
+    sys.path.insert(0, REPO_ROOT)
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bybit_mover_bench_') as workdir:
+        # bybit_mover creates logs/ in the working directory on import
+        os.chdir(workdir)
+        import bybit_mover
+        # Injected errors are expected here, only report real failures
+        bybit_mover.logger.setLevel(logging.ERROR)
+        try:
+            for accounts in args.accounts:
+                print(f"Benchmarking {accounts} accounts...", flush=True)
+                case = run_case(accounts, args, api_url, workdir)
+                results.append(case)
+                print(f"  startup {case['startup_seconds']:.2f}s, cycle p50 {case['cycle_p50_seconds']:.3f}s "
+                      f"p95 {case['cycle_p95_seconds']:.3f}s, {case['api_calls_per_cycle']:.0f} API calls/cycle, "
+                      f"{case['transfers']} transfers, "
+                      f"peak memory {case['memory_peak_bytes'] / 1024 / 1024:.1f} MiB")
+        finally:
+            os.chdir(REPO_ROOT)
+            server.terminate()
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'cycles': args.cycles, 'workers': args.workers, 'ip_limit': args.ip_limit,
+            'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms,
+            'error_rate': args.error_rate, 'server_error_rate': args.server_error_rate, 'drift': args.drift,
+            'seed': args.seed
+        },
+        'results': results,
+    }
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    if compare_path:
+        with open(compare_path) as f:
+            previous = json.load(f)
+        if previous.get('settings') != report['settings']:
+            print("Warning: settings differ from the compared run, results may not be comparable")
+        if compare(previous, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
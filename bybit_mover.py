@@ -1,19 +1,37 @@
 #!/usr/bin/env python3
+import atexit
 import json
+import math
 import time
 import re
-import schedule
 from datetime import datetime, timedelta
 from pybit.unified_trading import HTTP
 from cryptography.fernet import Fernet
 import os
 from dotenv import load_dotenv
-from web_interface import add_transfer
+from balance_snapshot import BalanceSnapshot
+from account_registry import AccountRegistry, DEFAULT_MAX_SESSIONS
+from transfer_journal import TransferJournal, HISTORY_FILE, shard_history_file, shard_history_files
+from history_segments import SegmentStore, SEGMENT_DIR, month_key
+from history_writer import HistoryWriter, IngestServer, DEFAULT_INGEST_PORT
+from balance_stream import BalanceStream, PRIVATE_STREAM_URL
+from request_gateway import RequestGateway
+from state_store import StateStore, STATE_FILE
+from metrics import REGISTRY, MetricsServer
+from scheduler import AccountScheduler, CheckLock
+from sharding import ShardCoordinator, SHARD_STORE, DEFAULT_HEARTBEAT, DEFAULT_LEASE
+from price_cache import PriceCache, DEFAULT_PRICE_TTL, QUOTE_COIN, parse_spot_tickers
+from position_cache import PositionCache, DEFAULT_POSITION_TTL
+from config_reload import ConfigWatcher, DEFAULT_POLL_SECONDS, restart_required
 import random
 import uuid
 import sys
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from logging.handlers import RotatingFileHandler
+from structured_log import (BalanceSampler, JsonFormatter, TextFormatter, DEFAULT_BALANCE_SAMPLE_EVERY,
+                            log_context, start_queue_logging)
 
 # Set up logging
 def setup_logging():
@@ -28,134 +46,484 @@ def setup_logging():
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
-    console_format = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    console_handler.setFormatter(console_format)
+    console_handler.setFormatter(TextFormatter())
     
-    # File handler with rotation
+    # File handler with rotation, one JSON event per line
     file_handler = RotatingFileHandler(
         'logs/bybit_mover.log',
         maxBytes=1024 * 1024,  # 1MB
         backupCount=5
     )
     file_handler.setLevel(logging.DEBUG)
-    file_format = logging.Formatter('%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s')
-    file_handler.setFormatter(file_format)
+    file_handler.setFormatter(JsonFormatter())
     
-    # Add handlers
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # Handlers run on a background thread, so a slow disk or terminal never stalls a sweep
+    listener = start_queue_logging(logger, [console_handler, file_handler])
+    atexit.register(listener.stop)
     
-    return logger
+    return logger, console_handler
 
 # Initialize logger
-logger = setup_logging()
+logger, console_handler = setup_logging()
+
+# Parallel balance fetches at startup when the concurrency pool is disabled
+STARTUP_WORKERS = 8
+# Decimal places of non-USDT transfer amounts
+COIN_DECIMALS = 8
+# Positions per page of the position list (the API maximum), and the most pages followed per account
+POSITION_PAGE_LIMIT = 200
+MAX_POSITION_PAGES = 50
+# retCodes that mean a transfer was refused and never applied: bad parameters or key, missing permission,
+# insufficient balance. Anything else (server errors, exhausted retries, a duplicate transferId) leaves the
+# outcome unknown, and the transfer is looked up in the transfer records before the account is swept again.
+REJECTED_TRANSFER_CODES = {10001, 10003, 10004, 10005, 10010, 131203, 131206, 131210, 131211, 131212, 131215,
+                           131227}
+# Transfer records are searched from a little before an unconfirmed transfer was sent, allowing for clock skew
+TRANSFER_LOOKUP_MARGIN = timedelta(minutes=5)
+# A transfer missing from the records only counts as never applied once it has had this long to show up
+TRANSFER_NOT_FOUND_GRACE = timedelta(minutes=10)
+# Settings every config must have
+REQUIRED_SETTINGS = ('check_interval', 'profit_percentage', 'min_profit_threshold', 'accounts')
+
+# With the concurrency pool every due account is checked as its own batch, so these measure batches of
+# due checks rather than passes over every account
+BATCH_DURATION = REGISTRY.histogram(
+    'bybit_mover_batch_duration_seconds', 'Duration of one batch of due account checks',
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+BATCH_ACCOUNTS = REGISTRY.histogram(
+    'bybit_mover_batch_accounts', 'Accounts per batch of due checks',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 1000))
+CHECK_OVERRUNS = REGISTRY.counter(
+    'bybit_mover_check_overruns_total', 'Account checks that took longer than their slot in the schedule')
+LAST_BATCH = REGISTRY.gauge(
+    'bybit_mover_last_batch_timestamp_seconds', 'Unix time at which the last batch of checks finished')
+ACCOUNTS = REGISTRY.gauge('bybit_mover_accounts', 'Configured sub-accounts')
+OWNED_ACCOUNTS = REGISTRY.gauge('bybit_mover_owned_accounts', 'Sub-accounts checked by this process')
+TRANSFERS_ATTEMPTED = REGISTRY.counter('bybit_mover_transfers_attempted_total', 'Profit transfers attempted')
+TRANSFERS_SUCCEEDED = REGISTRY.counter('bybit_mover_transfers_succeeded_total', 'Profit transfers that succeeded')
+TRANSFERS_FAILED = REGISTRY.counter('bybit_mover_transfers_failed_total', 'Profit transfers that failed')
+TRANSFERS_SKIPPED = REGISTRY.counter(
+    'bybit_mover_transfers_skipped_total', 'Account checks that did not transfer, by reason', ('reason',))
+SWEPT_USDT = REGISTRY.counter('bybit_mover_swept_usdt_total', 'USDT value transferred to the main account')
 
 class BybitMover:
     def __init__(self, config_path='config.json'):
+        self.config_path = config_path
         self.config = self.load_config(config_path)
         self.check_interval = self.parse_interval(self.config['check_interval'])
         self.profit_percentage = self.config['profit_percentage']
         self.min_profit_threshold = self.config['min_profit_threshold']
         self.test_mode = self.config.get('test_mode', False)
-        self.api_sessions = {}
+        self.max_workers = self.parse_max_workers(self.config.get('concurrency', {}))
+        self.accounts = None
+        self.stream = None
+        self.metrics_server = None
+        self.ingest_server = None
+        self.scheduler = None
+        self.coordinator = None
+        self.config_watcher = None
+        # Shared by running checks; config edits take it exclusively and are applied in between
+        self.cycle_lock = CheckLock()
+        # The balance snapshot of the cycle running on the current thread
+        self.cycle_state = threading.local()
+        self.worker_id = self.get_worker_id(self.config.get('sharding', {}))
+        self.gateway = RequestGateway.from_config(self.config.get('rate_limits', {}))
+        multi_coin = self.config.get('multi_coin', {})
+        self.sweep_coins = self.parse_sweep_coins(multi_coin)
+        # One ticker call values every coin for all accounts until the TTL runs out
+        self.prices = PriceCache(self.fetch_prices, ttl_seconds=multi_coin.get('price_ttl_seconds', DEFAULT_PRICE_TTL))
+        self.simulated_coin_balances = {}
+        # Position values are kept per account between checks, refetched when stale or changed
+        self.positions = PositionCache(self.fetch_positions, ttl_seconds=self.config.get('margin_check', {}).get(
+            'position_ttl_seconds', DEFAULT_POSITION_TTL))
         self.initial_balances = {}
         self.last_balances = {}
+        # Test mode balances are simulated, so they are never persisted
+        self.state = StateStore(':memory:' if self.test_mode else self.config.get('state_file', STATE_FILE))
+        self.unconfirmed_transfers = {}
+        self.balances_ready = threading.Event()
         self.transfer_history = []
+        # Sharded workers each append to their own journal; the dashboard merges them
+        if self.worker_id is None:
+            self.journal = TransferJournal()
+        else:
+            self.journal = TransferJournal(shard_history_file(self.worker_id), legacy_path=None)
+        # Completed months are sealed into compressed segments, so the journal only holds recent transfers
+        history_settings = self.config.get('history', {})
+        self.segment_dir = history_settings.get('segment_dir', SEGMENT_DIR)
+        self.history_compaction = history_settings.get('compaction', True)
+        self.history_lock = threading.Lock()
+        self.compacted_month = None
+        # Every record goes through one writer thread, which shares an fsync between concurrent transfers
+        self.history_writer = HistoryWriter(self.journal)
+        self.history_writer.start()
+        self.snapshot_saved_calls = 0
+        logging_settings = self.config.get('logging', {})
+        if logging_settings.get('console_format', 'text') == 'json':
+            console_handler.setFormatter(JsonFormatter())
+        self.balance_sampler = BalanceSampler(logging_settings.get('balance_sample_every', DEFAULT_BALANCE_SAMPLE_EVERY))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers) if self.max_workers > 1 else None
+        self.compact_history()
         self.load_transfer_history()
         
         # Initialize API sessions
         self.initialize_api_sessions()
         
-        # Initialize balances
-        self.initialize_balances()
+        # Initialize balances, for the accounts owned by this worker when sharded
+        if self.worker_id is None:
+            self.initialize_balances()
+        else:
+            self.start_sharding()
+        
+        # Start event-driven balance updates if enabled
+        self.start_stream()
+        
+        # Serve Prometheus metrics if enabled
+        self.start_metrics_server()
+        
+        # Accept transfer records from the web interface if enabled
+        self.start_ingest_server()
+        
+        # Apply edits of the config file without a restart if enabled
+        self.start_config_watcher()
         
         logger.info(f"Running in {'TEST' if self.test_mode else 'LIVE'} mode")
         logger.info(f"Check interval: {self.check_interval} seconds")
         logger.info(f"Profit percentage: {self.profit_percentage}%")
         logger.info(f"Minimum profit threshold: {self.min_profit_threshold} USDT")
+        if self.sweep_coins is not None:
+            logger.info(f"Sweeping coins: {', '.join(self.sweep_coins)}")
+        logger.info(f"Parallel account workers: {self.max_workers}")
 
     def load_config(self, config_path):
         try:
             with open(config_path, 'r') as f:
                 config = json.load(f)
-                # Parse the check_interval into minutes
-                interval = config['check_interval']
-                if not re.match(r'^\d+[mh]$', interval):
-                    raise ValueError("check_interval must be in format: '5m' or '2h'")
+                self.validate_config(config)
                 return config
         except FileNotFoundError:
-            print("Error: config.json not found. Please create it with your settings.")
+            logger.error("config.json not found. Please create it with your settings.")
             exit(1)
 
-    def initialize_sessions(self):
-        """Initialize API sessions for all accounts"""
-        # Initialize main account session
-        main_account = self.config['accounts']['main_account']
-        self.sessions[main_account['uid']] = HTTP(
-            testnet=False,
-            api_key=main_account['api_key'],
-            api_secret=main_account['api_secret']
-        )
-
-        # Initialize sub-account sessions
-        for sub_account in self.config['accounts']['sub_accounts']:
-            self.sessions[sub_account['uid']] = HTTP(
-                testnet=False,
-                api_key=sub_account['api_key'],
-                api_secret=sub_account['api_secret']
-            )
+    def validate_config(self, config):
+        """Check the rules and accounts of a config; raises ValueError, or KeyError for a missing setting"""
+        missing = [key for key in REQUIRED_SETTINGS if key not in config]
+        if missing:
+            raise ValueError(f"Missing settings in config: {', '.join(missing)}")
+        accounts = config['accounts']
+        for entry in [accounts['main_account']] + accounts['sub_accounts']:
+            missing = [key for key in ('uid', 'api_key', 'api_secret') if key not in entry]
+            if missing:
+                raise ValueError(f"Account {entry.get('uid', '?')} in config is missing {', '.join(missing)}")
+        
+        # The global rules and the overrides of each sub-account
+        for settings in [config] + accounts['sub_accounts']:
+            where = f" for account {settings['uid']}" if 'uid' in settings else ''
+            if 'check_interval' in settings:
+                self.parse_interval(settings['check_interval'])
+            if 'profit_percentage' in settings and not 0 < settings['profit_percentage'] <= 100:
+                raise ValueError(f"profit_percentage{where} must be between 0 and 100")
+            for key in ('min_profit_threshold', 'min_remaining_balance'):
+                if key in settings and settings[key] < 0:
+                    raise ValueError(f"{key}{where} must not be negative")
+        
+        margin_check = config.get('margin_check', {})
+        if margin_check.get('enabled', False) and 'max_margin_used_percent' not in margin_check:
+            raise ValueError("margin_check.max_margin_used_percent is required when margin_check is enabled")
 
     def get_account_balance(self, account_id):
-        """Get the balance for a specific account"""
+        """Get the total wallet balance for a specific account, from the cycle snapshot when one is active"""
+        wallet = self.get_wallet(account_id)
+        return wallet['total'] if wallet is not None else None
+
+    def get_wallet(self, account_id):
+        """Get the total and per-coin balances of an account, from the stream or the cycle snapshot when available"""
+        # Use the streamed balance when the account's stream is live; it costs no API call
+        if self.stream is not None:
+            streamed_wallet = self.stream.get_wallet(account_id)
+            if streamed_wallet is not None:
+                return streamed_wallet
+        snapshot = getattr(self.cycle_state, 'snapshot', None)
+        if snapshot is None:
+            return self.fetch_wallet(account_id)
+        return snapshot.get_balance(account_id, lambda: self.fetch_wallet(account_id))
+
+    def fetch_wallet(self, account_id):
+        """Fetch {'total': balance, 'coins': {coin: balance}} for an account in one REST call, or None if it failed"""
         try:
-            # Find the API key for this account ID
-            api_key = None
-            if account_id == self.config['accounts']['main_account']['uid']:
-                api_key = self.config['accounts']['main_account']['api_key']
-            else:
-                for sub_account in self.config['accounts']['sub_accounts']:
-                    if sub_account['uid'] == account_id:
-                        api_key = sub_account['api_key']
-                        break
-            
-            if api_key not in self.api_sessions:
-                print(f"Error: No session found for account {account_id}")
-                return 0
+            account = self.accounts.get(account_id)
+            if account is None or account.session is None:
+                self.log(f"No session found for account {account_id}", event='error', level=logging.ERROR)
+                return None
 
             if self.test_mode:
-                # Simulate balance with random fluctuations
-                if account_id not in self.last_balances:
-                    self.last_balances[account_id] = 100.0  # Start with 100 USDT
-                
-                # Simulate random profit/loss (-10 to +10 USDT)
-                change = random.uniform(-10, 10)
-                self.last_balances[account_id] += change
-                return self.last_balances[account_id]
-
-            response = self.api_sessions[api_key].get_wallet_balance(
-                accountType="UNIFIED",
-                coin="USDT"  # We're tracking USDT balance
-            )
-            if response['retCode'] == 0:
-                return float(response['result']['list'][0]['totalWalletBalance'])
-            return 0
+                return self.simulate_wallet(account_id)
+
+            params = {'accountType': "UNIFIED"}
+            if self.sweep_coins is None:
+                params['coin'] = "USDT"  # We're tracking USDT balance
+            # Otherwise no coin filter, so the one call returns every coin the account holds
+            result = self.gateway.call('wallet', account.api_key, account.session.get_wallet_balance, **params)
+            if not result.ok:
+                self.log(f"Error getting balance for {account_id}: {result.error} (code {result.code})",
+                         event='error', level=logging.ERROR, code=result.code)
+                return None
+            wallet = result.result['list'][0]
+            return {
+                'total': float(wallet['totalWalletBalance']),
+                'coins': {coin['coin']: float(coin['walletBalance'] or 0) for coin in wallet.get('coin', [])}
+            }
         except Exception as e:
-            print(f"Error getting balance for {account_id}: {str(e)}")
-            return 0
+            self.log(f"Error getting balance for {account_id}: {str(e)}", event='error', level=logging.ERROR)
+            return None
 
-    def initialize_balances(self):
-        """Initialize the initial balances for all accounts"""
-        print("\nInitializing account balances...")
-        for sub_account in self.config['accounts']['sub_accounts']:
-            account_uid = sub_account['uid']
-            initial_balance = self.get_account_balance(account_uid)
-            self.initial_balances[account_uid] = initial_balance
-            self.last_balances[account_uid] = initial_balance
-            print(f"Initial balance for {account_uid}: {initial_balance} USDT")
+    def simulate_wallet(self, account_id):
+        """Return a test mode wallet with random fluctuations"""
+        if self.sweep_coins is None:
+            if account_id not in self.last_balances:
+                self.last_balances[account_id] = 100.0  # Start with 100 USDT
+            
+            # Simulate random profit/loss (-10 to +10 USDT)
+            change = random.uniform(-10, 10)
+            self.last_balances[account_id] += change
+            balance = self.last_balances[account_id]
+            return {'total': balance, 'coins': {'USDT': balance}}
+
+        # Every coin starts at 100 and is valued at 1 USDT in test mode
+        coins = {}
+        for coin in self.sweep_coins:
+            balance = self.simulated_coin_balances.get((account_id, coin), 100.0) + random.uniform(-10, 10)
+            self.simulated_coin_balances[(account_id, coin)] = balance
+            coins[coin] = balance
+        return {'total': sum(coins.values()), 'coins': coins}
+
+    def parse_sweep_coins(self, multi_coin):
+        """Return the coins to sweep when multi-coin sweeping is enabled, otherwise None"""
+        if not multi_coin.get('enabled', False):
+            return None
+        coins = [coin.upper() for coin in multi_coin.get('coins', [QUOTE_COIN])]
+        if not coins:
+            raise ValueError("multi_coin.coins must list at least one coin")
+        return coins
+
+    def balance_key(self, account_uid, coin):
+        """Return the key under which the baseline of one swept coin of an account is kept"""
+        if self.sweep_coins is None:
+            return account_uid  # The total wallet balance, swept as USDT
+        return f"{account_uid}:{coin}"
+
+    def balance_keys(self, account_uid):
+        """Return [(baseline key, coin)] for everything swept from an account"""
+        coins = [QUOTE_COIN] if self.sweep_coins is None else self.sweep_coins
+        return [(self.balance_key(account_uid, coin), coin) for coin in coins]
+
+    def swept_balances(self, account_uid, wallet):
+        """Return {baseline key: balance} of the swept coins in a wallet"""
+        if self.sweep_coins is None:
+            return {account_uid: wallet['total']}
+        return {key: wallet['coins'].get(coin, 0.0) for key, coin in self.balance_keys(account_uid)}
+
+    def fetch_prices(self):
+        """Fetch the USDT price of every spot coin in one ticker call, or None if it failed"""
+        if self.test_mode:
+            return {coin: 1.0 for coin in self.sweep_coins or []}
+        main = self.accounts.main
+        result = self.gateway.call('market', main.api_key, main.session.get_tickers, category="spot")
+        if not result.ok:
+            logger.warning(f"Error getting coin prices: {result.error} (code {result.code})")
+            return None
+        return parse_spot_tickers(result.result['list'])
+
+    def format_amount(self, amount, coin):
+        """Format an amount of a coin for output"""
+        if coin == QUOTE_COIN:
+            return f"{amount:.2f} {coin}"
+        return f"{amount:.{COIN_DECIMALS}f} {coin}"
+
+    def initialize_balances(self, account_uids=None):
+        """Restore baselines from the state store and fetch initial balances for new accounts only"""
+        logger.info("Initializing account balances...")
+        if account_uids is None:
+            account_uids = [account.uid for account in self.owned_accounts()]
+        wanted = set(account_uids)
+        stored_balances = self.state.load_balances()
+        for transfer in self.state.inflight_transfers():
+            if transfer['from_account'] not in wanted:
+                continue
+            pending = self.unconfirmed_transfers.setdefault(transfer['from_account'], [])
+            if not any(t['transfer_id'] == transfer['transfer_id'] for t in pending):
+                pending.append(transfer)
+        
+        restored = []
+        missing = []
+        for account_uid in account_uids:
+            keys = [key for key, _ in self.balance_keys(account_uid)]
+            for key in keys:
+                if key in stored_balances:
+                    self.initial_balances[key], self.last_balances[key] = stored_balances[key]
+            if all(key in stored_balances for key in keys):
+                restored.append(account_uid)
+            else:
+                missing.append(account_uid)
+        
+        if restored:
+            logger.info(f"Restored baselines for {len(restored)} accounts from {self.state.path}")
+        if missing:
+            logger.info(f"Fetching initial balances for {len(missing)} accounts in the background")
+        if self.unconfirmed_transfers:
+            logger.info(f"Found unconfirmed transfers for {len(self.unconfirmed_transfers)} accounts, reconciling")
+        
+        # The scheduler can start right away; accounts get their baseline as soon as it is fetched
+        threading.Thread(target=self.warm_up, args=(missing, restored), name='warm-up', daemon=True).start()
+
+    def warm_up(self, missing_uids, restored_uids):
+        """Fetch balances for new accounts, then reconcile restored ones, in the background"""
+        try:
+            if missing_uids:
+                self.fetch_initial_balances(missing_uids)
+            if restored_uids or self.unconfirmed_transfers:
+                self.reconcile_state(restored_uids)
+        except Exception:
+            logger.exception("Error while initializing account balances")
+        finally:
+            self.balances_ready.set()
+
+    def fetch_initial_balances(self, account_uids):
+        """Fetch initial balances concurrently and report progress as they arrive"""
+        executor = self.executor or ThreadPoolExecutor(max_workers=STARTUP_WORKERS)
+        try:
+            futures = [executor.submit(self.initialize_account_balance, account_uid) for account_uid in account_uids]
+            total = len(futures)
+            report_every = max(1, total // 10)
+            done = failed = 0
+            started = time.monotonic()
+            for future in as_completed(futures):
+                done += 1
+                if not future.result():
+                    failed += 1
+                if done % report_every == 0 or done == total:
+                    logger.info(f"Initial balances: {done}/{total} fetched, {failed} failed "
+                                f"({time.monotonic() - started:.1f}s)")
+        finally:
+            if executor is not self.executor:
+                executor.shutdown(wait=False)
+
+    def initialize_account_balance(self, account_uid):
+        """Fetch and store the starting balance for one account; returns False if it failed"""
+        account = self.accounts.get(account_uid)
+        if account is None:
+            return True  # Removed from the config in the meantime
+        with account.lock:
+            if all(key in self.initial_balances for key, _ in self.balance_keys(account_uid)):
+                return True  # Already set by a sweep that ran first
+            try:
+                wallet = self.get_wallet(account_uid)
+            except Exception as e:
+                logger.error(f"Error getting initial balance for {account_uid}: {str(e)}")
+                wallet = None
+            if wallet is None:
+                logger.warning(f"Could not get initial balance for {account_uid}, will retry on the next check")
+                return False
+            for key, initial_balance in self.swept_balances(account_uid, wallet).items():
+                if key in self.initial_balances:
+                    continue
+                self.initial_balances[key] = initial_balance
+                self.last_balances[key] = initial_balance
+                self.save_state(key)
+                logger.debug(f"Initial balance for {key}: {initial_balance}")
+            return True
+
+    def save_state(self, key):
+        """Persist the baseline and last-seen balance for an account (or one coin of it)"""
+        initial_balance = self.initial_balances[key]
+        self.state.save_balance(key, initial_balance, self.last_balances.get(key, initial_balance))
+
+    def reconcile_state(self, restored_uids):
+        """Check restored accounts against the exchange in the background after a warm restart"""
+        for account_uid in list(self.unconfirmed_transfers):
+            account = self.accounts.get(account_uid)
+            if account is None:
+                continue
+            with account.lock:
+                self.reconcile_transfers(account_uid)
+        
+        for account_uid in restored_uids:
+            account = self.accounts.get(account_uid)
+            if account is None:
+                continue
+            with account.lock:
+                wallet = self.fetch_wallet(account_uid)
+                if wallet is None:
+                    continue
+                for key, current_balance in self.swept_balances(account_uid, wallet).items():
+                    if key not in self.initial_balances:
+                        continue
+                    last_balance = self.last_balances.get(key)
+                    if last_balance is not None and abs(current_balance - last_balance) > 1e-9:
+                        logger.info(f"Balance for {key} moved from {last_balance:.2f} to "
+                                    f"{current_balance:.2f} while stopped")
+                    self.last_balances[key] = current_balance
+                    self.save_state(key)
+
+    def reconcile_transfers(self, account_uid):
+        """Resolve transfers with an unknown outcome; True once none are left. Caller holds the account lock"""
+        account = self.accounts.get(account_uid)
+        pending = []
+        for transfer in self.unconfirmed_transfers.get(account_uid, []):
+            created_at = datetime.fromisoformat(transfer['created_at'])
+            # Without startTime the API only searches its default recent window
+            result = self.gateway.call(
+                'transfer', account.api_key, account.session.get_universal_transfer_records,
+                transferId=transfer['transfer_id'],
+                startTime=int((created_at - TRANSFER_LOOKUP_MARGIN).timestamp() * 1000)
+            )
+            if not result.ok:
+                self.log(f"Could not check transfer {transfer['transfer_id']}: {result.error} (code {result.code})",
+                         event='error', level=logging.WARNING, transfer_id=transfer['transfer_id'], code=result.code)
+                pending.append(transfer)
+                continue
+            
+            records = result.result.get('list', [])
+            status = records[0]['status'] if records else 'NOT_FOUND'
+            if status == 'SUCCESS':
+                # The transfer went through but its baseline update was lost
+                coin = transfer.get('coin', QUOTE_COIN)
+                key = self.balance_key(account_uid, coin)
+                if key in self.initial_balances:
+                    self.initial_balances[key] += transfer['amount']
+                    self.state.complete_transfer(transfer['transfer_id'], key,
+                                                 self.initial_balances[key],
+                                                 self.last_balances.get(key, self.initial_balances[key]))
+                else:
+                    self.state.remove_inflight(transfer['transfer_id'])
+                if self.worker_id is not None:
+                    self.load_transfer_history()  # It may have been recorded by another worker
+                if not self.transfer_recorded(transfer['transfer_id'], transfer['created_at']):
+                    price = self.prices.get(coin)
+                    self.record_transfer(transfer['from_account'], transfer['to_account'], transfer['amount'],
+                                         transfer_id=transfer['transfer_id'], coin=coin,
+                                         value=transfer['amount'] * price if price is not None else None)
+                logger.info(f"Reconciled transfer {transfer['transfer_id']} of "
+                            f"{self.format_amount(transfer['amount'], coin)} from {account_uid}: completed")
+            elif status == 'FAILED' or (status == 'NOT_FOUND'
+                                        and datetime.now() - created_at >= TRANSFER_NOT_FOUND_GRACE):
+                self.state.remove_inflight(transfer['transfer_id'])
+                logger.info(f"Reconciled transfer {transfer['transfer_id']} from {account_uid}: {status.lower()}")
+            else:
+                # Still processing, or too recent to be sure it is not just missing from the records yet
+                pending.append(transfer)
+        
+        if pending:
+            self.unconfirmed_transfers[account_uid] = pending
+            return False
+        self.unconfirmed_transfers.pop(account_uid, None)
+        return True
 
     def calculate_profit(self, account_id):
         """Calculate profit for a specific account since last check"""
         current_balance = self.get_account_balance(account_id)
+        if current_balance is None:
+            return 0
         if account_id not in self.last_balances:
             self.last_balances[account_id] = current_balance
             return 0
@@ -167,62 +535,77 @@ class BybitMover:
         # Calculate total profit since start
         total_profit = current_balance - self.initial_balances[account_id]
         
-        print(f"Account {account_id}:")
-        print(f"  Current balance: {current_balance} USDT")
-        print(f"  Profit since last check: {profit} USDT")
-        print(f"  Total profit since start: {total_profit} USDT")
+        if self.balance_sampler.sample(account_id):
+            self.log(f"Balance {current_balance} USDT, profit since last check {profit} USDT, "
+                     f"total profit since start {total_profit} USDT", event='balance', account=account_id,
+                     balance=current_balance, profit=profit, total_profit=total_profit)
         
         return profit
 
-    def transfer_funds(self, from_account, to_account, amount):
-        """Transfer funds between accounts with test mode support"""
+    def transfer_funds(self, from_account, to_account, amount, transfer_id=None, coin=QUOTE_COIN, value=None):
+        """Transfer amount of coin (worth value USDT), recording it as in-flight in the state store until settled"""
+        transfer_id = transfer_id or str(uuid.uuid4())
+        value = amount if value is None else value
+        TRANSFERS_ATTEMPTED.inc()
         if self.test_mode:
-            print(f"[TEST MODE] Would transfer {amount} USDT from {from_account} to {to_account}")
+            self.log(f"[TEST MODE] Would transfer {amount} {coin} from {from_account} to {to_account}", event='transfer_test')
             # Simulate transfer success
             success = True
         else:
             try:
-                from_session = self.api_sessions[from_account]
-                to_session = self.api_sessions[to_account]
+                account = self.accounts.get(from_account)
+                created_at = datetime.now().isoformat()
+                self.state.add_inflight(transfer_id, from_account, to_account, amount, coin=coin)
                 
-                # Get account UIDs from config
-                from_uid = next(acc['uid'] for acc in self.config['accounts']['sub_accounts'] 
-                              if acc['api_key'] == from_account)
-                to_uid = self.config['accounts']['main_account']['uid']
-                
-                # Create transfer
-                response = from_session.create_universal_transfer(
-                    transferId=str(uuid.uuid4()),
+                # Create transfer; the transferId is fixed up front so gateway retries are idempotent
+                result = self.gateway.call(
+                    'transfer', account.api_key, account.session.create_universal_transfer,
+                    transferId=transfer_id,
                     fromAccountType="UNIFIED",
                     toAccountType="UNIFIED",
-                    fromMemberId=from_uid,
-                    toMemberId=to_uid,
-                    coin="USDT",
-                    amount=str(amount)
+                    fromMemberId=from_account,
+                    toMemberId=to_account,
+                    coin=coin,
+                    amount=str(amount) if coin == QUOTE_COIN else f"{amount:.{COIN_DECIMALS}f}"
                 )
                 
-                success = response.get('retCode') == 0
+                success = result.ok
+                # A rejection of a retry does not count: the attempt before it may have gone through
+                if not success and result.code in REJECTED_TRANSFER_CODES and result.attempts == 1:
+                    self.log(f"Transfer rejected: {result.error} (code {result.code})",
+                             event='transfer_rejected', level=logging.WARNING, transfer_id=transfer_id, code=result.code)
+                    self.state.remove_inflight(transfer_id)
+                elif not success:
+                    # No answer, a server error or a retry: the transfer may still have gone through
+                    self.log(f"Transfer outcome unknown: {result.error} (code {result.code}); "
+                             f"will reconcile before the next sweep", event='transfer_unknown', level=logging.WARNING,
+                             transfer_id=transfer_id, code=result.code)
+                    self.unconfirmed_transfers.setdefault(from_account, []).append({
+                        'transfer_id': transfer_id, 'from_account': from_account,
+                        'to_account': to_account, 'amount': amount, 'coin': coin, 'created_at': created_at
+                    })
             except Exception as e:
-                print(f"Error transferring funds: {str(e)}")
+                self.log(f"Error transferring funds: {str(e)}", event='error', level=logging.ERROR)
+                self.state.remove_inflight(transfer_id)
                 success = False
         
         if success:
-            self.record_transfer(from_account, to_account, amount)
-            print(f"Successfully transferred {amount} USDT from {from_account} to {to_account}")
+            # Balances changed on both sides, so cached values are stale
+            snapshot = getattr(self.cycle_state, 'snapshot', None)
+            if snapshot is not None:
+                snapshot.invalidate(from_account)
+                snapshot.invalidate(to_account)
+            TRANSFERS_SUCCEEDED.inc()
+            SWEPT_USDT.inc(value)
+            self.log(f"Successfully transferred {amount} {coin} from {from_account} to {to_account}",
+                     event='transfer', transfer_id=transfer_id, coin=coin, amount=amount, value=value)
             return True
         else:
-            print(f"Failed to transfer {amount} USDT from {from_account} to {to_account}")
+            TRANSFERS_FAILED.inc()
+            self.log(f"Failed to transfer {amount} {coin} from {from_account} to {to_account}",
+                     event='transfer_failed', level=logging.WARNING, transfer_id=transfer_id, coin=coin, amount=amount)
             return False
 
-    def get_interval_minutes(self):
-        """Convert check_interval to minutes"""
-        interval = self.config['check_interval']
-        if interval.endswith('m'):
-            return int(interval[:-1])
-        elif interval.endswith('h'):
-            return int(interval[:-1]) * 60
-        return 60  # default to 1 hour if invalid format
-
     def check_margin_usage(self, account_id):
         """Check if margin usage is below threshold"""
         if not self.config.get('margin_check', {}).get('enabled', False):
@@ -232,90 +615,476 @@ class BybitMover:
             return True  # In test mode, assume margin is fine
             
         try:
-            # Get position info from Bybit
-            response = self.api_sessions[account_id].get_position_list(
-                category="linear",
-                settleCoin="USDT"
-            )
-            if response['retCode'] != 0:
-                print(f"Error getting position info: {response['retMsg']}")
+            # Served from the position cache unless the account's positions are stale or changed
+            total_margin_used = self.positions.margin_used(account_id)
+            if total_margin_used is None:
                 return False
                 
-            positions = response['result']['list']
-            total_margin_used = sum(float(pos['positionValue']) for pos in positions)
             current_balance = self.get_account_balance(account_id)
             
-            if current_balance == 0:
+            if not current_balance:
                 return False
                 
             margin_percentage = (total_margin_used / current_balance) * 100
             max_margin = self.config['margin_check']['max_margin_used_percent']
             
-            print(f"  Margin usage: {margin_percentage:.2f}% (max allowed: {max_margin}%)")
+            self.log(f"Margin usage: {margin_percentage:.2f}% (max allowed: {max_margin}%)",
+                     event='margin', margin_percent=margin_percentage, max_margin_percent=max_margin)
             return margin_percentage < max_margin
             
         except Exception as e:
-            print(f"Error checking margin: {str(e)}")
+            self.log(f"Error checking margin: {str(e)}", event='error', level=logging.ERROR)
             return False
 
+    def fetch_positions(self, account_id):
+        """Fetch every linear USDT position of an account, following the page cursor, or None if it failed"""
+        account = self.accounts.get(account_id)
+        positions = []
+        cursor = ''
+        for _ in range(MAX_POSITION_PAGES):
+            params = {'category': 'linear', 'settleCoin': 'USDT', 'limit': POSITION_PAGE_LIMIT}
+            if cursor:
+                params['cursor'] = cursor
+            result = self.gateway.call('position', account.api_key, account.session.get_positions, **params)
+            if not result.ok:
+                self.log(f"Error getting position info: {result.error} (code {result.code})",
+                         event='error', level=logging.ERROR, code=result.code)
+                return None
+            positions.extend(result.result['list'])
+            next_cursor = result.result.get('nextPageCursor') or ''
+            if not next_cursor or next_cursor == cursor:
+                return positions
+            cursor = next_cursor
+        # A partial list would under-report margin, so treat it like a failed fetch
+        self.log(f"More than {MAX_POSITION_PAGES * POSITION_PAGE_LIMIT} positions, margin cannot be checked",
+                 event='error', level=logging.ERROR)
+        return None
+
     def check_remaining_balance(self, account_id, transfer_amount):
-        """Check if enough balance will remain after transfer"""
+        """Check if enough balance will remain after transferring the given USDT value"""
         current_balance = self.get_account_balance(account_id)
-        min_remaining = self.config.get('min_remaining_balance', 50)  # Default 50 USDT
+        if current_balance is None:
+            return False
+        min_remaining = self.accounts.get(account_id).setting(
+            'min_remaining_balance', self.config.get('min_remaining_balance', 50))  # Default 50 USDT
         remaining = current_balance - transfer_amount
         
-        print(f"  Balance after transfer would be: {remaining:.2f} USDT (min required: {min_remaining} USDT)")
+        self.log(f"Balance after transfer would be: {remaining:.2f} USDT (min required: {min_remaining} USDT)",
+                 event='remaining', remaining=remaining, min_remaining=min_remaining)
         return remaining > min_remaining
 
+    def parse_max_workers(self, concurrency):
+        """Parse the concurrency settings into a worker count (1 means sequential)"""
+        if not concurrency.get('enabled', False):
+            return 1
+        max_workers = int(concurrency.get('max_workers', 4))
+        if max_workers < 1:
+            raise ValueError("concurrency.max_workers must be at least 1")
+        return max_workers
+
+    def log(self, message, event='message', level=logging.INFO, **fields):
+        """Log a structured event; the account and cycle being processed are added from the log context"""
+        logger.log(level, message, extra={'event': event, 'fields': fields}, stacklevel=2)
+
     def process_profits(self):
         """Process profits for all source accounts"""
+        self.process_accounts([account.uid for account in self.owned_accounts()])
+
+    def process_accounts(self, account_uids):
+        """Process profits for the given sub-accounts as one cycle sharing a balance snapshot"""
+        # Config edits wait for running cycles to finish, so each runs on one set of accounts and rules
+        with self.cycle_lock.shared():
+            self.run_cycle(account_uids)
+
+    def dispatch_accounts(self, account_uids):
+        """Start the checks of due accounts: each on the concurrency pool, or one cycle inline without one"""
+        if self.executor is None:
+            self.process_accounts(account_uids)
+            return
+        # A slow account only holds its own worker; its next tick is skipped as busy while it still runs
+        for account_uid in account_uids:
+            self.executor.submit(self.process_accounts, [account_uid])
+
+    def check_slot(self, account_uid):
+        """Return the seconds an account's check may take before it runs into the next one's slot"""
+        slot = self.scheduler.slot_seconds(account_uid) if self.scheduler is not None else None
+        return slot if slot is not None else self.check_interval
+
+    def run_cycle(self, account_uids):
+        """Run one cycle over the given sub-accounts; the caller holds cycle_lock shared"""
         current_time = datetime.now()
-        print(f"\nProcessing profits at {current_time}")
+        started = time.perf_counter()
+        cycle = uuid.uuid4().hex[:12]
+        main_account_uid = self.accounts.main.uid
+        snapshot = BalanceSnapshot()
+        self.compact_history()
         
-        main_account_uid = self.config['accounts']['main_account']['uid']
-        
-        for sub_account in self.config['accounts']['sub_accounts']:
-            account_uid = sub_account['uid']
-            current_balance = self.get_account_balance(account_uid)
-            initial_balance = self.initial_balances[account_uid]
+        with log_context(cycle=cycle):
+            self.log(f"Processing profits for {len(account_uids)} accounts", event='cycle_start',
+                     accounts=len(account_uids))
             
-            # Calculate total profit since start
-            total_profit = current_balance - initial_balance
+            if self.executor is None or len(account_uids) == 1:
+                for account_uid in account_uids:
+                    self.process_account_safely(account_uid, main_account_uid, cycle, snapshot)
+            else:
+                # Every event is tagged with its account, so parallel accounts can log as they go
+                futures = [
+                    self.executor.submit(self.process_account_safely, account_uid, main_account_uid, cycle, snapshot)
+                    for account_uid in account_uids
+                ]
+                for future in futures:
+                    future.result()
             
-            print(f"\nAccount {account_uid}:")
-            print(f"  Current balance: {current_balance:.2f} USDT")
-            print(f"  Initial balance: {initial_balance:.2f} USDT")
-            print(f"  Total profit: {total_profit:.2f} USDT")
+            self.snapshot_saved_calls += snapshot.saved_calls
+            self.last_check_time = current_time
             
-            if total_profit > self.min_profit_threshold:
-                transfer_amount = total_profit * (self.profit_percentage / 100)
-                print(f"  Profit exceeds threshold ({self.min_profit_threshold} USDT)")
-                print(f"  Calculated transfer amount: {transfer_amount:.2f} USDT")
-                
-                # Check margin usage if enabled
-                if not self.check_margin_usage(account_uid):
-                    print("  Transfer skipped: Margin usage too high")
-                    continue
-                
-                # Check minimum remaining balance
-                if not self.check_remaining_balance(account_uid, transfer_amount):
-                    print("  Transfer skipped: Would leave insufficient balance")
-                    continue
-                
-                if transfer_amount > 0:
-                    success = self.transfer_funds(
-                        account_uid,
-                        main_account_uid,
-                        transfer_amount
-                    )
-                    if success:
-                        # Update initial balance after successful transfer
-                        self.initial_balances[account_uid] = current_balance - total_profit + transfer_amount
-                        print(f"  New initial balance set to: {self.initial_balances[account_uid]:.2f} USDT")
+            duration = time.perf_counter() - started
+            BATCH_DURATION.observe(duration)
+            BATCH_ACCOUNTS.observe(len(account_uids))
+            LAST_BATCH.set(time.time())
+            self.log(f"Cycle finished in {duration:.2f}s; balance snapshot: {snapshot.api_calls} API calls made, "
+                     f"{snapshot.saved_calls} saved ({self.snapshot_saved_calls} saved since start)",
+                     event='cycle_end', duration=duration, api_calls=snapshot.api_calls,
+                     saved_calls=snapshot.saved_calls)
+
+    def process_account_safely(self, account_uid, main_account_uid, cycle=None, snapshot=None):
+        """Process one account so that a failure never stops the remaining accounts"""
+        context = {'account': account_uid}
+        if cycle is not None:
+            context['cycle'] = cycle
+        with log_context(**context):
+            account = self.accounts.get(account_uid)
+            if account is None:
+                self.log("Removed from the config, skipping", event='skipped', reason='removed')
+                TRANSFERS_SKIPPED.labels('removed').inc()
+                return
+            if not account.lock.acquire(blocking=False):
+                self.log("Already being processed, skipping", event='skipped', reason='busy')
+                TRANSFERS_SKIPPED.labels('busy').inc()
+                return
+            started = time.perf_counter()
+            self.cycle_state.snapshot = snapshot
+            try:
+                if self.coordinator is not None and not self.coordinator.owns(account_uid):
+                    self.log("Not owned by this worker, skipping", event='skipped', reason='not_owned')
+                    TRANSFERS_SKIPPED.labels('not_owned').inc()
+                    return
+                self.process_account(account_uid, main_account_uid)
+            except Exception:
+                logger.exception(f"Error processing account {account_uid}", extra={'event': 'error'})
+            finally:
+                self.cycle_state.snapshot = None
+                account.lock.release()
+            duration = time.perf_counter() - started
+            slot = self.check_slot(account_uid)
+            if duration > slot:
+                CHECK_OVERRUNS.inc()
+                logger.warning(f"Check took {duration:.1f}s, longer than its {slot:.1f}s slot")
+
+    def start_stream(self):
+        """Subscribe to private wallet/position streams when streaming mode is enabled"""
+        streaming = self.config.get('streaming', {})
+        if not streaming.get('enabled', False) or self.test_mode:
+            return
+        
+        # Sharded workers only open streams for the accounts they own; ownership changes add and remove them
+        accounts = self.owned_accounts()
+        self.stream = BalanceStream(
+            accounts,
+            self.on_stream_change,
+            url=streaming.get('url', PRIVATE_STREAM_URL),
+            debounce_seconds=streaming.get('debounce_seconds', 2),
+            positions=self.positions
+        )
+        self.stream.start()
+        logger.info(f"Streaming balance updates for {len(accounts)} accounts")
+
+    def account_intervals(self):
+        """Return {uid: check interval in seconds}, honouring per-account check_interval overrides"""
+        return {
+            account.uid: self.parse_interval(account.setting('check_interval', self.config['check_interval']))
+            for account in self.owned_accounts()
+        }
+
+    def create_scheduler(self):
+        """Build the scheduler that runs account checks on their interval boundaries"""
+        settings = self.config.get('scheduler', {})
+        scheduler = AccountScheduler(
+            self.dispatch_accounts,
+            stagger=settings.get('stagger', True),
+            jitter_seconds=settings.get('jitter_seconds', 5)
+        )
+        scheduler.set_accounts(self.account_intervals())
+        self.scheduler = scheduler
+        return scheduler
+
+    def get_worker_id(self, sharding):
+        """Return this worker's id when sharding is enabled, otherwise None"""
+        if not sharding.get('enabled', False):
+            return None
+        # The id names the worker's journal, so it must survive restarts or old journals are orphaned
+        worker_id = sharding.get('worker_id') or os.getenv('BYBIT_MOVER_WORKER_ID')
+        if not worker_id:
+            raise ValueError("sharding.worker_id or BYBIT_MOVER_WORKER_ID must be set when sharding is enabled")
+        return worker_id
+
+    def owned_accounts(self):
+        """Return the sub-accounts this process is responsible for"""
+        if self.coordinator is None:
+            return self.accounts.sub_accounts
+        return [account for account in self.accounts.sub_accounts if self.coordinator.owns(account.uid)]
+
+    def start_sharding(self):
+        """Join the worker group and take the leases on this worker's share of the accounts"""
+        sharding = self.config.get('sharding', {})
+        self.coordinator = ShardCoordinator(
+            sharding.get('store', SHARD_STORE),
+            self.worker_id,
+            [account.uid for account in self.accounts.sub_accounts],
+            self.on_ownership_change,
+            heartbeat_seconds=sharding.get('heartbeat_seconds', DEFAULT_HEARTBEAT),
+            lease_seconds=sharding.get('lease_seconds', DEFAULT_LEASE)
+        )
+        self.coordinator.start()
+        logger.info(f"Sharding as worker {self.worker_id}: {len(self.coordinator.owned)} of "
+                    f"{len(self.accounts.sub_accounts)} accounts owned, {len(self.coordinator.workers)} workers")
+        if not self.balances_ready.is_set() and not self.coordinator.owned:
+            self.balances_ready.set()  # Nothing to warm up until accounts are handed over
+
+    def on_ownership_change(self, acquired, released):
+        """Drop released accounts and load the state of acquired ones from the shared store"""
+        if self.stream is not None:
+            self.stream.remove_accounts(released)
+        for account_uid in released:
+            account = self.accounts.get(account_uid)
+            if account is not None:  # Otherwise it was removed from the config and is already forgotten
+                self.forget_account(account)
+        if acquired:
+            self.initialize_balances(sorted(acquired))
+            if self.stream is not None:
+                self.stream.add_accounts([account for account in map(self.accounts.get, sorted(acquired))
+                                          if account is not None])
+        OWNED_ACCOUNTS.set(len(self.coordinator.owned))
+        if self.scheduler is not None:
+            self.scheduler.set_accounts(self.account_intervals())
+
+    def forget_account(self, account):
+        """Drop the in-memory baselines and pending transfers of an account this process stops checking"""
+        with account.lock:  # Wait for a check in progress to finish
+            for key, _ in self.balance_keys(account.uid):
+                self.initial_balances.pop(key, None)
+                self.last_balances.pop(key, None)
+            self.unconfirmed_transfers.pop(account.uid, None)
+        self.positions.invalidate(account.uid)
+
+    def start_config_watcher(self):
+        """Watch the config file and apply edits while running, when enabled in the config"""
+        settings = self.config.get('config_reload', {})
+        if not settings.get('enabled', True):
+            return
+        
+        # Resolved now, so a later change of working directory cannot point the watcher at another file
+        self.config_watcher = ConfigWatcher(os.path.abspath(self.config_path), self.apply_config,
+                                            poll_seconds=settings.get('poll_seconds', DEFAULT_POLL_SECONDS))
+        self.config_watcher.start()
+        logger.info(f"Watching {self.config_path} for changes every {self.config_watcher.poll_seconds}s")
+
+    def apply_config(self, config):
+        """Apply an edited config between cycles, touching only the accounts that changed; invalid ones raise"""
+        self.validate_config(config)
+        for key in restart_required(self.config, config):
+            logger.warning(f"'{key}' changed in {self.config_path}, it only takes effect after a restart")
+            if key in self.config:
+                config[key] = self.config[key]
             else:
-                print(f"  No significant profit (needs > {self.min_profit_threshold} USDT) to transfer")
+                config.pop(key, None)
+        settings = sorted(key for key in set(self.config) | set(config)
+                          if key != 'accounts' and self.config.get(key) != config.get(key))
         
-        self.last_check_time = current_time
+        # Waits for running cycles, so each cycle sees one consistent set of accounts and rules
+        with self.cycle_lock.exclusive():
+            added, removed, changed = self.accounts.update(config['accounts'])
+            for account in removed:
+                self.forget_account(account)
+                # A stale baseline must not come back if the account is added again later
+                for key, _ in self.balance_keys(account.uid):
+                    self.state.delete_balance(key)
+            for account in changed:
+                self.positions.invalidate(account.uid)
+            if self.stream is not None:
+                self.stream.remove_accounts([account.uid for account in removed + changed])
+                # Accounts added under sharding are streamed once this worker takes their lease
+                self.stream.add_accounts([account for account in added + changed if not account.is_main and (
+                    self.coordinator is None or self.coordinator.owns(account.uid))])
+            
+            self.config = config
+            self.check_interval = self.parse_interval(config['check_interval'])
+            self.profit_percentage = config['profit_percentage']
+            self.min_profit_threshold = config['min_profit_threshold']
+            self.positions.ttl_seconds = config.get('margin_check', {}).get(
+                'position_ttl_seconds', DEFAULT_POSITION_TTL)
+            ACCOUNTS.set(len(self.accounts.sub_accounts))
+            if self.coordinator is not None:
+                self.coordinator.set_accounts([account.uid for account in self.accounts.sub_accounts])
+            elif added:
+                self.initialize_balances([account.uid for account in added])
+        
+        if self.coordinator is not None:
+            # Take the leases of added accounts and give up those of removed ones right away
+            self.coordinator.sync()
+        OWNED_ACCOUNTS.set(len(self.owned_accounts()))
+        if self.scheduler is not None:
+            intervals = self.account_intervals()
+            # Rescheduling unchanged intervals would only re-roll the jitter of pending checks
+            if intervals != self.scheduler.intervals:
+                self.scheduler.set_accounts(intervals)
+        
+        self.log(f"Applied {self.config_path}: {len(added)} accounts added, {len(removed)} removed, "
+                 f"{len(changed)} with new credentials, settings changed: {', '.join(settings) or 'none'}",
+                 event='config_reload', added=[account.uid for account in added],
+                 removed=[account.uid for account in removed], changed=[account.uid for account in changed],
+                 settings=settings)
+
+    def start_metrics_server(self):
+        """Serve Prometheus metrics on /metrics when enabled in the config"""
+        settings = self.config.get('metrics', {})
+        ACCOUNTS.set(len(self.accounts.sub_accounts))
+        OWNED_ACCOUNTS.set(len(self.owned_accounts()))
+        if not settings.get('enabled', False):
+            return
+        
+        self.metrics_server = MetricsServer(settings.get('host', '127.0.0.1'), settings.get('port', 9101))
+        self.metrics_server.start()
+        logger.info(f"Serving metrics on {self.metrics_server.url}")
+
+    def start_ingest_server(self):
+        """Accept transfer records from other local processes, so they are committed by this process's writer"""
+        settings = self.config.get('ingest', {})
+        if not settings.get('enabled', True):
+            return
+        if self.worker_id is not None:
+            logger.info("Ingest server is not started by sharded workers, they do not own the main journal")
+            return
+        
+        self.ingest_server = IngestServer(self.history_writer, settings.get('host', '127.0.0.1'),
+                                          settings.get('port', DEFAULT_INGEST_PORT))
+        self.ingest_server.start()
+        logger.info(f"Accepting transfer records on {self.ingest_server.address}")
+
+    def metrics_account_label(self, api_key):
+        """Return the account uid used to label request metrics for an api_key"""
+        account = self.accounts.by_api_key(api_key)
+        return account.uid if account is not None else 'unknown'
+
+    def on_stream_change(self, account_uid):
+        """Run the profit sweep for one account after its streamed wallet or positions changed"""
+        # Like a scheduled cycle, wait for a config edit in progress and see its result
+        with self.cycle_lock.shared():
+            if self.accounts.get(account_uid) is None or not any(
+                    key in self.initial_balances for key, _ in self.balance_keys(account_uid)):
+                return
+            self.log("Stream update", event='stream_update', account=account_uid)
+            self.process_account_safely(account_uid, self.accounts.main.uid)
+
+    def process_account(self, account_uid, main_account_uid):
+        """Check a single sub-account and transfer its profit in each swept coin if all rules pass"""
+        if account_uid in self.unconfirmed_transfers and not self.reconcile_transfers(account_uid):
+            self.log("Skipped: previous transfer not confirmed yet", event='skipped', reason='unconfirmed')
+            TRANSFERS_SKIPPED.labels('unconfirmed').inc()
+            return
+        
+        # One wallet call returns the balances of every swept coin
+        wallet = self.get_wallet(account_uid)
+        if wallet is None:
+            self.log("Skipped: balance unavailable", event='skipped', reason='balance_unavailable')
+            TRANSFERS_SKIPPED.labels('balance_unavailable').inc()
+            return
+        
+        balances = self.swept_balances(account_uid, wallet)
+        for key, coin in self.balance_keys(account_uid):
+            self.process_coin(account_uid, main_account_uid, key, coin, balances[key])
+
+    def process_coin(self, account_uid, main_account_uid, key, coin, current_balance):
+        """Apply the profit rules to one coin of a sub-account; thresholds are compared in USDT"""
+        account = self.accounts.get(account_uid)
+        profit_percentage = account.setting('profit_percentage', self.profit_percentage)
+        min_profit_threshold = account.setting('min_profit_threshold', self.min_profit_threshold)
+        
+        initial_balance = self.initial_balances.get(key)
+        self.last_balances[key] = current_balance
+        if initial_balance is None:
+            # Initial fetch failed at startup, so this is the first balance we have seen
+            self.initial_balances[key] = current_balance
+            self.save_state(key)
+            self.log(f"Initial balance set to: {self.format_amount(current_balance, coin)}",
+                     event='baseline', coin=coin, initial_balance=current_balance)
+            return
+        self.save_state(key)
+        
+        # Calculate total profit since start
+        total_profit = current_balance - initial_balance
+        balance_fields = {'coin': coin, 'balance': current_balance, 'initial_balance': initial_balance,
+                          'profit': total_profit}
+        balance_line = (f"Balance {self.format_amount(current_balance, coin)}, initial "
+                        f"{self.format_amount(initial_balance, coin)}, profit {self.format_amount(total_profit, coin)}")
+        
+        # A loss never passes the threshold, so it is not worth pricing
+        price = self.prices.get(coin) if total_profit > 0 else 1.0
+        if price is None:
+            self.log(f"{balance_line}; transfer skipped: no USDT price for {coin}",
+                     event='skipped', reason='no_price', **balance_fields)
+            TRANSFERS_SKIPPED.labels('no_price').inc()
+            return
+        
+        if total_profit * price <= min_profit_threshold:
+            # The routine case on most checks, so only a sample of these lines is logged
+            if self.balance_sampler.sample(key):
+                self.log(f"{balance_line}; no significant profit (needs > {min_profit_threshold} USDT) to transfer",
+                         event='balance', **balance_fields)
+            TRANSFERS_SKIPPED.labels('threshold').inc()
+            return
+        
+        transfer_amount = total_profit * (profit_percentage / 100)
+        if coin != QUOTE_COIN:
+            # Coin transfers take at most COIN_DECIMALS decimals; never round up past the profit
+            transfer_amount = math.floor(transfer_amount * 10 ** COIN_DECIMALS) / 10 ** COIN_DECIMALS
+        transfer_value = transfer_amount * price
+        self.log(f"{balance_line}; exceeds threshold ({min_profit_threshold} USDT), transfer amount "
+                 f"{self.format_amount(transfer_amount, coin)} ({transfer_value:.2f} USDT)",
+                 event='profit', amount=transfer_amount, value=transfer_value, price=price, **balance_fields)
+        
+        # Check margin usage if enabled
+        if not self.check_margin_usage(account_uid):
+            self.log("Transfer skipped: Margin usage too high", event='skipped', reason='margin', coin=coin)
+            TRANSFERS_SKIPPED.labels('margin').inc()
+            return
+        
+        # Check minimum remaining balance
+        if not self.check_remaining_balance(account_uid, transfer_value):
+            self.log("Transfer skipped: Would leave insufficient balance", event='skipped', reason='min_remaining',
+                     coin=coin)
+            TRANSFERS_SKIPPED.labels('min_remaining').inc()
+            return
+        
+        if transfer_amount > 0:
+            transfer_id = str(uuid.uuid4())
+            success = self.transfer_funds(
+                account_uid,
+                main_account_uid,
+                transfer_amount,
+                transfer_id=transfer_id,
+                coin=coin,
+                value=transfer_value
+            )
+            if success:
+                # Update initial balance after successful transfer
+                self.initial_balances[key] = current_balance - total_profit + transfer_amount
+                self.state.complete_transfer(transfer_id, key, self.initial_balances[key], current_balance)
+                self.log(f"New initial balance set to: {self.format_amount(self.initial_balances[key], coin)}",
+                         event='baseline', coin=coin, initial_balance=self.initial_balances[key])
+                # Journaled only once the baseline is stored, so a journal failure can never repeat the transfer
+                self.record_transfer(account_uid, main_account_uid, transfer_amount, transfer_id=transfer_id,
+                                     coin=coin, value=transfer_value)
 
     def get_balance(self, session, account_uid):
         """Get account balance with test mode support"""
@@ -344,50 +1113,102 @@ class BybitMover:
             response = session.get_wallet_balance(accountType="UNIFIED", coin="USDT")
             return response
         except Exception as e:
-            print(f"Error getting balance for account {account_uid}: {str(e)}")
+            logger.error(f"Error getting balance for account {account_uid}: {str(e)}")
             return None
 
     def initialize_api_sessions(self):
-        """Initialize API sessions for all accounts"""
-        # Initialize main account session
-        main_account = self.config['accounts']['main_account']
-        self.api_sessions[main_account['api_key']] = HTTP(
+        """Build the account registry; API sessions are created lazily on first use"""
+        self.accounts = AccountRegistry(
+            self.config['accounts'],
+            self.create_session,
+            max_sessions=self.config.get('max_sessions', DEFAULT_MAX_SESSIONS)
+        )
+        if self.config.get('metrics', {}).get('account_labels', True):
+            self.gateway.account_label = self.metrics_account_label
+
+    def create_session(self, account_config):
+        """Create the API session for one account entry from the config"""
+        session = HTTP(
             testnet=False,
-            api_key=main_account['api_key'],
-            api_secret=main_account['api_secret']
+            api_key=account_config['api_key'],
+            api_secret=account_config['api_secret']
         )
+        api_endpoint = self.config.get('api_endpoint')
+        if api_endpoint:
+            # e.g. a local stand-in server for benchmarks
+            session.endpoint = api_endpoint.rstrip('/')
+        # Rate-limit and server errors are retried by the request gateway, not by pybit
+        session.retry_codes = {10002}
+        return session
 
-        # Initialize sub-account sessions
-        for sub_account in self.config['accounts']['sub_accounts']:
-            self.api_sessions[sub_account['api_key']] = HTTP(
-                testnet=False,
-                api_key=sub_account['api_key'],
-                api_secret=sub_account['api_secret']
-            )
+    def history_paths(self):
+        """Return the journals whose transfers this mover must know about"""
+        if self.worker_id is None:
+            return [self.journal.path]
+        # Accounts move between workers, so their transfers may be in any worker's journal
+        return [self.journal.path] + [path for path in [HISTORY_FILE] + shard_history_files()
+                                      if path != self.journal.path]
 
     def load_transfer_history(self):
-        """Load transfer history from file"""
-        try:
-            with open('transfer_history.json', 'r') as f:
-                self.transfer_history = json.load(f)
-        except FileNotFoundError:
-            print("Warning: transfer_history.json not found. Starting with empty history.")
+        """Load the transfers not yet sealed into monthly segments from the journals"""
+        transfer_history = []
+        for path in self.history_paths():
+            journal = self.journal if path == self.journal.path else TransferJournal(path, legacy_path=None)
+            transfer_history.extend(SegmentStore(path, self.segment_dir).unsealed(journal.read_all()))
+        with self.history_lock:
+            self.transfer_history = transfer_history
+        if not transfer_history:
+            logger.warning(f"No recent transfers found in {self.journal.path}. Starting with empty history.")
+
+    def transfer_recorded(self, transfer_id, since):
+        """Return True if a transfer is in the history; sealed segments are only opened from since on"""
+        with self.history_lock:
+            if any(t.get('transfer_id') == transfer_id for t in self.transfer_history):
+                return True
+        for path in self.history_paths():
+            store = SegmentStore(path, self.segment_dir)
+            for month, entry in store.load_index()['segments'].items():
+                if entry['last'] >= since and any(t.get('transfer_id') == transfer_id
+                                                  for t in store.read_segment(month)):
+                    return True
+        return False
+
+    def compact_history(self):
+        """Seal the transfers of completed months into compressed segments, once per month"""
+        month = datetime.now().strftime('%Y-%m')
+        if not self.history_compaction or month == self.compacted_month:
+            return
+        with self.history_lock:
+            if month == self.compacted_month:
+                return
+            sealed = self.journal.compact(SegmentStore(self.journal.path, self.segment_dir), month)
+            self.compacted_month = month
+            if sealed:
+                self.transfer_history = [t for t in self.transfer_history if month_key(t['timestamp']) >= month]
+                logger.info(f"Moved {sealed} transfers before {month} out of {self.journal.path}")
 
-    def record_transfer(self, from_account, to_account, amount):
-        """Record a transfer in the transfer history"""
+    def record_transfer(self, from_account, to_account, amount, transfer_id=None, coin=QUOTE_COIN, value=None):
+        """Record a transfer in the transfer history, logging rather than raising if the write fails"""
         transfer = {
             'from_account': from_account,
             'to_account': to_account,
             'amount': amount,
             'timestamp': datetime.now().isoformat()
         }
-        self.transfer_history.append(transfer)
-        self.save_transfer_history()
-
-    def save_transfer_history(self):
-        """Save transfer history to file"""
-        with open('transfer_history.json', 'w') as f:
-            json.dump(self.transfer_history, f)
+        if transfer_id is not None:
+            transfer['transfer_id'] = transfer_id
+        if coin != QUOTE_COIN:
+            transfer['coin'] = coin
+            if value is not None:
+                transfer['usdt_value'] = value
+        with self.history_lock:
+            self.transfer_history.append(transfer)
+        try:
+            # Returns once the record is on disk
+            self.history_writer.append(transfer)
+        except Exception as e:
+            self.log(f"Could not write transfer {transfer_id} to {self.journal.path}: {str(e)}",
+                     event='error', level=logging.ERROR, transfer_id=transfer_id)
 
     def parse_interval(self, interval):
         """Parse interval string into seconds"""
@@ -408,22 +1229,33 @@ def main():
     config_path = sys.argv[1] if len(sys.argv) > 1 else 'config.json'
     mover = BybitMover(config_path)
     
-    # Get interval in minutes
-    minutes = mover.get_interval_minutes()
+    # Schedule the profit processing on fixed interval boundaries
+    scheduler = mover.create_scheduler()
     
-    # Schedule the profit processing
-    schedule.every(minutes).minutes.do(mover.process_profits)
+    logger.info(f"BybitMover started. Checking every {mover.config['check_interval']}")
+    logger.info("Press Ctrl+C to stop")
     
-    print(f"BybitMover started. Checking every {mover.config['check_interval']}")
-    print("Press Ctrl+C to stop")
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        logger.info("Stopping BybitMover...")
+        scheduler.stop()
     
-    while True:
-        try:
-            schedule.run_pending()
-            time.sleep(1)
-        except KeyboardInterrupt:
-            print("\nStopping BybitMover...")
-            break
+    if mover.config_watcher is not None:
+        mover.config_watcher.stop()
+    if mover.stream is not None:
+        mover.stream.stop()
+    if mover.metrics_server is not None:
+        mover.metrics_server.stop()
+    if mover.coordinator is not None:
+        mover.coordinator.stop()
+    if mover.executor is not None:
+        mover.executor.shutdown(wait=True)
+    if mover.ingest_server is not None:
+        mover.ingest_server.stop()
+    mover.history_writer.stop()
+    mover.journal.close()
+    mover.state.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
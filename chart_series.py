@@ -0,0 +1,78 @@
+BUCKETS = ('hour', 'day')
+DEFAULT_BUCKET = 'day'
+DEFAULT_MAX_POINTS = 500
+
+
+def bucket_key(timestamp, bucket):
+    """Return the bucket label for an ISO timestamp"""
+    if bucket == 'day':
+        return timestamp[:10]
+    if bucket == 'hour':
+        return timestamp[:13].replace('T', ' ') + ':00'
+    raise ValueError(f"Unknown chart bucket: {bucket} (use one of {', '.join(BUCKETS)})")
+
+
+def lttb_indices(values, threshold):
+    """Pick `threshold` indices from a series with Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; in between, each bucket keeps the point
+    forming the largest triangle with the previously kept point and the average of the
+    next bucket, which preserves peaks and slope changes of the original shape.
+    """
+    count = len(values)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    every = (count - 2) / (threshold - 2)
+    indices = [0]
+    previous = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, count)
+        avg_x = (avg_start + avg_end - 1) / 2
+        avg_y = sum(values[avg_start:avg_end]) / (avg_end - avg_start)
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        previous_y = values[previous]
+        best_index, best_area = range_start, -1
+        for j in range(range_start, range_end):
+            area = abs((previous - avg_x) * (values[j] - previous_y) - (previous - j) * (avg_y - previous_y))
+            if area > best_area:
+                best_index, best_area = j, area
+        indices.append(best_index)
+        previous = best_index
+    indices.append(count - 1)
+    return indices
+
+
+def build_chart_series(bucket_totals, account_bucket_totals, max_points=DEFAULT_MAX_POINTS):
+    """Build cumulative main-account and per-sub-account series from bucketed totals.
+
+    bucket_totals maps bucket label -> amount transferred in that bucket, and
+    account_bucket_totals maps account -> {bucket label -> amount}. The main series is
+    downsampled to at most max_points with LTTB and the account series are sampled at
+    the same points so every dataset shares one set of labels.
+    """
+    labels = sorted(bucket_totals)
+    main_balance = []
+    running_total = 0
+    for label in labels:
+        running_total += bucket_totals[label]
+        main_balance.append(running_total)
+
+    accounts = {}
+    for account, totals in account_bucket_totals.items():
+        series = []
+        running_total = 0
+        for label in labels:
+            running_total += totals.get(label, 0)
+            series.append(running_total)
+        accounts[account] = series
+
+    indices = lttb_indices(main_balance, max_points) if max_points else list(range(len(labels)))
+    return {
+        'dates': [labels[i] for i in indices],
+        'main_balance': [main_balance[i] for i in indices],
+        'accounts': {account: [series[i] for i in indices] for account, series in accounts.items()}
+    }
@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+import threading
+
+from metrics import REGISTRY
+
+DEFAULT_POLL_SECONDS = 5
+# Settings that are only read at startup; a change to them takes effect after a restart
+RESTART_KEYS = ('test_mode', 'concurrency', 'multi_coin', 'history', 'logging', 'scheduler', 'rate_limits',
+                'streaming', 'metrics', 'ingest', 'sharding', 'api_endpoint', 'state_file', 'max_sessions',
+                'config_reload')
+
+CONFIG_RELOADS = REGISTRY.counter(
+    'bybit_mover_config_reloads_total', 'Edits of the config file, by whether they were applied or rejected',
+    ('result',))
+
+logger = logging.getLogger('BybitMover')
+
+
+def file_identity(path):
+    """Return an identity of a file that changes whenever it is edited or replaced, or None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def restart_required(old_config, new_config):
+    """Return the startup-only settings that differ between two configs"""
+    return [key for key in RESTART_KEYS if old_config.get(key) != new_config.get(key)]
+
+
+class ConfigWatcher:
+    """Hands every edited version of the config file to on_change(config) while the mover runs.
+
+    The file's inode, mtime and size are polled every poll_seconds, so in-place edits
+    and editors that replace the file are both noticed. A version that is not valid
+    JSON, or that on_change rejects with ValueError, KeyError or TypeError, is logged
+    and skipped: the running config stays in effect until the file changes again.
+    """
+
+    def __init__(self, path, on_change, poll_seconds=DEFAULT_POLL_SECONDS):
+        self.path = path
+        self.on_change = on_change
+        self.poll_seconds = poll_seconds
+        self.identity = file_identity(path)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='config-watcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def check(self):
+        """Reload the config if the file changed since the last check; returns True if a new version was applied"""
+        identity = file_identity(self.path)
+        if identity is None or identity == self.identity:
+            return False
+        self.identity = identity
+
+        try:
+            with open(self.path, 'r') as f:
+                config = json.load(f)
+            self.on_change(config)
+        except (ValueError, KeyError, TypeError) as e:
+            CONFIG_RELOADS.labels('rejected').inc()
+            logger.error(f"Ignoring the edited {self.path}, keeping the running config: {str(e)}",
+                         extra={'event': 'config_rejected'})
+            return False
+        CONFIG_RELOADS.labels('applied').inc()
+        return True
+
+    def _run(self):
+        while not self._stopped.wait(self.poll_seconds):
+            try:
+                self.check()
+            except Exception:
+                logger.exception(f"Error reloading {self.path}")
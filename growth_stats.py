@@ -0,0 +1,135 @@
+import math
+from datetime import date
+
+DEFAULT_WINDOWS = (7, 30, 90)
+DEFAULT_EWMA_SPAN_DAYS = 14
+DEFAULT_PROJECTION_DAYS = 30
+# Width of the projection band in standard deviations (~95% for normally distributed days)
+BAND_Z = 1.96
+
+
+def day_number(timestamp):
+    """Return the proleptic ordinal of the calendar day of an ISO timestamp"""
+    return date.fromisoformat(timestamp[:10]).toordinal()
+
+
+class SeriesStats:
+    """Daily transfer totals of one series (all accounts, or one sub-account).
+
+    Days without transfers count as zero. The EWMA of daily totals is kept as of the
+    latest day seen and decayed on demand, and a transfer for an earlier day is folded
+    in with the weight it would have had, so every add() is O(1) in any order.
+    """
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.daily = {}
+        self.total = 0.0
+        self.first_day = None
+        self.ewma = 0.0
+        self.ewma_day = None
+
+    def add(self, day, amount):
+        self.daily[day] = self.daily.get(day, 0.0) + amount
+        self.total += amount
+        if self.first_day is None or day < self.first_day:
+            self.first_day = day
+
+        decay = 1 - self.alpha
+        if self.ewma_day is None:
+            self.ewma_day = day
+        if day > self.ewma_day:
+            self.ewma *= decay ** (day - self.ewma_day)
+            self.ewma_day = day
+        self.ewma += self.alpha * amount * decay ** (self.ewma_day - day)
+
+    def days_active(self, today):
+        """Return the number of calendar days from the first transfer up to today"""
+        if self.first_day is None or today < self.first_day:
+            return 0
+        return today - self.first_day + 1
+
+    def window(self, today, days):
+        """Return (mean, sample variance, days) of daily totals over the last days up to today.
+
+        The window is shortened to the days since the first transfer, so a young
+        account is not averaged against days before it existed.
+        """
+        days = min(days, self.days_active(today))
+        if days == 0:
+            return 0.0, 0.0, 0
+        values = [self.daily.get(day, 0.0) for day in range(today - days + 1, today + 1)]
+        mean = sum(values) / days
+        variance = sum((value - mean) ** 2 for value in values) / (days - 1) if days > 1 else 0.0
+        return mean, variance, days
+
+    def ewma_at(self, today):
+        """Return the EWMA of daily totals as of today, corrected for the zero start value"""
+        days = self.days_active(today)
+        if days == 0:
+            return 0.0
+        decay = 1 - self.alpha
+        value = self.ewma * decay ** max(today - self.ewma_day, 0)
+        return value / (1 - decay ** days)
+
+
+class GrowthStats:
+    """Rolling growth statistics over the transfer history, overall and per sub-account.
+
+    add() folds in one transfer in O(1). summary() reads at most max(windows) daily
+    buckets per series, however long the history is.
+    """
+
+    def __init__(self, windows=DEFAULT_WINDOWS, ewma_span_days=DEFAULT_EWMA_SPAN_DAYS,
+                 projection_days=DEFAULT_PROJECTION_DAYS):
+        self.windows = tuple(sorted(windows))
+        self.projection_days = projection_days
+        self.alpha = 2 / (ewma_span_days + 1)
+        self.overall = SeriesStats(self.alpha)
+        self.accounts = {}
+
+    def add(self, timestamp, account, amount):
+        day = day_number(timestamp)
+        self.overall.add(day, amount)
+        series = self.accounts.get(account)
+        if series is None:
+            series = self.accounts[account] = SeriesStats(self.alpha)
+        series.add(day, amount)
+
+    def series_summary(self, series, today):
+        """Return the statistics of one series as a JSON-serializable dict"""
+        rolling = {}
+        for days in self.windows:
+            mean, _, _ = series.window(today, days)
+            rolling[f'{days}d'] = mean
+
+        # Project the recent mean forward; the band assumes independent days, so it widens with sqrt(days)
+        mean, variance, window_days = series.window(today, self.projection_days)
+        expected = mean * self.projection_days
+        spread = BAND_Z * math.sqrt(variance * self.projection_days)
+        return {
+            'total': series.total,
+            'days_active': series.days_active(today),
+            'rolling_mean': rolling,
+            'ewma': series.ewma_at(today),
+            'projection': {
+                'days': self.projection_days,
+                'based_on_days': window_days,
+                'expected': expected,
+                'low': max(expected - spread, 0.0),
+                'high': expected + spread,
+                'daily_std': math.sqrt(variance)
+            }
+        }
+
+    def summary(self, today=None):
+        """Return overall and per-account statistics as of today (defaults to the current date)"""
+        today = (today or date.today()).toordinal()
+        return {
+            'as_of': date.fromordinal(today).isoformat(),
+            'overall': self.series_summary(self.overall, today),
+            'accounts': {
+                account: self.series_summary(series, today)
+                for account, series in sorted(self.accounts.items())
+            }
+        }
@@ -0,0 +1,356 @@
+import bisect
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from chart_series import BUCKETS, DEFAULT_MAX_POINTS, bucket_key, build_chart_series
+from growth_stats import GrowthStats
+from history_segments import SegmentStore, SEGMENT_DIR, month_key, overlaps
+from transfer_journal import TransferJournal, transfer_value
+
+# Sealed months whose transfers are kept in memory for paging
+SEGMENT_CACHE_SIZE = 4
+
+
+class HistoryAggregates:
+    """Dashboard aggregates over the transfer journal, maintained incrementally.
+
+    The cache remembers how far into the journal it has read. refresh() stats the file
+    and folds in only the records appended since the last call, so the cost of a page
+    view depends on the number of new transfers rather than the size of the history.
+    If the journal is replaced or truncated the cache is rebuilt from scratch.
+
+    discover_journals, if given, returns the paths of further journals (the per-worker
+    journals of sharded movers); they are picked up as they appear and merged into one
+    history ordered by timestamp. growth_options are passed on to GrowthStats.
+
+    Months sealed into compressed segments (see history_segments) are folded in from
+    the segment index alone: its per-account daily totals feed the totals, daily chart
+    and growth statistics. Segments are only opened for what the index cannot answer,
+    i.e. the hourly chart and paging back into a sealed month.
+    """
+
+    def __init__(self, journal, discover_journals=None, growth_options=None, segment_dir=SEGMENT_DIR):
+        self.journal = journal
+        self.discover_journals = discover_journals
+        self.growth_options = growth_options or {}
+        self.segment_dir = segment_dir
+        self.journals = {journal.path: journal}
+        self.stores = {journal.path: SegmentStore(journal.path, segment_dir)}
+        self._lock = threading.Lock()
+        # Bumped whenever the aggregates change, including rebuilds, so it can key caches and ETags
+        self.version = 0
+        self.rebuilds = -1
+        self._reset()
+
+    def _reset(self):
+        # Read position per journal path: (file_id, byte offset)
+        self.positions = {}
+        self.version += 1
+        self.rebuilds += 1
+        self.transfers = []
+        self.main_account_total = 0.0
+        self.sub_account_totals = {}
+        # Transfers kept sorted by (timestamp, seq), where seq is the position in self.transfers
+        self._keys = []
+        self._account_keys = {}
+        # Chart buckets per granularity, overall and per sub-account
+        self._bucket_totals = {bucket: {} for bucket in BUCKETS}
+        self._account_bucket_totals = {bucket: {} for bucket in BUCKETS}
+        self._chart_cache = {}
+        self.growth = GrowthStats(**self.growth_options)
+        self._growth_cache = None
+        # Segment index identity per journal path, and the sealed months: {month: [(store, entry)]}
+        self.index_stats = {}
+        self.sealed = {}
+        self.sealed_count = 0
+        self.sealed_last = None
+        self._sealed_hours = False
+        self._month_cache = OrderedDict()
+
+    def refresh(self):
+        """Fold any newly appended journal records into the aggregates"""
+        with self._lock:
+            if self.discover_journals is not None:
+                for path in self.discover_journals():
+                    if path not in self.journals:
+                        self.journals[path] = TransferJournal(path, legacy_path=None)
+                        self.stores[path] = SegmentStore(path, self.segment_dir)
+
+            stats = {}
+            for path in self.journals:
+                try:
+                    stats[path] = os.stat(path)
+                except FileNotFoundError:
+                    stats[path] = None
+
+            index_stats = {path: store.index_stat() for path, store in self.stores.items()}
+
+            # A journal that was replaced, truncated or removed invalidates everything read so far,
+            # and so does a rewritten segment index (a compaction moved transfers into segments)
+            if any(self.index_stats[path] != index_stats[path] for path in self.index_stats):
+                self._reset()
+            for path, (file_id, offset) in self.positions.items():
+                stat = stats[path]
+                if stat is None or (stat.st_dev, stat.st_ino) != file_id or stat.st_size < offset:
+                    self._reset()
+                    break
+
+            changed = False
+            for path, store in self.stores.items():
+                if path not in self.index_stats:
+                    self.index_stats[path] = index_stats[path]
+                    for month, entry in store.load_index()['segments'].items():
+                        self._add_segment(store, month, entry)
+                    changed = True
+
+            for path, journal in self.journals.items():
+                stat = stats[path]
+                if stat is None:
+                    continue
+                file_id = (stat.st_dev, stat.st_ino)
+                offset = self.positions.get(path, (file_id, 0))[1]
+                if stat.st_size > offset:
+                    new_transfers, offset = journal.read_from(offset)
+                    # Records of sealed months are already counted from the segment index
+                    new_transfers = self.stores[path].unsealed(new_transfers)
+                    for transfer in new_transfers:
+                        self._add(transfer)
+                    changed = changed or bool(new_transfers)
+                self.positions[path] = (file_id, offset)
+            if changed:
+                self.version += 1
+
+    def _add(self, transfer):
+        amount = transfer_value(transfer)
+        from_account = transfer['from_account']
+        timestamp = transfer['timestamp']
+
+        seq = len(self.transfers)
+        key = (timestamp, seq)
+        self.transfers.append(transfer)
+        self.main_account_total += amount
+        self.sub_account_totals[from_account] = self.sub_account_totals.get(from_account, 0) + amount
+
+        for keys in (self._keys, self._account_keys.setdefault(from_account, [])):
+            if not keys or key > keys[-1]:
+                keys.append(key)  # Common case: transfers arrive in time order
+            else:
+                bisect.insort(keys, key)
+
+        self.growth.add(timestamp, from_account, amount)
+        # A straggler from a month that is otherwise sealed is paged together with that month
+        self._month_cache.pop(month_key(timestamp), None)
+
+        for bucket in BUCKETS:
+            self._add_bucket(bucket, bucket_key(timestamp, bucket), from_account, amount)
+
+    def _add_bucket(self, bucket, label, account, amount):
+        totals = self._bucket_totals[bucket]
+        totals[label] = totals.get(label, 0) + amount
+        account_totals = self._account_bucket_totals[bucket].setdefault(account, {})
+        account_totals[label] = account_totals.get(label, 0) + amount
+
+    def _add_segment(self, store, month, entry):
+        """Fold the index summary of one sealed segment into the aggregates"""
+        self.sealed.setdefault(month, []).append((store, entry))
+        self.sealed_count += entry['count']
+        self.main_account_total += entry['total']
+        if entry['last'] and (self.sealed_last is None or entry['last'] > self.sealed_last):
+            self.sealed_last = entry['last']
+        for account, summary in entry['accounts'].items():
+            self.sub_account_totals[account] = self.sub_account_totals.get(account, 0) + summary['total']
+            for day, amount in summary['daily'].items():
+                self.growth.add(day, account, amount)
+                self._add_bucket('day', day, account, amount)
+
+    def _load_sealed_hours(self):
+        """Fold the hourly totals of sealed months in; the index only has daily ones, so this opens every segment"""
+        for month, segments in self.sealed.items():
+            for store, _ in segments:
+                for transfer in store.read_segment(month):
+                    self._add_bucket('hour', bucket_key(transfer['timestamp'], 'hour'),
+                                     transfer['from_account'], transfer_value(transfer))
+        self._sealed_hours = True
+
+    def totals(self):
+        """Return (main_account_total, sub_account_totals): the total sent to the main account and by each sub-account"""
+        with self._lock:
+            return self.main_account_total, dict(self.sub_account_totals)
+
+    def growth_stats(self, today=None):
+        """Return rolling means, EWMA and projection bands overall and per sub-account.
+
+        The result is reused until the history changes or the day rolls over.
+        """
+        with self._lock:
+            cache_key = (self.version, today or date.today())
+            if self._growth_cache is not None and self._growth_cache[0] == cache_key:
+                return self._growth_cache[1]
+            stats = self.growth.summary(cache_key[1])
+            self._growth_cache = (cache_key, stats)
+            return stats
+
+    def chart_data(self, bucket='day', max_points=DEFAULT_MAX_POINTS):
+        """Return the growth series bucketed by hour or day and downsampled to max_points.
+
+        The result is built from the bucket totals, so its cost is bounded by the number
+        of buckets rather than transfers, and it is reused until the history changes.
+        """
+        if bucket not in BUCKETS:
+            raise ValueError(f"Unknown chart bucket: {bucket} (use one of {', '.join(BUCKETS)})")
+        with self._lock:
+            cache_key = (bucket, max_points)
+            cached = self._chart_cache.get(cache_key)
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+            if bucket == 'hour' and not self._sealed_hours:
+                self._load_sealed_hours()
+            chart = build_chart_series(
+                self._bucket_totals[bucket],
+                self._account_bucket_totals[bucket],
+                max_points
+            )
+            self._chart_cache[cache_key] = (self.version, chart)
+            return chart
+
+    def count(self):
+        """Return the number of transfers in the history"""
+        with self._lock:
+            return self.sealed_count + len(self.transfers)
+
+    def position(self):
+        """Return a stream position marking the transfers seen so far, for transfers_since().
+
+        Positions count the transfers read from the journals, not the sealed ones; a
+        compaction rebuilds the history, which invalidates older positions.
+        """
+        with self._lock:
+            return f"{self.rebuilds}-{len(self.transfers)}"
+
+    def transfers_since(self, position):
+        """Return (transfers added after a stream position, current position).
+
+        The transfers are in the order they were read. If the history was rebuilt since
+        the position was taken, None is returned instead of the transfers.
+        """
+        rebuilds, _, count = position.partition('-')
+        with self._lock:
+            current = f"{self.rebuilds}-{len(self.transfers)}"
+            if rebuilds != str(self.rebuilds) or not count.isdigit() or int(count) > len(self.transfers):
+                return None, current
+            return self.transfers[int(count):], current
+
+    def latest_timestamp(self):
+        """Return the timestamp of the most recent transfer, or None"""
+        with self._lock:
+            return max(filter(None, [self._keys[-1][0] if self._keys else None, self.sealed_last]), default=None)
+
+    def page(self, cursor=None, limit=50, account=None, start=None, end=None, min_amount=None):
+        """Return (transfers, next_cursor) for one page of history, newest first.
+
+        cursor is the value returned as next_cursor by the previous page. start and end
+        are ISO dates or timestamps; a bare end date includes the whole day.
+
+        Transfers newer than the sealed months are paged from memory. Older pages go
+        through the sealed months one by one, opening a month's segments only when the
+        page reaches it and the index shows it overlaps start/end and has transfers of
+        the account.
+        """
+        end_bound = None
+        if end:
+            end_bound = end + 'T\uffff' if 'T' not in end else end + '\uffff'
+        with self._lock:
+            newest_sealed = max(self.sealed) if self.sealed else None
+            page = []
+            if cursor is None or ':' not in cursor:
+                keys = self._account_keys.get(account, []) if account is not None else self._keys
+                low = bisect.bisect_left(keys, (start,)) if start else 0
+                if newest_sealed is not None:
+                    low = max(low, bisect.bisect_left(keys, (newest_sealed + '\uffff',)))
+                high = len(keys)
+                if end_bound:
+                    high = bisect.bisect_left(keys, (end_bound,))
+                if cursor is not None:
+                    if not cursor.isdigit() or int(cursor) >= len(self.transfers):
+                        raise ValueError("Invalid cursor")
+                    seq = int(cursor)
+                    high = min(high, bisect.bisect_left(keys, (self.transfers[seq]['timestamp'], seq)))
+
+                index = high - 1
+                while index >= low and len(page) < limit:
+                    seq = keys[index][1]
+                    transfer = self.transfers[seq]
+                    if min_amount is None or transfer_value(transfer) >= min_amount:
+                        page.append(transfer)
+                    index -= 1
+                if index >= low and page:
+                    return page, str(keys[index + 1][1])
+                cursor_month, position = None, None
+            else:
+                cursor_month, _, position = cursor.partition(':')
+                if not re.fullmatch(r'\d{4}-\d{2}', cursor_month) or not (position == '' or position.isdigit()):
+                    raise ValueError("Invalid cursor")
+
+            # Continue with the sealed months, newest first
+            months = self._page_months(account, start, end_bound, newest_sealed)
+            if cursor_month is not None:
+                months = [month for month in months if month <= cursor_month]
+            for number, month in enumerate(months):
+                if len(page) == limit:
+                    return page, f"{month}:"
+                transfers = self._month_transfers(month)
+                index = len(transfers)
+                if month == cursor_month and position:
+                    index = int(position)
+                    if index > len(transfers):
+                        raise ValueError("Invalid cursor")
+                while index > 0 and len(page) < limit:
+                    index -= 1
+                    transfer = transfers[index]
+                    if ((account is None or transfer['from_account'] == account)
+                            and (not start or transfer['timestamp'] >= start)
+                            and (not end_bound or transfer['timestamp'] < end_bound)
+                            and (min_amount is None or transfer_value(transfer) >= min_amount)):
+                        page.append(transfer)
+                if len(page) == limit:
+                    if index > 0:
+                        return page, f"{month}:{index}"
+                    if number + 1 < len(months):
+                        return page, f"{months[number + 1]}:"
+            return page, None
+
+    def _page_months(self, account, start, end_bound, newest_sealed):
+        """Return the months up to the newest sealed one that may hold matching transfers, newest first"""
+        if newest_sealed is None:
+            return []
+        months = set()
+        for month, segments in self.sealed.items():
+            if any(overlaps(entry, start, end_bound) and (account is None or account in entry['accounts'])
+                   for _, entry in segments):
+                months.add(month)
+        # Journal records of those months, from a worker that has not compacted its journal yet
+        keys = self._account_keys.get(account, []) if account is not None else self._keys
+        for timestamp, _ in keys[:bisect.bisect_left(keys, (newest_sealed + '\uffff',))]:
+            months.add(month_key(timestamp))
+        return sorted(months, reverse=True)
+
+    def _month_transfers(self, month):
+        """Return every transfer of a month up to the newest sealed one, in time order"""
+        transfers = self._month_cache.get(month)
+        if transfers is None:
+            transfers = []
+            for store, _ in self.sealed.get(month, []):
+                transfers.extend(store.read_segment(month))
+            low = bisect.bisect_left(self._keys, (month,))
+            high = bisect.bisect_left(self._keys, (month + '\uffff',))
+            transfers.extend(self.transfers[seq] for _, seq in self._keys[low:high])
+            transfers.sort(key=lambda transfer: transfer['timestamp'])
+            self._month_cache[month] = transfers
+            if len(self._month_cache) > SEGMENT_CACHE_SIZE:
+                self._month_cache.popitem(last=False)
+        else:
+            self._month_cache.move_to_end(month)
+        return transfers
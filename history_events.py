@@ -0,0 +1,136 @@
+import json
+import logging
+import queue
+import threading
+
+# Poll the journals this often for transfers written by other processes
+DEFAULT_POLL_SECONDS = 1.0
+# Send a comment line this often so proxies keep idle streams open and dead clients are noticed
+DEFAULT_KEEPALIVE_SECONDS = 15.0
+# Events buffered per client before it is considered stuck and told to reload instead
+DEFAULT_MAX_QUEUE = 100
+# A client this far behind reloads the page instead of replaying every transfer
+DEFAULT_MAX_TRANSFERS = 500
+
+logger = logging.getLogger('WebInterface')
+
+
+def format_event(event, data, event_id=None):
+    """Return one Server-Sent Event as text"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class HistoryBroadcaster:
+    """Pushes transfer history changes to Server-Sent Event streams.
+
+    One background thread refreshes the history every poll_seconds (a stat per journal
+    while nothing changes) and, when transfers were added, publishes a single 'update'
+    event to every connected client, built by build_update(transfers, start) where
+    start is the number of transfers the client had before. Every client gets the
+    same event, so the cost of a new transfer does not grow with the number of open
+    dashboards. notify() wakes the thread early for transfers written in-process.
+
+    Event ids are history positions, so a client that reconnects with Last-Event-ID
+    is sent just the transfers it missed. If the history was rebuilt, or the client
+    fell too far behind, it gets a 'reset' event and reloads instead.
+    """
+
+    def __init__(self, history, build_update, poll_seconds=DEFAULT_POLL_SECONDS,
+                 keepalive_seconds=DEFAULT_KEEPALIVE_SECONDS, max_queue=DEFAULT_MAX_QUEUE,
+                 max_transfers=DEFAULT_MAX_TRANSFERS):
+        self.history = history
+        self.build_update = build_update
+        self.poll_seconds = poll_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self.max_queue = max_queue
+        self.max_transfers = max_transfers
+        self.position = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the polling thread unless it is already running"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.history.refresh()
+            self.position = self.history.position()
+            self._thread = threading.Thread(target=self._run, name='history-events', daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """Check for new transfers now instead of at the next poll"""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Error publishing transfer history updates")
+
+    def check(self):
+        """Publish the transfers added since the last check, if any"""
+        self.history.refresh()
+        previous = self.position
+        event = self.event_since(previous)
+        if event is None:
+            return
+        self.position = event[0]
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for events in subscribers:
+            self._put(events, event)
+
+    def event_since(self, position):
+        """Return the (id, event, data) bringing a client at position up to date, or None"""
+        transfers, current = self.history.transfers_since(position)
+        if current == position:
+            return None
+        if transfers is None or len(transfers) > self.max_transfers:
+            return current, 'reset', {}
+        start = int(current.partition('-')[2]) - len(transfers)
+        return current, 'update', self.build_update(transfers, start)
+
+    def _put(self, events, event):
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            # The client stopped reading; drop its backlog and make it reload when it resumes
+            while not events.empty():
+                try:
+                    events.get_nowait()
+                except queue.Empty:
+                    break
+            events.put_nowait((event[0], 'reset', {}))
+
+    def stream(self, since=None):
+        """Yield Server-Sent Events for one client, starting after the position since"""
+        self.start()
+        events = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add(events)
+        try:
+            if since:
+                catch_up = self.event_since(since)
+                if catch_up is not None:
+                    self._put(events, catch_up)
+            while True:
+                try:
+                    event_id, event, data = events.get(timeout=self.keepalive_seconds)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_event(event, data, event_id)
+        finally:
+            with self._lock:
+                self._subscribers.discard(events)
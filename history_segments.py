@@ -0,0 +1,163 @@
+import gzip
+import json
+import logging
+import os
+
+from transfer_journal import TransferJournal, month_key, transfer_value
+
+SEGMENT_DIR = 'history_segments'
+
+logger = logging.getLogger('BybitMover')
+
+
+def record_key(transfer):
+    """Return what identifies a transfer record: its transfer_id, or the whole record if it has none"""
+    return transfer.get('transfer_id') or json.dumps(transfer, sort_keys=True)
+
+
+def summarize(transfers):
+    """Return the index entry of a segment: count, time bounds and totals per account and day"""
+    entry = {'count': len(transfers), 'first': None, 'last': None, 'total': 0.0, 'accounts': {}}
+    for transfer in transfers:
+        timestamp = transfer['timestamp']
+        amount = transfer_value(transfer)
+        if entry['first'] is None or timestamp < entry['first']:
+            entry['first'] = timestamp
+        if entry['last'] is None or timestamp > entry['last']:
+            entry['last'] = timestamp
+        entry['total'] += amount
+        account = entry['accounts'].setdefault(transfer['from_account'], {'count': 0, 'total': 0.0, 'daily': {}})
+        account['count'] += 1
+        account['total'] += amount
+        day = timestamp[:10]
+        account['daily'][day] = account['daily'].get(day, 0.0) + amount
+    return entry
+
+
+def overlaps(entry, start=None, end=None):
+    """Return True if a segment's time bounds overlap start <= timestamp < end"""
+    return not ((start and entry['last'] < start) or (end and entry['first'] >= end))
+
+
+def _write_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SegmentStore:
+    """Completed months of one transfer journal, as gzip-compressed JSONL segments plus a summary index.
+
+    Each segment holds the transfers of one calendar month. The index is one small JSON
+    file with, per segment, its transfer count, first and last timestamp and totals per
+    account and day, so totals, daily charts and growth statistics never open a segment
+    and a date range query only opens the months it overlaps.
+
+    sealed_through in the index is the newest sealed month. A journal record of a sealed
+    month is either already in its segment, when a compaction was interrupted before the
+    journal was rewritten, or arrived late, e.g. a sweep that started before midnight.
+    unsealed() drops the former and keeps the latter until the next compaction seals it.
+    """
+
+    def __init__(self, journal_path, directory=SEGMENT_DIR):
+        self.directory = directory
+        self.name = os.path.splitext(os.path.basename(journal_path))[0]
+        self.index_path = os.path.join(directory, f"{self.name}.index.json")
+        self._index = None
+        self._index_stat = None
+
+    def segment_path(self, month):
+        return os.path.join(self.directory, f"{self.name}.{month}.jsonl.gz")
+
+    def index_stat(self):
+        """Return an identity of the index file that changes whenever it is rewritten, or None"""
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def load_index(self):
+        """Return the index: {'sealed_through': month or None, 'segments': {month: entry}}"""
+        stat = self.index_stat()
+        if self._index is None or stat != self._index_stat:
+            if stat is None:
+                self._index = {'sealed_through': None, 'segments': {}}
+            else:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            self._index_stat = stat
+        return self._index
+
+    def unsealed(self, transfers):
+        """Return the journal records that are not in a sealed segment yet; only months with such records are opened"""
+        sealed_through = self.load_index()['sealed_through']
+        if sealed_through is None:
+            return transfers
+        sealed_keys = {}
+        result = []
+        for transfer in transfers:
+            month = month_key(transfer['timestamp'])
+            if month <= sealed_through:
+                if month not in sealed_keys:
+                    sealed_keys[month] = {record_key(record) for record in self.read_segment(month)}
+                if record_key(transfer) in sealed_keys[month]:
+                    continue
+            result.append(transfer)
+        return result
+
+    def read_segment(self, month):
+        """Return the transfers of one sealed month in time order"""
+        try:
+            with gzip.open(self.segment_path(month), 'rt', encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def read_range(self, start=None, end=None):
+        """Return the sealed transfers with start <= timestamp < end, opening only the overlapping segments"""
+        transfers = []
+        for month, entry in sorted(self.load_index()['segments'].items()):
+            if overlaps(entry, start, end):
+                transfers.extend(transfer for transfer in self.read_segment(month)
+                                 if (not start or transfer['timestamp'] >= start)
+                                 and (not end or transfer['timestamp'] < end))
+        return transfers
+
+    def seal(self, transfers):
+        """Write transfers of completed months into their segments and update the index.
+
+        A month that already has a segment is merged with it, skipping records it already
+        holds, so sealing the same records again after an interrupted run is harmless.
+        """
+        by_month = {}
+        for transfer in transfers:
+            by_month.setdefault(month_key(transfer['timestamp']), []).append(transfer)
+
+        os.makedirs(self.directory, exist_ok=True)
+        index = self.load_index()
+        index = {'sealed_through': index['sealed_through'], 'segments': dict(index['segments'])}
+        for month, records in sorted(by_month.items()):
+            existing = self.read_segment(month)
+            seen = {record_key(transfer) for transfer in existing}
+            merged = existing + [transfer for transfer in records if record_key(transfer) not in seen]
+            merged.sort(key=lambda transfer: transfer['timestamp'])
+            data = ''.join(json.dumps(transfer) + '\n' for transfer in merged).encode('utf-8')
+            _write_atomic(self.segment_path(month), gzip.compress(data))
+            index['segments'][month] = summarize(merged)
+
+        index['sealed_through'] = max(filter(None, [index['sealed_through']] + list(by_month)))
+        _write_atomic(self.index_path, json.dumps(index, sort_keys=True).encode('utf-8'))
+        logger.info(f"Sealed {len(transfers)} transfers of {self.name} into {len(by_month)} monthly segments")
+
+
+def read_history(journal_path, directory=SEGMENT_DIR, start=None, end=None):
+    """Return the transfers of a journal and its sealed segments with start <= timestamp < end"""
+    store = SegmentStore(journal_path, directory)
+    transfers = store.read_range(start, end)
+    transfers.extend(transfer for transfer in store.unsealed(TransferJournal(journal_path, legacy_path=None).read_all())
+                     if (not start or transfer['timestamp'] >= start) and (not end or transfer['timestamp'] < end))
+    return transfers
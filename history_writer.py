@@ -0,0 +1,235 @@
+import json
+import logging
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import REGISTRY
+
+DEFAULT_INGEST_PORT = 9102
+# Most records written and acknowledged with a single fsync
+DEFAULT_MAX_BATCH = 256
+# How long a writer waits for its records to be acknowledged
+DEFAULT_ACK_TIMEOUT = 10.0
+REQUIRED_FIELDS = ('from_account', 'to_account', 'amount', 'timestamp')
+
+COMMIT_BATCH_SIZE = REGISTRY.histogram(
+    'bybit_mover_history_commit_batch_size', 'Transfer records written per group commit',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250))
+COMMIT_DURATION = REGISTRY.histogram(
+    'bybit_mover_history_commit_duration_seconds', 'Time to write and fsync one group commit',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+
+logger = logging.getLogger('BybitMover')
+
+
+class HistoryWriter:
+    """The single writer of a transfer journal, committing records in groups.
+
+    submit() queues a record and returns a Future that completes once the record is on
+    disk. The writer thread takes every record queued so far (up to max_batch), appends
+    them and syncs the journal once, then completes all their futures. Records arriving
+    during an fsync form the next group, so concurrent writers share one fsync instead
+    of each paying for their own.
+    """
+
+    def __init__(self, journal, max_batch=DEFAULT_MAX_BATCH):
+        self.journal = journal
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, transfer):
+        """Queue one transfer record and return a Future resolved when it is durable"""
+        future = Future()
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("History writer is stopped")
+            self._queue.put((transfer, future))
+        return future
+
+    def append(self, transfer, timeout=DEFAULT_ACK_TIMEOUT):
+        """Write one transfer record and wait until it is durable"""
+        self.submit(transfer).result(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            # None is the stop marker; everything queued before it is still committed
+            stopping = item is None
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        try:
+            self.journal.append_batch([transfer for transfer, _ in batch])
+        except Exception as e:
+            logger.exception(f"Failed to commit {len(batch)} transfer records")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        COMMIT_DURATION.observe(time.perf_counter() - started)
+        COMMIT_BATCH_SIZE.observe(len(batch))
+        for _, future in batch:
+            future.set_result(None)
+
+    def stop(self):
+        """Commit the records queued so far and stop the writer thread"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._queue.put(None)
+        self._thread.join()
+
+
+class IngestHandler(socketserver.StreamRequestHandler):
+    """One JSON request per line: a transfer record or a list of them; replies {"ok": ...} once all are durable"""
+
+    # Replies are small and latency bound
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.connections_lock:
+            self.server.connections.add(self.request)
+
+    def finish(self):
+        with self.server.connections_lock:
+            self.server.connections.discard(self.request)
+        super().finish()
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                transfers = request if isinstance(request, list) else [request]
+                for transfer in transfers:
+                    missing = [field for field in REQUIRED_FIELDS if field not in transfer]
+                    if missing:
+                        raise ValueError(f"Transfer record is missing {', '.join(missing)}")
+                futures = [self.server.writer.submit(transfer) for transfer in transfers]
+                for future in futures:
+                    future.result(self.server.ack_timeout)
+                reply = {'ok': True, 'count': len(transfers)}
+            except Exception as e:
+                reply = {'ok': False, 'error': str(e)}
+            self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+
+
+class IngestTCPServer(socketserver.ThreadingTCPServer):
+    # Let a restarted mover bind the port again right away
+    allow_reuse_address = True
+    daemon_threads = True
+    # The default listen backlog of 5 makes further simultaneous connects wait for a SYN retry
+    request_queue_size = 64
+
+
+class IngestServer:
+    """Accepts transfer records from other local processes on a TCP socket and hands them to a HistoryWriter"""
+
+    def __init__(self, writer, host='127.0.0.1', port=DEFAULT_INGEST_PORT, ack_timeout=DEFAULT_ACK_TIMEOUT):
+        self.server = IngestTCPServer((host, port), IngestHandler)
+        self.server.writer = writer
+        self.server.ack_timeout = ack_timeout
+        self.server.connections = set()
+        self.server.connections_lock = threading.Lock()
+        self._thread = threading.Thread(target=self.server.serve_forever, name='history-ingest', daemon=True)
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop accepting records and close the open client connections"""
+        self.server.shutdown()
+        self.server.server_close()
+        with self.server.connections_lock:
+            connections = list(self.server.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class IngestClient:
+    """Sends transfer records to the IngestServer of a running mover and waits for them to be durable.
+
+    Raises OSError if no server is reachable and RuntimeError if it rejected the records.
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_INGEST_PORT, timeout=DEFAULT_ACK_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._socket = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def append(self, transfer):
+        """Write one transfer record through the server"""
+        self.append_many([transfer])
+
+    def append_many(self, transfers):
+        """Write several transfer records through the server, acknowledged together"""
+        request = (json.dumps(transfers) + '\n').encode('utf-8')
+        with self._lock:
+            reply = self._request(request)
+        if not reply.get('ok'):
+            raise RuntimeError(f"History writer rejected the transfer: {reply.get('error')}")
+
+    def _request(self, request):
+        # A kept-alive connection may have been closed by a restarted server; retry once on a new one.
+        # A timeout is never retried, as the records may have been written without the reply arriving.
+        while True:
+            reused = self._socket is not None
+            try:
+                if self._socket is None:
+                    self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                    self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self._reader = self._socket.makefile('rb')
+                self._socket.sendall(request)
+                line = self._reader.readline()
+                if not line:
+                    raise ConnectionError("History writer closed the connection")
+                return json.loads(line)
+            except socket.timeout:
+                self.close()
+                raise
+            except OSError:
+                self.close()
+                if not reused:
+                    raise
+
+    def close(self):
+        if self._socket is not None:
+            self._reader.close()
+            self._socket.close()
+            self._socket = None
+            self._reader = None
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""Offline simulator for the profit sweep rules.
+
+Replays recorded or synthetic balance paths for many sub-accounts through the same
+rules as BybitMover.process_account, for every combination of profit_percentage,
+min_profit_threshold, min_remaining_balance, margin limit and check_interval at once.
+All scenarios and accounts are simulated together as NumPy arrays, so a grid of
+thousands of parameter combinations runs in seconds.
+
+Example:
+    python policy_simulator.py --accounts 50 --days 30 \\
+        --profit-percentage 25 50 75 --min-profit-threshold 1 5 10 \\
+        --min-remaining-balance 25 50 --check-interval 5m 1h 4h
+"""
+import argparse
+import csv
+import itertools
+import json
+import re
+from datetime import datetime
+
+import numpy as np
+
+from history_segments import SEGMENT_DIR, read_history
+from transfer_journal import transfer_value
+
+PARAMETERS = ('profit_percentage', 'min_profit_threshold', 'min_remaining_balance', 'max_margin', 'check_steps')
+
+
+def parse_interval_seconds(interval):
+    """Parse an interval string like '5m', '2h' or '1d' into seconds"""
+    match = re.match(r'^(\d+)([smhd])$', interval)
+    if not match:
+        raise ValueError(f"Invalid interval: {interval} (use e.g. '30s', '5m', '2h' or '1d')")
+    return int(match.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+
+
+def parameter_grid(profit_percentage, min_profit_threshold, min_remaining_balance, check_steps,
+                   max_margin=(None,)):
+    """Return the cartesian product of the parameter lists as a dict of equal-length arrays.
+
+    A max_margin of None disables the margin check for that scenario (stored as NaN).
+    """
+    combinations = list(itertools.product(
+        profit_percentage, min_profit_threshold, min_remaining_balance, max_margin, check_steps
+    ))
+    columns = list(zip(*combinations))
+    grid = {name: np.array(column, dtype=float) for name, column in zip(PARAMETERS, columns)}
+    grid['max_margin'] = np.array([np.nan if value is None else value for value in columns[3]], dtype=float)
+    grid['check_steps'] = np.array(columns[4], dtype=int)
+    return grid
+
+
+def synthetic_paths(accounts, steps, initial_balance=100.0, drift=0.00002, volatility=0.002,
+                    position_ratio=0.5, seed=None):
+    """Generate random-walk PnL paths and position values for a set of accounts.
+
+    Returns (initial_balances, pnl, position_values): pnl[a, t] is the trading PnL of
+    account a during step t and position_values[a, t] its open position value.
+    """
+    rng = np.random.default_rng(seed)
+    initial_balances = np.full(accounts, float(initial_balance))
+    pnl = rng.normal(drift, volatility, size=(accounts, steps)) * initial_balance
+    ratio = np.clip(position_ratio + np.cumsum(rng.normal(0, 0.01, size=(accounts, steps)), axis=1), 0, None)
+    position_values = ratio * initial_balance
+    return initial_balances, pnl, position_values
+
+
+def load_recorded_paths(balances_path, step_seconds, journal_path=None, segment_dir=SEGMENT_DIR):
+    """Build PnL paths from a CSV of recorded balances (columns: timestamp, account, balance).
+
+    Balances are sampled onto a grid of step_seconds and forward-filled. If a transfer
+    journal is given, transfers that were swept from an account are added back, so the
+    paths contain only trading PnL and the simulated sweeps replace the real ones. Only
+    the sealed monthly segments of the journal covering the balance period are read.
+    Returns (accounts, initial_balances, pnl).
+    """
+    with open(balances_path, newline='') as f:
+        rows = [(datetime.fromisoformat(row['timestamp']).timestamp(), row['account'], float(row['balance']))
+                for row in csv.DictReader(f)]
+    if not rows:
+        raise ValueError(f"No balances found in {balances_path}")
+
+    start = min(row[0] for row in rows)
+    accounts = sorted({row[1] for row in rows})
+    account_index = {account: index for index, account in enumerate(accounts)}
+    steps = int((max(row[0] for row in rows) - start) // step_seconds) + 1
+
+    balances = np.full((len(accounts), steps), np.nan)
+    for timestamp, account, balance in rows:
+        balances[account_index[account], int((timestamp - start) // step_seconds)] = balance
+
+    # Forward-fill gaps, then back-fill anything before an account's first sample
+    filled = np.where(np.isnan(balances), 0, np.arange(steps))
+    np.maximum.accumulate(filled, axis=1, out=filled)
+    balances = balances[np.arange(len(accounts))[:, None], filled.astype(int)]
+    first_seen = np.argmax(~np.isnan(balances), axis=1)
+    for index, first in enumerate(first_seen):
+        balances[index, :first] = balances[index, first]
+
+    if journal_path:
+        swept = np.zeros_like(balances)
+        period_start = datetime.fromtimestamp(start).isoformat()
+        period_end = datetime.fromtimestamp(start + steps * step_seconds).isoformat()
+        for transfer in read_history(journal_path, segment_dir, period_start, period_end):
+            index = account_index.get(transfer['from_account'])
+            step = int((datetime.fromisoformat(transfer['timestamp']).timestamp() - start) // step_seconds)
+            if index is not None and 0 <= step < steps:
+                swept[index, step] += transfer_value(transfer)
+        balances = balances + np.cumsum(swept, axis=1)
+
+    initial_balances = balances[:, 0].copy()
+    pnl = np.diff(balances, axis=1, prepend=balances[:, :1])
+    return accounts, initial_balances, pnl
+
+
+def simulate(initial_balances, pnl, grid, position_values=None):
+    """Run every scenario in the grid over the PnL paths.
+
+    initial_balances has shape (accounts,), pnl and position_values (accounts, steps).
+    Scenario i checks every grid['check_steps'][i] steps and applies the same rules as
+    process_account: profit above the threshold, margin below the limit, enough balance
+    left after the transfer. Returns a dict of per-scenario result arrays.
+    """
+    initial_balances = np.asarray(initial_balances, dtype=float)
+    cumulative_pnl = np.cumsum(np.asarray(pnl, dtype=float), axis=1)
+    if position_values is not None:
+        position_values = np.asarray(position_values, dtype=float)
+
+    scenarios = len(grid['check_steps'])
+    results = {name: np.zeros(scenarios) for name in (
+        'swept_total', 'transfers', 'skipped_threshold', 'skipped_margin', 'skipped_remaining',
+        'max_drawdown', 'min_balance', 'final_balance'
+    )}
+    for check_steps in np.unique(grid['check_steps']):
+        indices = np.nonzero(grid['check_steps'] == check_steps)[0]
+        group = {name: grid[name][indices][:, None] for name in PARAMETERS}
+        group_results = _simulate_interval(initial_balances, cumulative_pnl, position_values, int(check_steps), group)
+        for name, values in group_results.items():
+            results[name][indices] = values
+    return results
+
+
+def _simulate_interval(initial_balances, cumulative_pnl, position_values, check_steps, params):
+    """Simulate all scenarios sharing one check interval; arrays are (scenarios, accounts)"""
+    accounts, steps = cumulative_pnl.shape
+    windows_count = steps // check_steps
+    if windows_count == 0:
+        raise ValueError(f"Paths have {steps} steps, shorter than a check interval of {check_steps} steps")
+
+    # Between two checks the swept amount is constant, so each window's low, high and
+    # internal drawdown can be computed once from the PnL path for all scenarios
+    windows = cumulative_pnl[:, :windows_count * check_steps].reshape(accounts, windows_count, check_steps)
+    window_low = windows.min(axis=2)
+    window_high = windows.max(axis=2)
+    window_drawdown = (np.maximum.accumulate(windows, axis=2) - windows).max(axis=2)
+    pnl_at_check = windows[:, :, -1]
+    if position_values is not None:
+        positions_at_check = position_values[:, check_steps - 1::check_steps][:, :windows_count]
+
+    scenarios = params['check_steps'].shape[0]
+    shape = (scenarios, accounts)
+    swept = np.zeros(shape)
+    baseline = np.broadcast_to(initial_balances, shape).copy()
+    peak = baseline.copy()
+    max_drawdown = np.zeros(shape)
+    min_balance = baseline.copy()
+    transfers = np.zeros(shape)
+    skipped_threshold = np.zeros(shape)
+    skipped_margin = np.zeros(shape)
+    skipped_remaining = np.zeros(shape)
+
+    fraction = params['profit_percentage'] / 100
+    threshold = params['min_profit_threshold']
+    min_remaining = params['min_remaining_balance']
+    max_margin = params['max_margin']
+    margin_disabled = np.isnan(max_margin)
+
+    for window in range(windows_count):
+        low = initial_balances + window_low[:, window] - swept
+        max_drawdown = np.maximum(max_drawdown, np.maximum(peak - low, window_drawdown[:, window]))
+        np.minimum(min_balance, low, out=min_balance)
+        np.maximum(peak, initial_balances + window_high[:, window] - swept, out=peak)
+
+        balance = initial_balances + pnl_at_check[:, window] - swept
+        profit = balance - baseline
+        amount = profit * fraction
+
+        over_threshold = profit > threshold
+        if position_values is None:
+            margin_ok = True
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                margin_percentage = positions_at_check[:, window] / balance * 100
+            margin_ok = margin_disabled | ((balance != 0) & (margin_percentage < max_margin))
+        remaining_ok = balance - amount > min_remaining
+
+        transfer = over_threshold & margin_ok & remaining_ok & (amount > 0)
+        skipped_threshold += ~over_threshold
+        skipped_margin += over_threshold & ~margin_ok
+        skipped_remaining += over_threshold & margin_ok & ~remaining_ok
+        transfers += transfer
+
+        swept_now = np.where(transfer, amount, 0)
+        swept += swept_now
+        # process_account sets the new baseline to current - profit + amount
+        baseline += swept_now
+        after = balance - swept_now
+        max_drawdown = np.maximum(max_drawdown, peak - after)
+        np.minimum(min_balance, after, out=min_balance)
+
+    final_balance = initial_balances + cumulative_pnl[:, -1] - swept
+    return {
+        'swept_total': swept.sum(axis=1),
+        'transfers': transfers.sum(axis=1),
+        'skipped_threshold': skipped_threshold.sum(axis=1),
+        'skipped_margin': skipped_margin.sum(axis=1),
+        'skipped_remaining': skipped_remaining.sum(axis=1),
+        'max_drawdown': max_drawdown.max(axis=1),
+        'min_balance': min_balance.min(axis=1),
+        'final_balance': final_balance.sum(axis=1),
+    }
+
+
+def result_rows(grid, results, step_seconds):
+    """Flatten the grid and results into one dict per scenario"""
+    rows = []
+    for i in range(len(grid['check_steps'])):
+        row = {
+            'profit_percentage': grid['profit_percentage'][i],
+            'min_profit_threshold': grid['min_profit_threshold'][i],
+            'min_remaining_balance': grid['min_remaining_balance'][i],
+            'max_margin': None if np.isnan(grid['max_margin'][i]) else grid['max_margin'][i],
+            'check_interval_seconds': int(grid['check_steps'][i]) * step_seconds,
+        }
+        row.update({name: float(values[i]) for name, values in results.items()})
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate profit sweep rules over balance paths')
+    parser.add_argument('--config', default='config.json', help='config.json providing default rule values')
+    parser.add_argument('--balances', help='CSV of recorded balances (timestamp, account, balance)')
+    parser.add_argument('--journal', help='Transfer journal whose sweeps are added back to recorded balances')
+    parser.add_argument('--accounts', type=int, default=20, help='Synthetic accounts (without --balances)')
+    parser.add_argument('--days', type=float, default=30, help='Synthetic history length in days')
+    parser.add_argument('--initial-balance', type=float, default=100.0)
+    parser.add_argument('--drift', type=float, default=0.00002, help='Mean PnL per step as a fraction of balance')
+    parser.add_argument('--volatility', type=float, default=0.002, help='PnL stddev per step as a fraction')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--step', default='1m', help='Simulation step, e.g. 1m')
+    parser.add_argument('--profit-percentage', type=float, nargs='+')
+    parser.add_argument('--min-profit-threshold', type=float, nargs='+')
+    parser.add_argument('--min-remaining-balance', type=float, nargs='+')
+    parser.add_argument('--max-margin', type=float, nargs='+', help='Max margin usage %% (synthetic paths only)')
+    parser.add_argument('--check-interval', nargs='+', help='Check intervals, e.g. 5m 1h')
+    parser.add_argument('--top', type=int, default=10, help='Number of best scenarios to print')
+    parser.add_argument('--output', help='Write all scenario results to this CSV file')
+    args = parser.parse_args()
+
+    try:
+        with open(args.config) as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+
+    step_seconds = parse_interval_seconds(args.step)
+    check_intervals = args.check_interval or [config.get('check_interval', '5m')]
+    check_steps = []
+    for interval in check_intervals:
+        seconds = parse_interval_seconds(interval)
+        if seconds % step_seconds:
+            raise ValueError(f"check interval {interval} is not a multiple of the step {args.step}")
+        check_steps.append(seconds // step_seconds)
+
+    margin_check = config.get('margin_check', {})
+    default_margin = margin_check.get('max_margin_used_percent') if margin_check.get('enabled') else None
+    grid = parameter_grid(
+        args.profit_percentage or [config.get('profit_percentage', 50)],
+        args.min_profit_threshold or [config.get('min_profit_threshold', 5)],
+        args.min_remaining_balance or [config.get('min_remaining_balance', 50)],
+        check_steps,
+        args.max_margin or [default_margin]
+    )
+
+    position_values = None
+    if args.balances:
+        segment_dir = config.get('history', {}).get('segment_dir', SEGMENT_DIR)
+        accounts, initial_balances, pnl = load_recorded_paths(args.balances, step_seconds, args.journal, segment_dir)
+        if args.max_margin:
+            print("Note: recorded balances carry no position data, --max-margin is ignored")
+        grid['max_margin'][:] = np.nan
+    else:
+        steps = int(args.days * 86400 // step_seconds)
+        initial_balances, pnl, position_values = synthetic_paths(
+            args.accounts, steps, args.initial_balance, args.drift, args.volatility, seed=args.seed
+        )
+        accounts = [f"synthetic_{i}" for i in range(args.accounts)]
+
+    started = datetime.now()
+    results = simulate(initial_balances, pnl, grid, position_values)
+    elapsed = (datetime.now() - started).total_seconds()
+    rows = result_rows(grid, results, step_seconds)
+    print(f"Simulated {len(rows)} scenarios x {len(accounts)} accounts x {pnl.shape[1]} steps in {elapsed:.2f}s")
+
+    rows.sort(key=lambda row: row['swept_total'], reverse=True)
+    print(f"\n{'pct':>5} {'thresh':>7} {'min_rem':>8} {'margin':>7} {'interval':>9} "
+          f"{'swept':>11} {'transfers':>9} {'skip_thr':>9} {'skip_mgn':>9} {'skip_rem':>9} {'max_dd':>9} {'min_bal':>9}")
+    for row in rows[:args.top]:
+        margin = '-' if row['max_margin'] is None else f"{row['max_margin']:.0f}"
+        print(f"{row['profit_percentage']:>5.0f} {row['min_profit_threshold']:>7.2f} "
+              f"{row['min_remaining_balance']:>8.2f} {margin:>7} {row['check_interval_seconds']:>8}s "
+              f"{row['swept_total']:>11.2f} {row['transfers']:>9.0f} {row['skipped_threshold']:>9.0f} "
+              f"{row['skipped_margin']:>9.0f} {row['skipped_remaining']:>9.0f} {row['max_drawdown']:>9.2f} "
+              f"{row['min_balance']:>9.2f}")
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"\nWrote {len(rows)} scenarios to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import threading
+import time
+
+from metrics import REGISTRY
+
+DEFAULT_POSITION_TTL = 30
+
+POSITION_CACHE_REQUESTS = REGISTRY.counter(
+    'bybit_mover_position_cache_requests_total', 'Margin lookups by whether the cached positions were used',
+    ('result',))
+
+
+def position_key(position):
+    """Return the key of a position: one per symbol and side in hedge mode"""
+    return position['symbol'], int(position.get('positionIdx') or 0)
+
+
+def position_value(position):
+    """Return the value of a position in USDT; closed positions have no value"""
+    if float(position.get('size') or 1) == 0:
+        return 0.0
+    return float(position.get('positionValue') or 0)
+
+
+class AccountPositions:
+    """Position values of one account by position_key, with their sum kept as they change"""
+
+    def __init__(self, positions, expires_at):
+        self.values = {}
+        self.total = 0.0
+        self.expires_at = expires_at
+        self.apply(positions)
+
+    def apply(self, positions):
+        """Fold changed positions in; each one replaces the previous value under its key"""
+        for position in positions:
+            key = position_key(position)
+            value = position_value(position)
+            self.total += value - self.values.get(key, 0.0)
+            if value:
+                self.values[key] = value
+            else:
+                self.values.pop(key, None)
+
+
+class PositionCache:
+    """Total position value per account for margin checks, reused until it expires or changes.
+
+    fetch_positions(uid) returns the complete position list of an account, or None on
+    failure. The list is kept for ttl_seconds as values by position plus their running
+    sum, so a margin lookup in between costs nothing. Position events from the private
+    stream are folded in with apply_update(), keeping the sum current without a fetch,
+    and invalidate() forces a refetch on the next lookup. Accounts are fetched under
+    their own lock, so one slow account does not hold up the others.
+    """
+
+    def __init__(self, fetch_positions, ttl_seconds=DEFAULT_POSITION_TTL, clock=time.monotonic):
+        self.fetch_positions = fetch_positions
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.accounts = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def margin_used(self, uid):
+        """Return the total position value of an account, or None if it could not be fetched"""
+        with self._account_lock(uid):
+            entry = self.accounts.get(uid)
+            if entry is not None and self.clock() < entry.expires_at:
+                POSITION_CACHE_REQUESTS.labels('hit').inc()
+                return entry.total
+
+            POSITION_CACHE_REQUESTS.labels('miss').inc()
+            positions = self.fetch_positions(uid)
+            if positions is None:
+                return None
+            entry = AccountPositions(positions, self.clock() + self.ttl_seconds)
+            self.accounts[uid] = entry
+            return entry.total
+
+    def apply_update(self, uid, positions):
+        """Fold position events of an account into its cached positions, if they are cached"""
+        with self._account_lock(uid):
+            entry = self.accounts.get(uid)
+            if entry is not None:
+                entry.apply(positions)
+
+    def invalidate(self, uid):
+        """Make the next lookup of an account fetch its positions again"""
+        with self._account_lock(uid):
+            self.accounts.pop(uid, None)
+
+    def _account_lock(self, uid):
+        with self._lock:
+            return self._locks.setdefault(uid, threading.Lock())
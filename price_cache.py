@@ -0,0 +1,57 @@
+import logging
+import threading
+import time
+
+QUOTE_COIN = 'USDT'
+DEFAULT_PRICE_TTL = 30
+
+logger = logging.getLogger('BybitMover')
+
+
+def parse_spot_tickers(tickers):
+    """Return {coin: USDT price} from a spot get_tickers result list"""
+    prices = {}
+    for ticker in tickers:
+        symbol = ticker.get('symbol', '')
+        if symbol.endswith(QUOTE_COIN) and ticker.get('lastPrice'):
+            prices[symbol[:-len(QUOTE_COIN)]] = float(ticker['lastPrice'])
+    return prices
+
+
+class PriceCache:
+    """USDT prices for every coin, fetched with one ticker call and shared by all accounts.
+
+    fetch_prices() returns {coin: price} or None on failure. The map is reused for
+    ttl_seconds; when it expires, the first caller refetches it while concurrent callers
+    wait for that fetch instead of making their own. If a refetch fails the previous
+    prices keep being served until the next attempt.
+    """
+
+    def __init__(self, fetch_prices, ttl_seconds=DEFAULT_PRICE_TTL, clock=time.monotonic):
+        self.fetch_prices = fetch_prices
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.prices = {}
+        self.expires_at = None
+        self.fetches = 0
+        self._lock = threading.Lock()
+
+    def get(self, coin):
+        """Return the USDT price of a coin, or None if it is unknown"""
+        if coin == QUOTE_COIN:
+            return 1.0
+        with self._lock:
+            if self.expires_at is None or self.clock() >= self.expires_at:
+                self._refresh_locked()
+            return self.prices.get(coin)
+
+    def _refresh_locked(self):
+        self.fetches += 1
+        prices = self.fetch_prices()
+        # Failed or not, wait a full TTL before the next attempt
+        self.expires_at = self.clock() + self.ttl_seconds
+        if prices is None:
+            if self.prices:
+                logger.warning("Could not refresh coin prices, using the previous ones")
+            return
+        self.prices = prices
@@ -0,0 +1,174 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from pybit.exceptions import FailedRequestError, InvalidRequestError
+
+from metrics import REGISTRY
+
+# Requests per second allowed per API key for each endpoint class
+DEFAULT_ENDPOINT_LIMITS = {
+    'wallet': 20,
+    'position': 20,
+    'transfer': 5,
+    'market': 10,
+}
+# Bybit allows 600 requests per 5 seconds per IP; stay below that
+DEFAULT_IP_LIMIT = 100
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 10.0
+
+# Bybit retCodes worth retrying: rate limit, internal error, server timeout, system busy
+RETRYABLE_CODES = {10000, 10006, 10016, 10429}
+
+logger = logging.getLogger('BybitMover')
+
+REQUEST_DURATION = REGISTRY.histogram(
+    'bybit_request_duration_seconds', 'Latency of Bybit REST requests, per attempt', ('endpoint', 'account'))
+REQUESTS = REGISTRY.counter(
+    'bybit_requests_total', 'Bybit REST request attempts by outcome', ('endpoint', 'outcome'))
+REQUEST_ERRORS = REGISTRY.counter(
+    'bybit_request_errors_total', 'Failed Bybit REST request attempts by error code', ('endpoint', 'code'))
+RATE_LIMIT_WAIT = REGISTRY.counter(
+    'bybit_rate_limit_wait_seconds_total', 'Time spent waiting for rate limit tokens', ('endpoint',))
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ApiResult:
+    """Outcome of a gateway call: either ok with the response, or a failure with a reason"""
+
+    __slots__ = ('ok', 'response', 'error', 'code', 'attempts')
+
+    def __init__(self, ok, response=None, error=None, code=None, attempts=1):
+        self.ok = ok
+        self.response = response
+        self.error = error
+        self.code = code
+        self.attempts = attempts
+
+    @property
+    def result(self):
+        return self.response['result'] if self.ok else None
+
+    def __repr__(self):
+        if self.ok:
+            return f"ApiResult(ok, attempts={self.attempts})"
+        return f"ApiResult(failed, code={self.code!r}, error={self.error!r}, attempts={self.attempts})"
+
+
+class RequestGateway:
+    """Single entry point for every Bybit REST call.
+
+    Each call waits for a token from the shared per-IP bucket and from the bucket for
+    its (endpoint class, api_key), then runs. Rate-limit, server-side and network errors
+    are retried with jittered exponential backoff; anything else fails immediately.
+    The caller always gets an ApiResult, never an exception or a made-up value.
+    """
+
+    def __init__(self, endpoint_limits=None, ip_limit=DEFAULT_IP_LIMIT, max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.endpoint_limits = dict(DEFAULT_ENDPOINT_LIMITS)
+        self.endpoint_limits.update(endpoint_limits or {})
+        self.ip_bucket = TokenBucket(ip_limit)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._buckets = {}
+        self._lock = threading.Lock()
+        # Maps an api_key to the account name used in metric labels; keys are never exported
+        self.account_label = None
+
+    @classmethod
+    def from_config(cls, settings):
+        """Build a gateway from the 'rate_limits' section of config.json"""
+        return cls(
+            endpoint_limits=settings.get('requests_per_second'),
+            ip_limit=settings.get('ip_requests_per_second', DEFAULT_IP_LIMIT),
+            max_retries=settings.get('max_retries', DEFAULT_MAX_RETRIES),
+            base_delay=settings.get('base_delay_seconds', DEFAULT_BASE_DELAY),
+            max_delay=settings.get('max_delay_seconds', DEFAULT_MAX_DELAY)
+        )
+
+    def _bucket(self, endpoint, api_key):
+        key = (endpoint, api_key)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if endpoint not in self.endpoint_limits:
+                    raise ValueError(f"Unknown endpoint class: {endpoint}")
+                bucket = self._buckets[key] = TokenBucket(self.endpoint_limits[endpoint])
+            return bucket
+
+    def call(self, endpoint, api_key, func, **kwargs):
+        """Run func(**kwargs) under the limits for this endpoint class and key"""
+        bucket = self._bucket(endpoint, api_key)
+        account = self.account_label(api_key) if self.account_label is not None else ''
+        duration = REQUEST_DURATION.labels(endpoint, account)
+        attempt = 0
+        while True:
+            attempt += 1
+            waited = time.perf_counter()
+            self.ip_bucket.acquire()
+            bucket.acquire()
+            started = time.perf_counter()
+            RATE_LIMIT_WAIT.labels(endpoint).inc(started - waited)
+
+            response, retryable, code, error = self._attempt(func, kwargs)
+            duration.observe(time.perf_counter() - started)
+            if response is not None:
+                REQUESTS.labels(endpoint, 'ok').inc()
+                return ApiResult(True, response=response, attempts=attempt)
+            REQUEST_ERRORS.labels(endpoint, code).inc()
+            if not retryable or attempt > self.max_retries:
+                REQUESTS.labels(endpoint, 'failed').inc()
+                return ApiResult(False, error=error, code=code, attempts=attempt)
+            REQUESTS.labels(endpoint, 'retried').inc()
+
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            logger.warning(f"{endpoint} request failed ({error}), retrying in {delay:.2f}s "
+                           f"(attempt {attempt}/{self.max_retries})")
+            time.sleep(delay)
+
+    def _attempt(self, func, kwargs):
+        """Return (response, retryable, code, error); response is None on failure"""
+        try:
+            response = func(**kwargs)
+        except InvalidRequestError as e:
+            return None, e.status_code in RETRYABLE_CODES, e.status_code, e.message
+        except FailedRequestError as e:
+            # HTTP-level failure: 403 is Bybit's IP rate limit, 5xx is server side
+            return None, e.status_code == 403 or e.status_code >= 500, e.status_code, e.message
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            return None, True, None, str(e)
+        except Exception as e:
+            return None, False, None, str(e)
+
+        ret_code = response.get('retCode')
+        if ret_code == 0:
+            return response, False, None, None
+        return None, ret_code in RETRYABLE_CODES, ret_code, response.get('retMsg')
@@ -0,0 +1,163 @@
+import heapq
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+logger = logging.getLogger('BybitMover')
+
+TICKS_SKIPPED = REGISTRY.counter(
+    'bybit_mover_ticks_skipped_total', 'Scheduled account checks coalesced because the previous one ran late')
+SCHEDULE_LAG = REGISTRY.histogram(
+    'bybit_mover_schedule_lag_seconds', 'Delay between an account check being due and starting',
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300))
+
+
+class AccountScheduler:
+    """Runs account checks on fixed wall-clock boundaries.
+
+    Each account is due at offset + k * interval for whole k, so the schedule never
+    drifts however long a check takes. With stagger enabled, accounts sharing an
+    interval get evenly spread offsets, and every run is delayed by a random jitter of
+    up to jitter_seconds, so API load is smooth instead of one burst per interval.
+
+    Due accounts are passed to run_batch(uids) together. run_batch may run them inline
+    or hand them to a pool and return; the scheduler only waits for it to return. If an
+    account's check starts past its next boundary, the missed ticks are coalesced into
+    the one run that follows instead of piling up.
+    """
+
+    def __init__(self, run_batch, stagger=True, jitter_seconds=0.0, clock=time.time):
+        self.run_batch = run_batch
+        self.stagger = stagger
+        self.jitter_seconds = jitter_seconds
+        self.clock = clock
+        self.intervals = {}
+        self.offsets = {}
+        self._queue = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def set_accounts(self, intervals):
+        """Schedule {uid: interval_seconds}, replacing any previous schedule; safe from any thread"""
+        groups = {}
+        for uid, interval in intervals.items():
+            groups.setdefault(interval, []).append(uid)
+
+        with self._lock:
+            self.intervals = dict(intervals)
+            self.offsets = {}
+            for interval, uids in groups.items():
+                for index, uid in enumerate(uids):
+                    self.offsets[uid] = interval * index / len(uids) if self.stagger else 0.0
+
+            now = self.clock()
+            self._queue = []
+            for uid in self.intervals:
+                self._push(uid, self.next_boundary(uid, now))
+
+    def next_boundary(self, uid, after):
+        """Return the first boundary of this account strictly after the given time"""
+        interval = self.intervals[uid]
+        offset = self.offsets[uid]
+        return offset + (int((after - offset) // interval) + 1) * interval
+
+    def slot_seconds(self, uid):
+        """Return the time an account's check has before the next account sharing its interval is due, or None"""
+        with self._lock:
+            interval = self.intervals.get(uid)
+            if interval is None or not self.stagger:
+                return interval
+            return interval / sum(1 for other in self.intervals.values() if other == interval)
+
+    def _push(self, uid, due):
+        jitter = random.uniform(0, self.jitter_seconds) if self.stagger and self.jitter_seconds else 0.0
+        heapq.heappush(self._queue, (due + jitter, due, uid))
+
+    def stop(self):
+        self._stopped.set()
+
+    def _pop_due(self):
+        """Return (due uids, 0) or ([], seconds until the next run)"""
+        with self._lock:
+            if not self._queue:
+                return [], 1.0
+            now = self.clock()
+            if self._queue[0][0] > now:
+                return [], self._queue[0][0] - now
+
+            batch = []
+            while self._queue and self._queue[0][0] <= now:
+                run_at, due, uid = heapq.heappop(self._queue)
+                SCHEDULE_LAG.observe(now - due)
+                batch.append(uid)
+
+                next_due = due + self.intervals[uid]
+                if next_due <= now:
+                    # Running late: skip the boundaries that already passed
+                    missed = int((now - next_due) // self.intervals[uid]) + 1
+                    TICKS_SKIPPED.inc(missed)
+                    logger.warning(f"Check for {uid} is {now - due:.1f}s late, skipping {missed} missed tick(s)")
+                    next_due = self.next_boundary(uid, now)
+                self._push(uid, next_due)
+            return batch, 0
+
+    def run(self):
+        """Dispatch due accounts until stop() is called"""
+        while not self._stopped.is_set():
+            batch, wait = self._pop_due()
+            if wait:
+                # Re-check at least every second so clock jumps and new schedules are picked up quickly
+                self._stopped.wait(min(wait, 1.0))
+                continue
+
+            if batch:
+                try:
+                    self.run_batch(batch)
+                except Exception:
+                    logger.exception("Error running scheduled checks")
+
+
+class CheckLock:
+    """Lets account checks run side by side while exclusive sections, like applying a config edit, wait for them.
+
+    A waiting exclusive section holds back checks that have not started yet, so it is
+    never starved by a steady stream of checks.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._checks = 0
+        self._exclusive = False
+        self._waiting = 0
+
+    @contextmanager
+    def shared(self):
+        with self._condition:
+            while self._exclusive or self._waiting:
+                self._condition.wait()
+            self._checks += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._checks -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._condition:
+            self._waiting += 1
+            while self._exclusive or self._checks:
+                self._condition.wait()
+            self._waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
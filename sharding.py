@@ -0,0 +1,173 @@
+import bisect
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+SHARD_STORE = 'bybit_mover_shards.db'
+DEFAULT_HEARTBEAT = 10
+DEFAULT_LEASE = 30
+# Virtual nodes per worker; more replicas give a more even spread of accounts
+DEFAULT_REPLICAS = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    heartbeat_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS account_leases (
+    uid TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+CLAIM_LEASE = (
+    'INSERT INTO account_leases (uid, owner, expires_at) VALUES (?, ?, ?) '
+    'ON CONFLICT(uid) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at '
+    'WHERE account_leases.owner = excluded.owner OR account_leases.expires_at < ?'
+)
+
+logger = logging.getLogger('BybitMover')
+
+
+def hash_key(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring mapping account uids to worker ids"""
+
+    def __init__(self, nodes, replicas=DEFAULT_REPLICAS):
+        self.nodes = sorted(nodes)
+        self._ring = sorted((hash_key(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._hashes = [point for point, _ in self._ring]
+
+    def owner(self, key):
+        """Return the node owning a key, or None if the ring is empty"""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._hashes, hash_key(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+class ShardCoordinator:
+    """Splits sub-accounts between worker processes through leases in a shared SQLite file.
+
+    Every heartbeat a worker records itself as alive, builds a hash ring of all workers
+    seen within lease_seconds, and claims a lease on each account the ring assigns to
+    it. A lease can only be taken over once it has expired, so two workers never own
+    the same account at the same time. When a worker dies its leases run out and the
+    remaining workers pick up its accounts; when one joins, the others hand over the
+    accounts that moved to it.
+
+    on_change(acquired, released) is called with sets of uids whenever ownership
+    changes. Released accounts are reported before their leases are given up, so the
+    callback can wait for in-progress work to finish.
+    """
+
+    def __init__(self, path, worker_id, account_uids, on_change,
+                 heartbeat_seconds=DEFAULT_HEARTBEAT, lease_seconds=DEFAULT_LEASE):
+        if lease_seconds <= heartbeat_seconds:
+            raise ValueError("sharding.lease_seconds must be longer than sharding.heartbeat_seconds")
+        self.path = path
+        self.worker_id = worker_id
+        self.account_uids = list(account_uids)
+        self.on_change = on_change
+        self.heartbeat_seconds = heartbeat_seconds
+        self.lease_seconds = lease_seconds
+        self.owned = set()
+        self.workers = []
+        self.lease_expires = 0.0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=lease_seconds)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def owns(self, uid):
+        """Return True if this worker holds an unexpired lease on the account"""
+        return uid in self.owned and time.time() < self.lease_expires
+
+    def set_accounts(self, account_uids):
+        """Replace the accounts split between workers; ownership follows on the next sync"""
+        with self._lock:
+            self.account_uids = list(account_uids)
+
+    def sync(self):
+        """Renew this worker's heartbeat and leases and rebalance if the worker set changed"""
+        with self._lock:
+            now = time.time()
+            expires_at = now + self.lease_seconds
+            conn = self._conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(
+                    'INSERT INTO workers VALUES (?, ?) '
+                    'ON CONFLICT(worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at',
+                    (self.worker_id, now)
+                )
+                conn.execute('DELETE FROM workers WHERE heartbeat_at < ?', (now - self.lease_seconds,))
+                self.workers = [row[0] for row in conn.execute('SELECT worker_id FROM workers ORDER BY worker_id')]
+
+                ring = HashRing(self.workers)
+                desired = {uid for uid in self.account_uids if ring.owner(uid) == self.worker_id}
+                # Keep the leases being handed over alive until they are released below
+                conn.execute('UPDATE account_leases SET expires_at = ? WHERE owner = ?', (expires_at, self.worker_id))
+                conn.executemany(CLAIM_LEASE, [(uid, self.worker_id, expires_at, now) for uid in desired])
+                held = {row[0] for row in conn.execute(
+                    'SELECT uid FROM account_leases WHERE owner = ?', (self.worker_id,))}
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self.lease_expires = expires_at
+
+            owned = held & desired
+            acquired = owned - self.owned
+            released = self.owned - owned
+            waiting = len(desired) - len(owned)
+
+        # Released accounts stop counting as owned before the callback waits for their work
+        self.owned = owned
+        if acquired or released:
+            logger.info(f"Worker {self.worker_id}: {len(self.workers)} workers alive, owning {len(owned)} accounts "
+                        f"(+{len(acquired)} -{len(released)}, {waiting} waiting for a lease to expire)")
+            self.on_change(acquired, released)
+
+        stale = held - owned
+        if stale:
+            with self._lock:
+                self._conn.executemany(
+                    'DELETE FROM account_leases WHERE uid = ? AND owner = ?',
+                    [(uid, self.worker_id) for uid in stale]
+                )
+        return owned
+
+    def start(self):
+        """Run the first sync now and keep renewing leases in the background"""
+        self.sync()
+        self._thread = threading.Thread(target=self._heartbeat, name='shard-heartbeat', daemon=True)
+        self._thread.start()
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self.heartbeat_seconds):
+            try:
+                self.sync()
+            except Exception:
+                logger.exception(f"Worker {self.worker_id}: could not renew shard leases")
+
+    def stop(self):
+        """Give up all leases so other workers take over immediately, then close the store"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            try:
+                self._conn.execute('DELETE FROM account_leases WHERE owner = ?', (self.worker_id,))
+                self._conn.execute('DELETE FROM workers WHERE worker_id = ?', (self.worker_id,))
+            finally:
+                self._conn.close()
+        self.owned = set()
@@ -0,0 +1,110 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+STATE_FILE = 'bybit_mover_state.db'
+
+UPSERT_BALANCE = (
+    'INSERT INTO balances (uid, initial_balance, last_balance, updated_at) VALUES (?, ?, ?, ?) '
+    'ON CONFLICT(uid) DO UPDATE SET initial_balance = excluded.initial_balance, '
+    'last_balance = excluded.last_balance, updated_at = excluded.updated_at'
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS balances (
+    uid TEXT PRIMARY KEY,
+    initial_balance REAL NOT NULL,
+    last_balance REAL NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inflight_transfers (
+    transfer_id TEXT PRIMARY KEY,
+    from_account TEXT NOT NULL,
+    to_account TEXT NOT NULL,
+    amount REAL NOT NULL,
+    created_at TEXT NOT NULL,
+    coin TEXT NOT NULL DEFAULT 'USDT'
+);
+"""
+
+
+class StateStore:
+    """SQLite store for profit baselines, last-seen balances and in-flight transfers.
+
+    Everything the mover needs to resume after a restart without resetting the profit
+    baseline lives here. Writes are small single-row upserts in WAL mode, so keeping the
+    store current on every check is cheap.
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        # Stores created before multi-coin sweeping have no coin column; their transfers were all USDT
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(inflight_transfers)')}
+        if 'coin' not in columns:
+            self._conn.execute("ALTER TABLE inflight_transfers ADD COLUMN coin TEXT NOT NULL DEFAULT 'USDT'")
+
+    def load_balances(self):
+        """Return {uid: (initial_balance, last_balance)} for every stored account"""
+        with self._lock:
+            rows = self._conn.execute('SELECT uid, initial_balance, last_balance FROM balances').fetchall()
+        return {uid: (initial_balance, last_balance) for uid, initial_balance, last_balance in rows}
+
+    def save_balance(self, uid, initial_balance, last_balance):
+        """Store the current baseline and last-seen balance for an account"""
+        with self._lock:
+            self._conn.execute(UPSERT_BALANCE, (uid, initial_balance, last_balance, datetime.now().isoformat()))
+
+    def delete_balance(self, uid):
+        """Forget the stored baseline of an account (or one coin of it)"""
+        with self._lock:
+            self._conn.execute('DELETE FROM balances WHERE uid = ?', (uid,))
+
+    def add_inflight(self, transfer_id, from_account, to_account, amount, coin='USDT'):
+        """Remember a transfer before it is sent, so a crash mid-transfer can be reconciled"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO inflight_transfers '
+                '(transfer_id, from_account, to_account, amount, created_at, coin) VALUES (?, ?, ?, ?, ?, ?)',
+                (transfer_id, from_account, to_account, amount, datetime.now().isoformat(), coin)
+            )
+
+    def complete_transfer(self, transfer_id, uid, initial_balance, last_balance):
+        """Store the post-transfer baseline and drop the in-flight entry in one transaction"""
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.execute(UPSERT_BALANCE, (uid, initial_balance, last_balance, datetime.now().isoformat()))
+                self._conn.execute('DELETE FROM inflight_transfers WHERE transfer_id = ?', (transfer_id,))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def remove_inflight(self, transfer_id):
+        with self._lock:
+            self._conn.execute('DELETE FROM inflight_transfers WHERE transfer_id = ?', (transfer_id,))
+
+    def inflight_transfers(self):
+        """Return every transfer that was sent but never confirmed or rejected"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT transfer_id, from_account, to_account, amount, created_at, coin FROM inflight_transfers'
+            ).fetchall()
+        return [
+            {'transfer_id': transfer_id, 'from_account': from_account, 'to_account': to_account,
+             'amount': amount, 'created_at': created_at, 'coin': coin}
+            for transfer_id, from_account, to_account, amount, created_at, coin in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,121 @@
+import copy
+import json
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from metrics import REGISTRY
+
+DEFAULT_QUEUE_SIZE = 10000
+# Log the routine balance line of an account on one check in this many
+DEFAULT_BALANCE_SAMPLE_EVERY = 10
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    'bybit_mover_log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+# Fields (account, cycle, ...) attached to every record logged from the current thread
+_context = threading.local()
+
+
+@contextmanager
+def log_context(**fields):
+    """Tag every record logged by this thread inside the block with the given fields"""
+    previous = getattr(_context, 'fields', {})
+    _context.fields = {**previous, **fields}
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+class ContextFilter(logging.Filter):
+    """Merges the thread's log_context() and a record's extra={'fields': ...} into record.fields"""
+
+    def filter(self, record):
+        record.fields = {**getattr(_context, 'fields', {}), **getattr(record, 'fields', {})}
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line"""
+
+    def format(self, record):
+        event = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'event': getattr(record, 'event', 'message'),
+            'message': record.getMessage(),
+            'source': f"{record.filename}:{record.lineno}",
+        }
+        event.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            event['exception'] = record.exc_text
+        return json.dumps(event, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines, prefixed with the account the record belongs to"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(levelname)s - %(account_prefix)s%(message)s')
+
+    def format(self, record):
+        account = getattr(record, 'fields', {}).get('account')
+        record.account_prefix = f"[{account}] " if account is not None else ''
+        return super().format(record)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to a bounded queue and drops them instead of waiting when it is full"""
+
+    def prepare(self, record):
+        """Merge the message with its arguments but keep the traceback in exc_text, apart from the message"""
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class BalanceSampler:
+    """Per-account sampling of routine balance lines: the first check is logged, then one in every `every`"""
+
+    def __init__(self, every=DEFAULT_BALANCE_SAMPLE_EVERY):
+        self.every = max(int(every), 1)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def sample(self, key):
+        """Return True if this check of key should be logged"""
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count % self.every == 0
+
+
+def start_queue_logging(logger, handlers, queue_size=DEFAULT_QUEUE_SIZE):
+    """Route a logger's records through a bounded queue to handlers running on a background thread.
+
+    Returns the QueueListener; call its stop() at exit to flush the remaining records.
+    """
+    records = queue.Queue(maxsize=queue_size)
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(ContextFilter())
+    logger.addHandler(handler)
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,20 @@
+"""BalanceSnapshot counts a fetch once per account and cycle and serves repeats from memory"""
+from balance_snapshot import BalanceSnapshot
+
+
+def test_repeated_lookups_are_served_from_memory_until_invalidated():
+    fetched = []
+    snapshot = BalanceSnapshot()
+
+    def fetch():
+        fetched.append('sub_1')
+        return {'total': 100.0, 'coins': {'USDT': 100.0}}
+
+    assert snapshot.get_balance('sub_1', fetch)['total'] == 100.0
+    assert snapshot.get_balance('sub_1', fetch)['total'] == 100.0
+    assert (snapshot.api_calls, snapshot.saved_calls) == (1, 1)
+
+    snapshot.invalidate('sub_1')
+    snapshot.get_balance('sub_1', fetch)
+    assert fetched == ['sub_1', 'sub_1']
+    assert (snapshot.api_calls, snapshot.saved_calls) == (2, 1)
@@ -0,0 +1,135 @@
+"""BalanceStream against the local private stream stand-in: auth, reconnect and debounced sweeps"""
+import threading
+import time
+
+import pytest
+
+import balance_stream
+from balance_stream import BalanceStream
+from fake_bybit_stream import FakeBybitStreamServer
+
+
+class Account:
+    def __init__(self, uid, api_key, api_secret):
+        self.uid = uid
+        self.api_key = api_key
+        self.api_secret = api_secret
+
+
+class ChangeRecorder:
+    """on_change callback that records the uids it was called with"""
+
+    def __init__(self):
+        self.calls = []
+        self.called = threading.Event()
+
+    def __call__(self, uid):
+        self.calls.append(uid)
+        self.called.set()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+@pytest.fixture
+def server():
+    server = FakeBybitStreamServer({'key_1': 'secret_1', 'key_2': 'secret_2'})
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_stream(server):
+    streams = []
+
+    def make(accounts, on_change=None, debounce_seconds=0.2):
+        stream = BalanceStream(accounts, on_change or ChangeRecorder(), url=server.url,
+                               debounce_seconds=debounce_seconds)
+        stream.start()
+        streams.append(stream)
+        return stream
+
+    yield make
+    for stream in streams:
+        stream.stop()
+
+
+def test_authenticates_subscribes_and_serves_pushed_wallet(server, make_stream):
+    stream = make_stream([Account('sub_1', 'key_1', 'secret_1')])
+    assert server.state.wait_subscribed('key_1')
+    assert server.state.push_wallet('key_1', 1234.5, {'USDT': 1000.0, 'BTC': 0.01}) == 1
+
+    assert wait_for(lambda: stream.get_wallet('sub_1') is not None)
+    assert stream.get_balance('sub_1') == 1234.5
+    assert stream.get_wallet('sub_1')['coins'] == {'USDT': 1000.0, 'BTC': 0.01}
+
+
+def test_wrong_secret_is_rejected(server, make_stream):
+    stream = make_stream([Account('sub_1', 'key_1', 'not_the_secret')])
+    assert wait_for(lambda: server.state.auth_failures['key_1'] > 0)
+    assert not server.state.wait_subscribed('key_1', timeout=0.3)
+    assert not stream.streams['sub_1'].connected
+
+
+def test_reconnects_after_disconnect(server, make_stream, monkeypatch):
+    monkeypatch.setattr(balance_stream, 'RECONNECT_DELAY', 0.1)
+    stream = make_stream([Account('sub_1', 'key_1', 'secret_1')])
+    assert server.state.wait_subscribed('key_1')
+    server.state.push_wallet('key_1', 1000.0)
+    assert wait_for(lambda: stream.get_balance('sub_1') == 1000.0)
+
+    assert server.state.disconnect('key_1') == 1
+    # The streamed view is dropped until the account is connected again
+    assert wait_for(lambda: stream.get_wallet('sub_1') is None)
+    assert server.state.wait_subscribed('key_1', connects=2)
+
+    server.state.push_wallet('key_1', 1010.0)
+    assert wait_for(lambda: stream.get_balance('sub_1') == 1010.0)
+
+
+def test_burst_of_updates_triggers_one_debounced_sweep(server, make_stream):
+    recorder = ChangeRecorder()
+    make_stream([Account('sub_1', 'key_1', 'secret_1'), Account('sub_2', 'key_2', 'secret_2')],
+                on_change=recorder, debounce_seconds=0.3)
+    assert server.state.wait_subscribed('key_1')
+    assert server.state.wait_subscribed('key_2')
+
+    for balance in range(1000, 1005):
+        server.state.push_wallet('key_1', float(balance))
+        time.sleep(0.05)
+    assert recorder.called.wait(2.0)
+    time.sleep(0.5)
+    assert recorder.calls == ['sub_1']
+
+
+def test_unchanged_wallet_does_not_trigger_a_sweep(server, make_stream):
+    recorder = ChangeRecorder()
+    make_stream([Account('sub_1', 'key_1', 'secret_1')], on_change=recorder, debounce_seconds=0.1)
+    assert server.state.wait_subscribed('key_1')
+    server.state.push_wallet('key_1', 1000.0)
+    assert recorder.called.wait(2.0)
+
+    recorder.called.clear()
+    server.state.push_wallet('key_1', 1000.0)
+    assert not recorder.called.wait(0.5)
+    assert recorder.calls == ['sub_1']
+
+
+def test_accounts_are_added_once_and_removed_on_handover(server, make_stream):
+    stream = make_stream([])
+    account = Account('sub_1', 'key_1', 'secret_1')
+    stream.add_accounts([account])
+    assert server.state.wait_subscribed('key_1')
+    stream.add_accounts([account])
+    assert not server.state.wait_subscribed('key_1', connects=2, timeout=0.3)
+
+    stream.remove_accounts(['sub_1'])
+    assert wait_for(lambda: not server.state.subscribed('key_1'))
+    assert stream.streams == {}
@@ -0,0 +1,71 @@
+"""HistoryAggregates over a live journal: incremental refresh and cursor paging"""
+import pytest
+
+from history_aggregates import HistoryAggregates
+from transfer_journal import TransferJournal
+
+
+def transfer(timestamp, amount=1.0, account='sub_1'):
+    return {'from_account': account, 'to_account': 'main', 'amount': amount, 'timestamp': timestamp,
+            'transfer_id': f"{account}-{timestamp}"}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = TransferJournal(str(tmp_path / 'transfer_history.jsonl'), legacy_path=None)
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def history(tmp_path, journal):
+    return HistoryAggregates(journal, segment_dir=str(tmp_path / 'segments'))
+
+
+def test_refresh_folds_in_only_new_records(journal, history):
+    journal.append_batch([transfer('2026-10-01T00:00:00', 2.0), transfer('2026-10-02T00:00:00', 3.0, 'sub_2')])
+    history.refresh()
+    assert history.totals() == (5.0, {'sub_1': 2.0, 'sub_2': 3.0})
+    version = history.version
+
+    history.refresh()
+    assert history.version == version
+
+    journal.append_batch([transfer('2026-10-03T00:00:00', 4.0)])
+    history.refresh()
+    assert history.count() == 3
+    assert history.totals()[1]['sub_1'] == 6.0
+    assert history.rebuilds == 0
+
+
+def test_pages_follow_the_cursor_newest_first(journal, history):
+    # Out of order on purpose: pages are ordered by timestamp, not by arrival
+    journal.append_batch([transfer(f"2026-10-{day:02d}T00:00:00") for day in (3, 1, 5, 2, 4)])
+    history.refresh()
+
+    page, cursor = history.page(limit=2)
+    assert [t['timestamp'][8:10] for t in page] == ['05', '04']
+    page, cursor = history.page(cursor=cursor, limit=2)
+    assert [t['timestamp'][8:10] for t in page] == ['03', '02']
+    page, cursor = history.page(cursor=cursor, limit=2)
+    assert [t['timestamp'][8:10] for t in page] == ['01']
+    assert cursor is None
+
+
+def test_page_filters(journal, history):
+    journal.append_batch([transfer('2026-10-01T10:00:00', 1.0), transfer('2026-10-02T10:00:00', 10.0),
+                          transfer('2026-10-02T11:00:00', 20.0, 'sub_2'), transfer('2026-10-03T10:00:00', 5.0)])
+    history.refresh()
+
+    assert [t['amount'] for t in history.page(account='sub_1')[0]] == [5.0, 10.0, 1.0]
+    # A bare end date includes the whole day
+    assert [t['amount'] for t in history.page(start='2026-10-02', end='2026-10-02')[0]] == [20.0, 10.0]
+    assert [t['amount'] for t in history.page(min_amount=5.0)[0]] == [5.0, 20.0, 10.0]
+
+
+@pytest.mark.parametrize('cursor', ['abc', '99', '2026-10:-1', '2026-10:x'])
+def test_invalid_cursors_are_rejected(journal, history, cursor):
+    journal.append_batch([transfer('2026-10-01T00:00:00')])
+    history.refresh()
+    with pytest.raises(ValueError):
+        history.page(cursor=cursor)
@@ -0,0 +1,107 @@
+"""Monthly segments: compaction, late records of sealed months and paging across sealed months"""
+import pytest
+
+from history_aggregates import HistoryAggregates
+from history_segments import SegmentStore, read_history
+from transfer_journal import TransferJournal
+
+
+def transfer(timestamp, amount=1.0, account='sub_1', transfer_id=None):
+    return {'from_account': account, 'to_account': 'main', 'amount': amount, 'timestamp': timestamp,
+            'transfer_id': transfer_id or f"{account}-{timestamp}"}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = TransferJournal(str(tmp_path / 'transfer_history.jsonl'), legacy_path=None)
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def store(tmp_path, journal):
+    return SegmentStore(journal.path, str(tmp_path / 'segments'))
+
+
+def monthly_transfers():
+    return [transfer(f"2026-{month:02d}-{day:02d}T12:00:00", amount=month)
+            for month in (7, 8, 9) for day in (1, 2, 3)]
+
+
+def test_compact_seals_completed_months_only(journal, store):
+    journal.append_batch(monthly_transfers())
+
+    assert journal.compact(store, '2026-09') == 6
+    assert store.load_index()['sealed_through'] == '2026-08'
+    assert sorted(store.load_index()['segments']) == ['2026-07', '2026-08']
+    assert [t['timestamp'][:7] for t in journal.read_all()] == ['2026-09'] * 3
+    assert len(read_history(journal.path, store.directory)) == 9
+
+
+def test_late_record_of_sealed_month_stays_visible(journal, store):
+    journal.append_batch(monthly_transfers())
+    journal.compact(store, '2026-09')
+    history = HistoryAggregates(journal, segment_dir=store.directory)
+    history.refresh()
+    assert history.count() == 9
+
+    journal.append(transfer('2026-08-31T23:59:58', amount=5.0))
+    journal.sync()
+    history.refresh()
+
+    assert history.count() == 10
+    assert history.totals()[0] == 3 * (7 + 8 + 9) + 5.0
+    assert len(read_history(journal.path, store.directory)) == 10
+
+    # The next compaction folds it into the August segment without duplicating anything
+    assert journal.compact(store, '2026-10') == 4
+    history.refresh()
+    assert history.count() == 10
+    assert store.load_index()['segments']['2026-08']['count'] == 4
+
+
+def test_records_of_an_interrupted_compaction_are_not_counted_twice(journal, store):
+    transfers = monthly_transfers()
+    journal.append_batch(transfers)
+    # The segments were written but the journal was not rewritten yet
+    store.seal(transfers[:6])
+
+    assert len(store.unsealed(journal.read_all())) == 3
+    history = HistoryAggregates(journal, segment_dir=store.directory)
+    history.refresh()
+    assert history.count() == 9
+
+
+def test_pages_cross_sealed_months_newest_first(journal, store):
+    journal.append_batch(monthly_transfers())
+    journal.compact(store, '2026-09')
+    journal.append(transfer('2026-08-15T00:00:00', amount=5.0))
+    journal.sync()
+    history = HistoryAggregates(journal, segment_dir=store.directory)
+    history.refresh()
+
+    timestamps = []
+    cursor = None
+    while True:
+        page, cursor = history.page(cursor=cursor, limit=4)
+        timestamps.extend(t['timestamp'] for t in page)
+        if cursor is None:
+            break
+
+    assert len(timestamps) == 10
+    assert timestamps == sorted(timestamps, reverse=True)
+    assert '2026-08-15T00:00:00' in timestamps
+
+
+def test_page_filters_sealed_months_by_account_and_range(journal, store):
+    journal.append_batch(monthly_transfers() + [transfer('2026-07-10T00:00:00', account='sub_2')])
+    journal.compact(store, '2026-09')
+    history = HistoryAggregates(journal, segment_dir=store.directory)
+    history.refresh()
+
+    page, cursor = history.page(account='sub_2')
+    assert [t['timestamp'] for t in page] == ['2026-07-10T00:00:00']
+    assert cursor is None
+
+    page, _ = history.page(start='2026-08-02', end='2026-08-03')
+    assert [t['timestamp'] for t in page] == ['2026-08-03T12:00:00', '2026-08-02T12:00:00']
@@ -0,0 +1,106 @@
+"""RequestGateway retries with exponential backoff and never raises to its caller"""
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+from pybit.exceptions import FailedRequestError, InvalidRequestError
+
+import request_gateway
+from request_gateway import RequestGateway, TokenBucket
+
+OK = {'retCode': 0, 'retMsg': 'OK', 'result': {'list': []}}
+
+
+class Responses:
+    """Callable standing in for a pybit method: returns or raises the given outcomes in order"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def fake_time(monkeypatch, **functions):
+    """Replace the gateway's time module only, so threads elsewhere keep the real one"""
+    monkeypatch.setattr(request_gateway, 'time', SimpleNamespace(
+        **{'monotonic': time.monotonic, 'perf_counter': time.perf_counter, 'sleep': time.sleep, **functions}))
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    fake_time(monkeypatch, sleep=sleeps.append)
+    monkeypatch.setattr(request_gateway, 'random', SimpleNamespace(uniform=lambda low, high: high))
+    return sleeps
+
+
+def make_gateway(**options):
+    options.setdefault('ip_limit', 1000)
+    return RequestGateway(endpoint_limits={'wallet': 1000, 'transfer': 1000}, **options)
+
+
+def test_success_is_returned_on_the_first_attempt(sleeps):
+    func = Responses(OK)
+    result = make_gateway().call('wallet', 'key', func, accountType='UNIFIED')
+    assert result.ok and result.attempts == 1
+    assert result.result == {'list': []}
+    assert func.calls == [{'accountType': 'UNIFIED'}]
+    assert sleeps == []
+
+
+def test_rate_limits_and_server_errors_are_retried_with_exponential_backoff(sleeps):
+    func = Responses({'retCode': 10006, 'retMsg': 'Too many visits!'},
+                     FailedRequestError('req', 'Service unavailable', 503, 0, None),
+                     requests.exceptions.ConnectionError('reset'),
+                     OK)
+    result = make_gateway(base_delay=0.5, max_delay=10).call('wallet', 'key', func)
+    assert result.ok and result.attempts == 4
+    assert sleeps == [0.5, 1.0, 2.0]
+
+
+def test_backoff_is_capped_and_retries_run_out(sleeps):
+    func = Responses(*[{'retCode': 10006, 'retMsg': 'Too many visits!'}] * 4)
+    result = make_gateway(max_retries=3, base_delay=1, max_delay=3).call('wallet', 'key', func)
+    assert not result.ok
+    assert (result.code, result.error, result.attempts) == (10006, 'Too many visits!', 4)
+    assert sleeps == [1, 2, 3]
+
+
+def test_other_errors_fail_without_a_retry(sleeps):
+    gateway = make_gateway()
+    result = gateway.call('transfer', 'key', Responses({'retCode': 131212, 'retMsg': 'Insufficient balance'}))
+    assert (result.ok, result.code, result.attempts) == (False, 131212, 1)
+
+    result = gateway.call('transfer', 'key', Responses(InvalidRequestError('req', 'Invalid sign', 10004, 0, None)))
+    assert (result.ok, result.code, result.attempts) == (False, 10004, 1)
+
+    result = gateway.call('transfer', 'key', Responses(ValueError('unexpected')))
+    assert (result.ok, result.error, result.attempts) == (False, 'unexpected', 1)
+    assert sleeps == []
+
+
+def test_unknown_endpoint_class_is_rejected():
+    with pytest.raises(ValueError):
+        make_gateway().call('unknown', 'key', Responses(OK))
+
+
+def test_token_bucket_waits_once_its_burst_is_spent(monkeypatch):
+    now = [100.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    fake_time(monkeypatch, monotonic=lambda: now[0], sleep=sleep)
+    bucket = TokenBucket(rate=2, capacity=2)
+    for _ in range(3):
+        bucket.acquire()
+    assert sleeps == [pytest.approx(0.5)]
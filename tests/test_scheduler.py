@@ -0,0 +1,129 @@
+"""AccountScheduler boundaries, stagger and coalescing, and the CheckLock between checks and config edits"""
+import threading
+import time
+
+from scheduler import AccountScheduler, CheckLock
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler(intervals, now=1000.0, stagger=True):
+    clock = Clock(now)
+    scheduler = AccountScheduler(lambda uids: None, stagger=stagger, clock=clock)
+    scheduler.set_accounts(intervals)
+    return scheduler, clock
+
+
+def test_boundaries_are_fixed_multiples_of_the_interval():
+    scheduler, _ = make_scheduler({'sub_1': 60})
+    assert scheduler.next_boundary('sub_1', 1000.0) == 1020.0
+    assert scheduler.next_boundary('sub_1', 1020.0) == 1080.0
+    assert scheduler.next_boundary('sub_1', 1079.9) == 1080.0
+
+
+def test_stagger_spreads_accounts_sharing_an_interval():
+    scheduler, _ = make_scheduler({'sub_1': 60, 'sub_2': 60, 'sub_3': 60, 'sub_4': 60, 'hourly': 3600})
+    assert sorted(scheduler.offsets[uid] for uid in ('sub_1', 'sub_2', 'sub_3', 'sub_4')) == [0, 15, 30, 45]
+    assert scheduler.offsets['hourly'] == 0
+    assert scheduler.slot_seconds('sub_1') == 15
+    assert scheduler.slot_seconds('hourly') == 3600
+    assert scheduler.slot_seconds('unknown') is None
+
+
+def test_without_stagger_accounts_are_due_together():
+    scheduler, clock = make_scheduler({'sub_1': 60, 'sub_2': 60}, stagger=False)
+    assert scheduler.slot_seconds('sub_1') == 60
+    clock.now = 1020.0
+    batch, wait = scheduler._pop_due()
+    assert sorted(batch) == ['sub_1', 'sub_2'] and wait == 0
+
+
+def test_due_accounts_run_in_boundary_order():
+    scheduler, clock = make_scheduler({'sub_1': 60, 'sub_2': 60})
+    due = {uid: scheduler._queue[i][1] for i, (_, _, uid) in enumerate(scheduler._queue)}
+    first = min(due, key=due.get)
+
+    clock.now = min(due.values())
+    assert scheduler._pop_due() == ([first], 0)
+    batch, wait = scheduler._pop_due()
+    assert batch == [] and wait == max(due.values()) - clock.now
+
+
+def test_missed_ticks_are_coalesced_into_one_run():
+    scheduler, clock = make_scheduler({'sub_1': 60}, stagger=False)
+    clock.now = 1020.0 + 5 * 60 + 1
+    batch, _ = scheduler._pop_due()
+    assert batch == ['sub_1']
+    # The next run is the first boundary after now, not one of the missed ones
+    assert scheduler._queue[0][1] == 1380.0
+    assert scheduler._pop_due()[0] == []
+
+
+def test_run_hands_due_accounts_to_run_batch():
+    clock = Clock(1000.0)
+    batches = []
+    scheduler = AccountScheduler(lambda uids: batches.append(list(uids)) or scheduler.stop(),
+                                 stagger=False, clock=clock)
+    scheduler.set_accounts({'sub_1': 60})
+    clock.now = 1020.0
+    scheduler.run()
+    assert batches == [['sub_1']]
+
+
+def test_check_lock_lets_checks_overlap():
+    lock = CheckLock()
+    inside = threading.Barrier(2, timeout=2)
+
+    def check():
+        with lock.shared():
+            inside.wait()
+
+    threads = [threading.Thread(target=check) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(2)
+    assert not inside.broken
+
+
+def test_exclusive_section_waits_for_running_checks_and_holds_back_new_ones():
+    lock = CheckLock()
+    events = []
+    check_started = threading.Event()
+    release_check = threading.Event()
+
+    def running_check():
+        with lock.shared():
+            check_started.set()
+            release_check.wait(2)
+            events.append('check done')
+
+    def config_edit():
+        with lock.exclusive():
+            events.append('edit')
+
+    def later_check():
+        with lock.shared():
+            events.append('later check')
+
+    first = threading.Thread(target=running_check)
+    first.start()
+    check_started.wait(2)
+    edit = threading.Thread(target=config_edit)
+    edit.start()
+    time.sleep(0.05)
+    later = threading.Thread(target=later_check)
+    later.start()
+    time.sleep(0.05)
+    assert events == []
+
+    release_check.set()
+    for thread in (first, edit, later):
+        thread.join(2)
+    assert events == ['check done', 'edit', 'later check']
@@ -0,0 +1,97 @@
+"""ShardCoordinator leases: claiming, handing over on join and leave, and taking over expired leases"""
+from types import SimpleNamespace
+
+import pytest
+
+import sharding
+from sharding import ShardCoordinator
+
+ACCOUNTS = [f"sub_{i}" for i in range(20)]
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Only the coordinator's clock is replaced, threads elsewhere keep the real one
+    monkeypatch.setattr(sharding, 'time', SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def make_worker(tmp_path):
+    path = str(tmp_path / 'shards.db')
+    workers = []
+
+    def make(worker_id, accounts=ACCOUNTS):
+        changes = []
+        worker = ShardCoordinator(path, worker_id, accounts, lambda acquired, released: changes.append(
+            (set(acquired), set(released))), heartbeat_seconds=10, lease_seconds=30)
+        worker.changes = changes
+        workers.append(worker)
+        return worker
+
+    yield make
+    for worker in workers:
+        worker._conn.close()
+
+
+def test_single_worker_claims_every_account(clock, make_worker):
+    worker = make_worker('w1')
+    assert worker.sync() == set(ACCOUNTS)
+    assert worker.changes == [(set(ACCOUNTS), set())]
+    assert worker.owns('sub_0')
+
+
+def test_joining_worker_gets_its_share_once_it_is_released(clock, make_worker):
+    first, second = make_worker('w1'), make_worker('w2')
+    first.sync()
+    # The second worker is assigned accounts whose leases the first one still holds
+    assert second.sync() == set()
+
+    handed_over = set(ACCOUNTS) - first.sync()
+    assert handed_over and first.changes[-1] == (set(), handed_over)
+    assert second.sync() == handed_over
+    assert first.owned.isdisjoint(second.owned)
+    assert first.owned | second.owned == set(ACCOUNTS)
+
+
+def test_leases_of_a_dead_worker_are_taken_over_after_expiry(clock, make_worker):
+    first, second = make_worker('w1'), make_worker('w2')
+    first.sync()
+    second.sync()
+    first.sync()
+    second.sync()
+    first_share = set(first.owned)
+
+    # w1 stops renewing; until its leases and heartbeat expire, w2 cannot take its accounts
+    clock.now += 20
+    assert second.sync() == set(ACCOUNTS) - first_share
+
+    clock.now += 20
+    assert second.sync() == set(ACCOUNTS)
+    assert not any(first.owns(uid) for uid in ACCOUNTS)
+
+
+def test_stop_releases_leases_immediately(clock, make_worker):
+    first, second = make_worker('w1'), make_worker('w2')
+    first.sync()
+    second.sync()
+    first.sync()
+    first.stop()
+    assert second.sync() == set(ACCOUNTS)
+
+
+def test_removed_accounts_are_released(clock, make_worker):
+    worker = make_worker('w1')
+    worker.sync()
+    worker.set_accounts(ACCOUNTS[:5])
+    assert worker.sync() == set(ACCOUNTS[:5])
+    assert worker.changes[-1] == (set(), set(ACCOUNTS[5:]))
@@ -0,0 +1,43 @@
+"""Records logged through the queue keep their traceback apart from the message"""
+import json
+import logging
+
+from structured_log import JsonFormatter, TextFormatter, start_queue_logging
+
+
+class Collect(logging.Handler):
+    def __init__(self, formatter):
+        super().__init__()
+        self.setFormatter(formatter)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def log_exception(handler, name):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    listener = start_queue_logging(logger, [handler])
+    try:
+        try:
+            raise RuntimeError('boom')
+        except RuntimeError:
+            logger.exception('Error processing account %s', 'sub_1', extra={'event': 'error'})
+    finally:
+        listener.stop()
+    return handler.lines
+
+
+def test_json_events_carry_the_traceback_in_its_own_field():
+    [line] = log_exception(Collect(JsonFormatter()), 'test_structured_log.json')
+    event = json.loads(line)
+    assert event['message'] == 'Error processing account sub_1'
+    assert event['event'] == 'error'
+    assert 'Traceback' in event['exception'] and 'RuntimeError: boom' in event['exception']
+
+
+def test_text_lines_still_show_the_traceback():
+    [line] = log_exception(Collect(TextFormatter()), 'test_structured_log.text')
+    assert 'Error processing account sub_1' in line.splitlines()[0]
+    assert 'RuntimeError: boom' in line
@@ -0,0 +1,234 @@
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, appenders still follow a replaced journal
+    fcntl = None
+
+HISTORY_FILE = 'transfer_history.jsonl'
+LEGACY_HISTORY_FILE = 'transfer_history.json'
+# In sharded mode every worker appends to its own journal next to the main one
+SHARD_HISTORY_PATTERN = 'transfer_history.*.jsonl'
+
+# Flush to disk after this many appends or this many seconds, whichever comes first
+FSYNC_EVERY = 10
+FSYNC_INTERVAL = 5.0
+
+logger = logging.getLogger('BybitMover')
+
+
+def transfer_value(transfer):
+    """Return the USDT value of a transfer record; records of other coins carry it in usdt_value"""
+    return float(transfer.get('usdt_value', transfer['amount']))
+
+
+def month_key(timestamp):
+    """Return the YYYY-MM month of an ISO timestamp"""
+    return timestamp[:7]
+
+
+def shard_history_file(worker_id):
+    """Return the journal path for a sharded worker"""
+    return 'transfer_history.{}.jsonl'.format(re.sub(r'[^A-Za-z0-9_-]', '_', worker_id))
+
+
+def shard_history_files():
+    """Return the journal paths of all sharded workers, in a stable order"""
+    return sorted(glob.glob(SHARD_HISTORY_PATTERN))
+
+
+class TransferJournal:
+    """Append-only transfer history stored as one JSON object per line.
+
+    Writers only ever append a single line per transfer, so the cost of recording a
+    transfer does not grow with the size of the history and a crash can at most leave
+    one incomplete trailing line, which readers skip. fsync is batched: the file is
+    synced every FSYNC_EVERY appends or FSYNC_INTERVAL seconds, and on close().
+
+    Appends and compact() also hold an flock on a '.lock' file next to the journal, so
+    writers in different processes never interleave with a compaction. An appender whose
+    open file was replaced by a compaction in another process reopens the journal first.
+    """
+
+    def __init__(self, path=HISTORY_FILE, legacy_path=LEGACY_HISTORY_FILE,
+                 fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.migrate()
+
+    def migrate(self):
+        """Convert the legacy transfer_history.json array into the journal, once"""
+        if not self.legacy_path or os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+            return
+
+        tmp_path = self.path + '.migrating'
+        try:
+            fd = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # Another process is migrating right now, wait for it to finish
+            self._wait_for_migration(tmp_path)
+            return
+
+        try:
+            with open(self.legacy_path, 'r') as f:
+                transfers = json.load(f)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for transfer in transfers:
+                    f.write(json.dumps(transfer) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            os.replace(self.legacy_path, self.legacy_path + '.migrated')
+            logger.info(f"Migrated {len(transfers)} transfers from {self.legacy_path} to {self.path}")
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _wait_for_migration(self, tmp_path, timeout=30):
+        deadline = time.monotonic() + timeout
+        while os.path.exists(tmp_path) and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+    def append(self, transfer):
+        """Append one transfer record to the journal"""
+        line = json.dumps(transfer) + '\n'
+        with self._lock, self._file_lock():
+            self._reopen_if_replaced_locked()
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync_locked()
+
+    def append_batch(self, transfers):
+        """Append several transfer records and sync them to disk with a single fsync"""
+        data = ''.join(json.dumps(transfer) + '\n' for transfer in transfers)
+        with self._lock, self._file_lock():
+            self._reopen_if_replaced_locked()
+            self._file.write(data)
+            self._file.flush()
+            self._unsynced += len(transfers)
+            self._sync_locked()
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold the cross-process lock of the journal"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _reopen_if_replaced_locked(self):
+        """Open the journal, or reopen it if another process replaced the file since it was opened"""
+        if self._file is not None:
+            try:
+                replaced = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+            except FileNotFoundError:
+                replaced = True
+            if not replaced:
+                return
+            # Everything written to the old file was carried over by the compaction
+            self._file.close()
+            self._file = None
+            self._unsynced = 0
+        self._open_locked()
+
+    def _open_locked(self):
+        self._file = open(self.path, 'a', encoding='utf-8')
+        # Terminate a record torn by a crash so the next one starts on its own line
+        if self._file.tell() > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write('\n')
+
+    def sync(self):
+        """Force all appended records to disk"""
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        """Sync and close the journal file"""
+        with self._lock:
+            self._sync_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def compact(self, store, before_month):
+        """Seal records of months before before_month (YYYY-MM) into store and drop them from the journal.
+
+        The remaining records are written to a new file that atomically replaces the
+        journal, so readers see a new file and rebuild. Returns the number of records sealed.
+        """
+        with self._lock, self._file_lock():
+            self._sync_locked()
+            transfers = self.read_all()
+            sealed = [transfer for transfer in transfers if month_key(transfer['timestamp']) < before_month]
+            if not sealed:
+                return 0
+            store.seal(sealed)
+
+            tmp_path = self.path + '.compacting'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for transfer in transfers:
+                    if month_key(transfer['timestamp']) >= before_month:
+                        f.write(json.dumps(transfer) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            os.replace(tmp_path, self.path)
+            return len(sealed)
+
+    def read_all(self):
+        """Return every transfer in the journal"""
+        transfers, _ = self.read_from(0)
+        return transfers
+
+    def read_from(self, offset):
+        """Return (transfers, new_offset) for all complete records after a byte offset"""
+        transfers = []
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                for raw_line in f:
+                    if not raw_line.endswith(b'\n'):
+                        break  # Incomplete trailing record, still being written
+                    offset += len(raw_line)
+                    if not raw_line.strip():
+                        continue
+                    try:
+                        transfers.append(json.loads(raw_line))
+                    except ValueError:
+                        logger.warning(f"Skipping corrupt record in {self.path} at byte {offset - len(raw_line)}")
+        except FileNotFoundError:
+            pass
+        return transfers, offset
@@ -1,19 +1,39 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, make_response, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
+from jinja2.utils import htmlsafe_json_dumps
+from markupsafe import Markup
 import json
-from datetime import datetime
+import atexit
+import gzip
+import hashlib
+from datetime import date, datetime
 import os
 from dotenv import load_dotenv
 import logging
 from logging.handlers import RotatingFileHandler
 from werkzeug.security import generate_password_hash, check_password_hash
+from transfer_journal import TransferJournal, shard_history_files
+from history_aggregates import HistoryAggregates
+from history_segments import SEGMENT_DIR
+from history_writer import IngestClient, DEFAULT_INGEST_PORT
+from history_events import HistoryBroadcaster
+from growth_stats import DEFAULT_EWMA_SPAN_DAYS, DEFAULT_PROJECTION_DAYS, DEFAULT_WINDOWS
+from chart_series import DEFAULT_BUCKET, DEFAULT_MAX_POINTS
 
 # Load environment variables
 load_dotenv()
 
+# Production unless FLASK_ENV=development, which enables debug mode and template reloading
+PRODUCTION = os.getenv('FLASK_ENV', 'production') != 'development'
+# Static assets are cached by browsers for a year in production
+STATIC_MAX_AGE = 365 * 24 * 3600
+# Responses smaller than this are not worth compressing
+GZIP_MIN_SIZE = 500
+GZIP_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript'}
+
 app = Flask(__name__)
-app.config['TEMPLATES_AUTO_RELOAD'] = True  # Force template reloading
-app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0  # Disable caching
+app.config['TEMPLATES_AUTO_RELOAD'] = not PRODUCTION
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = STATIC_MAX_AGE if PRODUCTION else 0
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', os.urandom(24))  # Generate a random secret key
 
 # Initialize Flask-Login
@@ -154,97 +174,219 @@ def load_config():
         logger.error("config.json not found")
         return {"web_port": 5001}
 
-def load_transfer_history():
-    """Load transfer history from file if it exists"""
-    try:
-        with open('transfer_history.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        logger.warning("transfer_history.json not found, starting with empty history")
-        return []
+def load_chart_settings():
+    """Load chart bucketing and downsampling settings from config.json"""
+    chart = load_config().get('chart', {})
+    return chart.get('bucket', DEFAULT_BUCKET), chart.get('max_points', DEFAULT_MAX_POINTS)
 
-def calculate_totals(transfers):
-    """Calculate totals for main account and sub-accounts"""
-    main_account_total = 0
-    sub_account_totals = {}
-    
-    for transfer in transfers:
-        amount = float(transfer['amount'])
-        from_account = transfer['from_account']
-        
-        # Add to main account total
-        main_account_total += amount
-        
-        # Add to sub-account totals
-        if from_account not in sub_account_totals:
-            sub_account_totals[from_account] = 0
-        sub_account_totals[from_account] += amount
-    
-    return main_account_total, sub_account_totals
+CHART_BUCKET, CHART_MAX_POINTS = load_chart_settings()
 
-def calculate_growth_prediction(transfers, days_to_predict=30):
-    """Calculate predicted growth based on average daily transfers"""
-    if not transfers:
-        return 0, 0
-    
-    # Group transfers by date
-    daily_totals = {}
-    for transfer in transfers:
-        date = transfer['timestamp'].split('T')[0]
-        amount = float(transfer['amount'])
-        daily_totals[date] = daily_totals.get(date, 0) + amount
-    
-    # Calculate average daily transfer
-    avg_daily_transfer = sum(daily_totals.values()) / len(daily_totals)
-    predicted_growth = avg_daily_transfer * days_to_predict
+def load_growth_settings():
+    """Load the growth statistics settings from config.json"""
+    growth = load_config().get('growth', {})
+    return {
+        'windows': growth.get('windows', DEFAULT_WINDOWS),
+        'ewma_span_days': growth.get('ewma_span_days', DEFAULT_EWMA_SPAN_DAYS),
+        'projection_days': growth.get('projection_days', DEFAULT_PROJECTION_DAYS)
+    }
+
+def load_segment_dir():
+    """Return the directory of the monthly transfer history segments from config.json"""
+    return load_config().get('history', {}).get('segment_dir', SEGMENT_DIR)
+
+HISTORY_SEGMENT_DIR = load_segment_dir()
+
+# Transfer history journal shared with bybit_mover.py, merged with the journals of sharded workers
+journal = TransferJournal()
+atexit.register(journal.close)
+history_cache = HistoryAggregates(journal, discover_journals=shard_history_files,
+                                  growth_options=load_growth_settings(), segment_dir=HISTORY_SEGMENT_DIR)
+
+def load_ingest_client():
+    """Return a client for the mover's ingest server unless it is disabled in config.json"""
+    settings = load_config().get('ingest', {})
+    if not settings.get('enabled', True):
+        return None
+    return IngestClient(settings.get('host', '127.0.0.1'), settings.get('port', DEFAULT_INGEST_PORT))
+
+# New transfers are written by the mover, the single writer of the journal
+ingest_client = load_ingest_client()
+
+# Part of every ETag, so pages rendered by a previous run (or older templates) are never reused
+BOOT_ID = os.urandom(8).hex()
+# Rendered fragments keyed by name: ((history version, date), markup)
+fragment_cache = {}
+
+
+def history_etag(*parts):
+    """Return an ETag for the current history version and the request details in parts"""
+    # Growth statistics roll over at midnight even without new transfers
+    key = '|'.join(str(part) for part in (BOOT_ID, history_cache.version, date.today()) + parts)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+def revalidate(etag, build):
+    """Answer 304 Not Modified if the client already has this ETag, otherwise build the response"""
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = make_response(build())
+    # Weak, because the body may be sent gzip-compressed or not
+    response.set_etag(etag, weak=True)
+    # Browsers may keep the response but must revalidate it before every use
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def cached_fragment(name, build):
+    """Return the markup produced by build(), rendered at most once per history version and day"""
+    version = (history_cache.version, date.today())
+    cached = fragment_cache.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    markup = Markup(build())
+    fragment_cache[name] = (version, markup)
+    return markup
+
+def render_summary():
+    """Render the totals and predictions section of the dashboard"""
+    main_account_total, sub_account_totals = history_cache.totals()
+    return render_template('_summary.html',
+                         main_account_total=main_account_total,
+                         sub_account_totals=sub_account_totals,
+                         num_transfers=history_cache.count(),
+                         growth=history_cache.growth_stats())
+
+def render_index():
+    """Render the dashboard page from cached fragments"""
+    summary_html = cached_fragment('summary', render_summary)
+    chart_json = cached_fragment('chart', lambda: htmlsafe_json_dumps(
+        history_cache.chart_data(CHART_BUCKET, CHART_MAX_POINTS)))
+    _, sub_account_totals = history_cache.totals()
     
-    return avg_daily_transfer, predicted_growth
+    return render_template('index.html',
+                         summary_html=summary_html,
+                         sub_account_totals=sub_account_totals,
+                         chart_json=chart_json,
+                         chart_bucket=CHART_BUCKET,
+                         chart_max_points=CHART_MAX_POINTS,
+                         last_transfer=history_cache.latest_timestamp(),
+                         stream_position=history_cache.position())
 
 @app.route('/')
 @login_required
 def index():
     """Display the transfer history with totals and predictions"""
-    transfers = load_transfer_history()
-    
-    # Calculate totals and predictions
-    main_account_total, sub_account_totals = calculate_totals(transfers)
-    avg_daily, predicted_30d = calculate_growth_prediction(transfers)
-    
-    # Prepare data for charts
-    chart_data = prepare_chart_data(transfers)
-    
-    return render_template('index.html', 
-                         transfers=transfers,
-                         main_account_total=main_account_total,
-                         sub_account_totals=sub_account_totals,
-                         num_transfers=len(transfers),
-                         avg_daily_transfer=avg_daily,
-                         predicted_30d_growth=predicted_30d,
-                         chart_data=chart_data)
-
-def prepare_chart_data(transfers):
-    """Prepare data for the growth charts"""
-    # Sort transfers by date
-    sorted_transfers = sorted(transfers, key=lambda x: x['timestamp'])
+    # Only transfers added since the previous request are read from disk
+    history_cache.refresh()
+    return revalidate(history_etag('index'), render_index)
+
+TRANSFERS_PAGE_SIZE = 50
+TRANSFERS_MAX_PAGE_SIZE = 500
+
+@app.route('/api/transfers')
+@login_required
+def api_transfers():
+    """Return one page of transfer history, newest first.
+
+    Query parameters: cursor (from the previous page's next_cursor), limit, account,
+    start and end (ISO dates), min_amount.
+    """
+    try:
+        limit = min(int(request.args.get('limit', TRANSFERS_PAGE_SIZE)), TRANSFERS_MAX_PAGE_SIZE)
+        min_amount = request.args.get('min_amount')
+        min_amount = float(min_amount) if min_amount else None
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        
+        history_cache.refresh()
+        transfers, next_cursor = history_cache.page(
+            cursor=request.args.get('cursor') or None,
+            limit=limit,
+            account=request.args.get('account') or None,
+            start=request.args.get('start') or None,
+            end=request.args.get('end') or None,
+            min_amount=min_amount
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Accumulate balances over time
-    dates = []
-    main_balance = []
-    running_total = 0
+    return revalidate(history_etag('transfers', request.query_string),
+                      lambda: jsonify({'transfers': transfers, 'next_cursor': next_cursor}))
+
+@app.route('/api/chart')
+@login_required
+def api_chart():
+    """Return the growth chart series; accepts bucket (hour/day) and max_points"""
+    try:
+        bucket = request.args.get('bucket', CHART_BUCKET)
+        max_points = int(request.args.get('max_points', CHART_MAX_POINTS))
+        history_cache.refresh()
+        chart = history_cache.chart_data(bucket, max_points)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    for transfer in sorted_transfers:
-        date = transfer['timestamp'].split('T')[0]
-        amount = float(transfer['amount'])
-        running_total += amount
-        
-        dates.append(date)
-        main_balance.append(running_total)
+    return revalidate(history_etag('chart', bucket, max_points), lambda: jsonify(chart))
+
+@app.route('/api/growth')
+@login_required
+def api_growth():
+    """Return rolling means, EWMA and 30-day projection bands, overall and per sub-account.
+
+    With an account query parameter only that sub-account's statistics are returned.
+    """
+    history_cache.refresh()
+    # Reused until the history changes, so a 304 costs no more than this lookup
+    stats = history_cache.growth_stats()
+    account = request.args.get('account') or None
+    if account is not None:
+        if account not in stats['accounts']:
+            return jsonify({'error': f"Unknown account: {account}"}), 404
+        stats = {'as_of': stats['as_of'], 'account': account, **stats['accounts'][account]}
     
+    return revalidate(history_etag('growth', account), lambda: jsonify(stats))
+
+def build_live_update(transfers, start):
+    """Build the live update sent to dashboards for newly added transfers"""
+    with app.app_context():
+        summary_html = cached_fragment('summary', render_summary)
     return {
-        'dates': dates,
-        'main_balance': main_balance
+        'start': start,
+        'transfers': transfers,
+        'summary_html': str(summary_html),
+        'last_transfer': history_cache.latest_timestamp()
     }
 
+# Pushes new transfers to open dashboards as Server-Sent Events
+history_events = HistoryBroadcaster(history_cache, build_live_update)
+
+@app.route('/api/stream')
+@login_required
+def api_stream():
+    """Stream history updates as Server-Sent Events, starting after the position in since"""
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    response = Response(stream_with_context(history_events.stream(since)), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    # Tell nginx not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Gzip text responses for clients that accept it"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in GZIP_MIMETYPES
+            or not request.accept_encodings['gzip']):
+        return response
+    
+    data = response.get_data()
+    if len(data) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
 def add_transfer(from_account, to_account, amount, timestamp=None):
     """Add a new transfer to the history"""
     if timestamp is None:
@@ -257,13 +399,18 @@ def add_transfer(from_account, to_account, amount, timestamp=None):
         'timestamp': timestamp
     }
     
-    # Load existing transfers
-    transfers = load_transfer_history()
-    transfers.append(transfer)
-    
-    # Save updated transfers
-    with open('transfer_history.json', 'w') as f:
-        json.dump(transfers, f)
+    if ingest_client is not None:
+        try:
+            ingest_client.append(transfer)
+        except ConnectionRefusedError as e:
+            # No mover is running; the journal lock still keeps this append apart from any compaction
+            logger.warning(f"Mover ingest server unreachable ({e}), appending to the journal directly")
+            ingest_client.close()
+            journal.append(transfer)
+            journal.sync()
+    else:
+        journal.append(transfer)
+    history_events.notify()
     
     logger.info(f"Added transfer: {amount} USDT from {from_account} to {to_account}")
 
@@ -279,4 +426,4 @@ if __name__ == '__main__':
     print(f"Password: {DEFAULT_PASSWORD}")
     print("Press Ctrl+C to stop")
     
-    app.run(host='0.0.0.0', port=port, debug=True) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=not PRODUCTION, threaded=True) 
\ No newline at end of file